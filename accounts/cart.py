@@ -0,0 +1,130 @@
+"""
+Database-backed carts for logged-in users.
+
+PersistentCart has the same interface as the session ``store.cart.Cart``
+but keeps its items in CartItem rows. That way a cart survives logins and
+devices, and the session no longer carries a growing dict that is
+re-serialised on every request. Items are read with one query, the first
+time the cart is used in a request. On login, the anonymous session cart is
+merged into the user's cart with a single bulk upsert.
+
+Quantities are added up while the user's Cart row is locked, so a merge and
+an add from another tab or device can't both read the old quantity and
+overwrite each other's sum.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Cart, CartItem
+
+
+def upsert_items(cart, quantities, prices):
+    """
+    Write ``{product_id: quantity}`` into ``cart`` with one INSERT ... ON CONFLICT.
+
+    ``prices`` are only used for new rows; items already in the cart keep
+    the price they were added at.
+    """
+    items = [
+        CartItem(cart=cart, product_id=product_id, quantity=quantity, price=prices[product_id])
+        for product_id, quantity in quantities.items()
+    ]
+    CartItem.objects.bulk_create(
+        items, update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'],
+    )
+    Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+
+
+def lock_cart(user):
+    """``user``'s Cart, locked until the end of the surrounding transaction"""
+    cart, _ = Cart.objects.get_or_create(user=user)
+    return Cart.objects.select_for_update().get(pk=cart.pk)
+
+
+def merge_session_cart(session, user):
+    """Move the anonymous session cart into ``user``'s cart, adding up quantities"""
+    from store.models import Product
+
+    session_items = session.get(settings.CART_SESSION_ID)
+    if not session_items:
+        return 0
+
+    product_ids = set(
+        Product.objects.filter(id__in=[int(product_id) for product_id in session_items])
+        .order_by().values_list('id', flat=True)
+    )
+    with transaction.atomic():
+        cart = lock_cart(user)
+        existing = dict(
+            CartItem.objects.filter(cart=cart, product_id__in=product_ids).values_list('product_id', 'quantity')
+        )
+
+        quantities, prices = {}, {}
+        for key, item in session_items.items():
+            product_id = int(key)
+            if product_id not in product_ids:
+                continue  # deleted since it was added
+            quantities[product_id] = existing.get(product_id, 0) + item['quantity']
+            prices[product_id] = Decimal(item['price'])
+        if quantities:
+            upsert_items(cart, quantities, prices)
+
+    del session[settings.CART_SESSION_ID]
+    return len(quantities)
+
+
+class PersistentCart:
+    def __init__(self, user):
+        self.user = user
+        self._cart = None
+        self._items = None
+
+    def get_cart(self):
+        if self._cart is None:
+            self._cart, _ = Cart.objects.get_or_create(user=self.user)
+        return self._cart
+
+    @property
+    def items(self):
+        """CartItems with their products, loaded on first use"""
+        if self._items is None:
+            self._items = list(
+                CartItem.objects.filter(cart__user=self.user).select_related('product').order_by('added_at')
+            )
+        return self._items
+
+    def add(self, product, quantity=1, override_quantity=False):
+        with transaction.atomic():
+            self._cart = lock_cart(self.user)
+            if not override_quantity:
+                # Read under the lock, not from self.items, which may be stale
+                quantity += CartItem.objects.filter(cart=self._cart, product=product).values_list(
+                    'quantity', flat=True).first() or 0
+            upsert_items(self._cart, {product.id: quantity}, {product.id: product.price})
+        self._items = None
+
+    def remove(self, product):
+        CartItem.objects.filter(cart__user=self.user, product=product).delete()
+        self._items = None
+
+    def __iter__(self):
+        for item in self.items:
+            yield {
+                'product': item.product,
+                'quantity': item.quantity,
+                'price': item.price,
+                'total_price': item.price * item.quantity,
+            }
+
+    def __len__(self):
+        return sum(item.quantity for item in self.items)
+
+    def get_total_price(self):
+        return sum((item.price * item.quantity for item in self.items), Decimal('0'))
+
+    def clear(self):
+        CartItem.objects.filter(cart__user=self.user).delete()
+        self._items = []
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Delete persistent carts that have not been touched for a while, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=60, help='Delete carts idle for longer than this')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Carts deleted per transaction')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        abandoned = Cart.objects.filter(updated_at__lt=cutoff).order_by('updated_at')
+
+        total = 0
+        while True:
+            # Short batches keep each DELETE (and its lock) small on a busy database
+            ids = list(abandoned.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            Cart.objects.filter(id__in=ids).delete()
+            total += len(ids)
+            self.stdout.write(f'Deleted {total} carts')
+
+        self.stdout.write(self.style.SUCCESS(f'Removed {total} carts idle since before {cutoff:%Y-%m-%d}'))
@@ -1,3 +1,40 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+class Cart(models.Model):
+    """Persistent cart of a logged-in user; anonymous carts stay in the session"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Abandoned cart cleanup, see `manage.py cleanup_carts`
+            models.Index(fields=['updated_at']),
+        ]
+
+    def __str__(self):
+        return f"Cart of {self.user}"
+
+
+class CartItem(models.Model):
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey('store.Product', on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField(default=1)
+    # Price when the product was added, like the session cart
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Conflict target of the bulk upsert that merges a session cart on login
+            models.UniqueConstraint(fields=['cart', 'product'], name='accounts_cartitem_unique_product'),
+        ]
+        indexes = [
+            # A cart's items in the order they were added, without a sort
+            models.Index(fields=['cart', 'added_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id}"
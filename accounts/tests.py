@@ -1,3 +1,74 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
 from django.test import TestCase
 
-# Create your tests here.
+from store.models import Category, Product
+
+from .cart import PersistentCart, merge_session_cart
+from .models import CartItem
+
+
+class PersistentCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper', password='password')
+        category = Category.objects.create(name='Rice', slug='rice')
+        cls.rice, cls.flour, cls.sugar = [
+            Product.objects.create(name=name, slug=name.lower(), category=category, price=Decimal(price))
+            for name, price in [('Rice', '4.99'), ('Flour', '2.50'), ('Sugar', '1.20')]
+        ]
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('product__name', 'quantity'))
+
+    def session_cart(self, session, *items):
+        session[settings.CART_SESSION_ID] = {
+            str(product_id): {'quantity': quantity, 'price': price} for product_id, quantity, price in items
+        }
+
+    def test_merge_adds_up_quantities(self):
+        PersistentCart(self.user).add(self.rice, 2)
+        session = SessionStore()
+        self.session_cart(session, (self.rice.pk, 3, '3.99'), (self.flour.pk, 1, '2.50'), (999999, 1, '1.00'))
+
+        self.assertEqual(merge_session_cart(session, self.user), 2)
+        self.assertEqual(self.quantities(), {'Rice': 5, 'Flour': 1})
+        self.assertNotIn(settings.CART_SESSION_ID, session)
+        # Items already in the cart keep the price they were added at
+        self.assertEqual(CartItem.objects.get(product=self.rice).price, Decimal('4.99'))
+
+    def test_merge_on_login(self):
+        session = self.client.session
+        self.session_cart(session, (self.sugar.pk, 4, '1.20'))
+        session.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.quantities(), {'Sugar': 4})
+        self.assertNotIn(settings.CART_SESSION_ID, self.client.session)
+
+    def test_add_reads_current_quantity(self):
+        cart = PersistentCart(self.user)
+        cart.add(self.rice)
+        list(cart)
+        # Another request adds to the same cart after this one loaded its items
+        PersistentCart(self.user).add(self.rice, 2)
+        cart.add(self.rice)
+        self.assertEqual(self.quantities(), {'Rice': 4})
+
+    def test_items_are_loaded_once_on_first_use(self):
+        cart = PersistentCart(self.user)
+        cart.add(self.rice, 2)
+        cart.add(self.flour)
+
+        with self.assertNumQueries(0):
+            cart = PersistentCart(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(cart), 3)
+            self.assertEqual(cart.get_total_price(), Decimal('12.48'))
+            self.assertEqual([item['product'].name for item in cart], ['Rice', 'Flour'])
+
+        cart.remove(self.rice)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(cart), 1)
@@ -0,0 +1,70 @@
+from django.contrib import admin
+from django.shortcuts import get_object_or_404, render
+from django.urls import path
+
+from store.models import Category
+
+from .dashboard import RANGE_CHOICES, daily_totals, date_range, subtree_totals, top_products
+from .models import CategoryDailyStats, ProductDailyStats
+
+
+class ReadOnlyStatsAdmin(admin.ModelAdmin):
+    """Rows are written by `manage.py rollup_analytics` only"""
+    date_hierarchy = 'day'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ProductDailyStats)
+class ProductDailyStatsAdmin(ReadOnlyStatsAdmin):
+    change_list_template = 'admin/analytics/productdailystats/change_list.html'
+    list_display = ['day', 'product', 'views', 'orders', 'units', 'revenue']
+    list_select_related = ['product']
+    search_fields = ['product__name', 'product__sku']
+
+    def get_urls(self):
+        return [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard), name='analytics_dashboard'),
+        ] + super().get_urls()
+
+    def dashboard(self, request):
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        if days not in RANGE_CHOICES:
+            days = 30
+        start, end = date_range(days)
+
+        parent = None
+        if request.GET.get('category'):
+            parent = get_object_or_404(Category, pk=request.GET['category'])
+        categories, own = subtree_totals(start, end, parent)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Sales and traffic',
+            'opts': self.model._meta,
+            'days': days,
+            'range_choices': RANGE_CHOICES,
+            'start': start,
+            'end': end,
+            'daily': daily_totals(start, end),
+            'top_products': top_products(start, end),
+            'parent': parent,
+            'ancestors': parent.get_ancestors() if parent else [],
+            'categories': categories,
+            'own': own,
+        }
+        return render(request, 'admin/analytics/dashboard.html', context)
+
+
+@admin.register(CategoryDailyStats)
+class CategoryDailyStatsAdmin(ReadOnlyStatsAdmin):
+    list_display = ['day', 'category', 'views', 'units', 'revenue']
+    list_select_related = ['category']
+    search_fields = ['category__name']
@@ -0,0 +1,89 @@
+"""
+Queries behind the admin analytics dashboard.
+
+Everything here reads the daily rollup tables, never orders or views. A
+category's subtree total is the sum of CategoryDailyStats over the
+categories whose ``lft`` falls inside its ``lft``/``rght`` range: one
+grouped query for all the children of the category being looked at,
+bucketed in Python.
+"""
+from bisect import bisect_right
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from store.models import Category
+
+from .models import CategoryDailyStats, ProductDailyStats
+
+
+RANGE_CHOICES = [7, 30, 90, 365]
+TOP_PRODUCTS = 20
+
+
+def date_range(days):
+    end = timezone.localdate()
+    return end - timedelta(days=days - 1), end
+
+
+def daily_totals(start, end):
+    """Views, units and revenue per day, every product included"""
+    return list(
+        CategoryDailyStats.objects.filter(day__range=(start, end))
+        .values('day')
+        .annotate(views=Sum('views'), units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('day')
+    )
+
+
+def top_products(start, end, order_by='revenue', limit=TOP_PRODUCTS):
+    return list(
+        ProductDailyStats.objects.filter(day__range=(start, end))
+        .values('product_id', 'product__name')
+        .annotate(views=Sum('views'), orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'))
+        .order_by(f'-{order_by}', 'product_id')[:limit]
+    )
+
+
+def subtree_totals(start, end, parent=None):
+    """
+    ``(children, own)``: each child of ``parent`` (or each root) with the
+    totals of its whole subtree, and the totals of the products filed
+    directly under ``parent`` itself.
+    """
+    children = list(parent.get_children() if parent else Category.objects.filter(level=0).order_by('tree_id'))
+    rows = CategoryDailyStats.objects.filter(day__range=(start, end))
+    if parent is not None:
+        rows = rows.filter(
+            category__tree_id=parent.tree_id,
+            category__lft__gte=parent.lft,
+            category__rght__lte=parent.rght,
+        )
+    rows = (
+        rows.values('category__tree_id', 'category__lft')
+        .annotate(views=Sum('views'), units=Sum('units'), revenue=Sum('revenue'))
+        .order_by()
+    )
+
+    def empty():
+        return {'views': 0, 'units': 0, 'revenue': Decimal('0')}
+
+    totals = [empty() for _ in children]
+    own = empty()
+    # Children are disjoint lft ranges, sorted within each tree
+    bounds = sorted((child.tree_id, child.lft, index) for index, child in enumerate(children))
+    starts = [(tree_id, lft) for tree_id, lft, _ in bounds]
+    for row in rows:
+        key = (row['category__tree_id'], row['category__lft'])
+        position = bisect_right(starts, key) - 1
+        target = own
+        if position >= 0:
+            tree_id, _, index = bounds[position]
+            child = children[index]
+            if tree_id == key[0] and key[1] <= child.rght:
+                target = totals[index]
+        for field in ('views', 'units', 'revenue'):
+            target[field] += row[field] or 0
+    return list(zip(children, totals)), own
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from analytics.rollup import AnalyticsRollup
+
+
+class Command(BaseCommand):
+    help = 'Roll orders and product views changed since the last run into the daily analytics tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute sales for every day with orders, not only changed days')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per upsert statement')
+
+    def handle(self, *args, **options):
+        rollup = AnalyticsRollup(batch_size=options['batch_size'], log=self.stdout.write)
+        touched = rollup.run(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rolled up {len(touched)} days: {len(rollup.sales_days)} with order changes, '
+            f'{rollup.views_added} new views'
+        ))
@@ -0,0 +1,70 @@
+from django.db import models
+
+
+class ProductViewCount(models.Model):
+    """
+    Views of a product on one day, as flushed by one process's view buffer.
+
+    Rows are only appended; `manage.py rollup_analytics` adds them into
+    ProductDailyStats and deletes them.
+    """
+    # No constraint: a product deleted before the flush must not fail it
+    product = models.ForeignKey('store.Product', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    day = models.DateField()
+    views = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.views} views of {self.product_id} on {self.day}"
+
+
+class ProductDailyStats(models.Model):
+    product = models.ForeignKey('store.Product', on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Product daily stats'
+        constraints = [
+            # Conflict target of the rollup upserts
+            models.UniqueConstraint(fields=['product', 'day'], name='analytics_productdailystats_unique_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}"
+
+
+class CategoryDailyStats(models.Model):
+    """Totals of the products directly in a category; subtrees add up lft/rght ranges"""
+    category = models.ForeignKey('store.Category', on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Category daily stats'
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'day'], name='analytics_categorydailystats_unique_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.category_id} on {self.day}"
+
+
+class RollupState(models.Model):
+    """How far the rollup has read; one row per source"""
+    name = models.CharField(max_length=50, unique=True)
+    watermark = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} up to {self.watermark}"
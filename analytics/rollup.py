@@ -0,0 +1,152 @@
+"""
+Incremental rollup of orders and product views into daily tables.
+
+``manage.py rollup_analytics`` (run from cron) does two things:
+
+* Sales: every day with an order created or changed since the last run (by
+  Order.updated_at, with a small overlap for in-flight transactions) has its
+  order, unit and revenue columns recomputed from the order lines. A day is
+  always recomputed whole, so a re-run or an overlap never double counts and
+  a cancelled order drops out of its day.
+* Views: the ProductViewCount rows flushed by the web processes are added
+  into the views column and deleted.
+
+CategoryDailyStats is then rebuilt for every touched day from the product
+rows, using each product's current category. The admin dashboard reads only
+these tables.
+"""
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, Exists, F, OuterRef, Sum
+from django.db.models.functions import TruncDate
+
+from orders.models import Order, OrderItem
+from sr_supermarkt.db_router import use_primary
+from store.models import Product
+
+from .models import CategoryDailyStats, ProductDailyStats, ProductViewCount, RollupState
+
+
+# Orders committed just before the previous watermark may have been invisible to it
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+SALES_FIELDS = ['orders', 'units', 'revenue']
+
+
+class AnalyticsRollup:
+    def __init__(self, batch_size=1000, log=None):
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.sales_days = set()
+        self.view_days = set()
+        self.views_added = 0
+
+    def changed_order_days(self, full=False):
+        """Days of orders created or updated since the watermark, and the new watermark"""
+        state, _ = RollupState.objects.get_or_create(name='orders')
+        orders = Order.objects.all()
+        if state.watermark and not full:
+            orders = orders.filter(updated_at__gt=state.watermark - WATERMARK_OVERLAP)
+        latest = orders.aggregate(latest=models.Max('updated_at'))['latest']
+        days = set(
+            orders.annotate(day=TruncDate('created_at')).order_by().values_list('day', flat=True).distinct()
+        )
+        return state, days, latest
+
+    def rollup_sales(self, days):
+        """Recompute the sales columns of every product row of ``days``"""
+        lines = (
+            OrderItem.objects.filter(
+                order__status__in=Order.SALE_STATUSES,
+                order__created_at__date__in=days,
+                product__isnull=False,
+            )
+            .annotate(day=TruncDate('order__created_at'))
+            .values('product_id', 'day')
+            .annotate(
+                orders=Count('order_id', distinct=True),
+                units=Sum('quantity'),
+                revenue=Sum(ExpressionWrapper(
+                    F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2),
+                )),
+            )
+            .order_by()
+        )
+        ProductDailyStats.objects.filter(day__in=days).update(orders=0, units=0, revenue=0)
+        rows = [
+            ProductDailyStats(product_id=line['product_id'], day=line['day'], orders=line['orders'],
+                              units=line['units'], revenue=line['revenue'])
+            for line in lines
+        ]
+        ProductDailyStats.objects.bulk_create(
+            rows, batch_size=self.batch_size, update_conflicts=True,
+            unique_fields=['product', 'day'], update_fields=SALES_FIELDS,
+        )
+        return len(rows)
+
+    def rollup_views(self):
+        """Add the flushed view counts into the daily rows and delete them"""
+        last_id = ProductViewCount.objects.aggregate(last_id=models.Max('id'))['last_id']
+        if last_id is None:
+            return set()
+        pending = ProductViewCount.objects.filter(id__lte=last_id)
+        totals = {
+            (row['product_id'], row['day']): row['views']
+            for row in pending.filter(Exists(Product.objects.filter(pk=OuterRef('product_id'))))
+            .values('product_id', 'day').annotate(views=Sum('views')).order_by()
+        }
+        days = {day for _, day in totals}
+        existing = {
+            (product_id, day): views
+            for product_id, day, views in ProductDailyStats.objects.filter(
+                day__in=days, product_id__in={product_id for product_id, _ in totals},
+            ).values_list('product_id', 'day', 'views')
+        }
+        ProductDailyStats.objects.bulk_create(
+            [
+                ProductDailyStats(product_id=product_id, day=day, views=existing.get((product_id, day), 0) + views)
+                for (product_id, day), views in totals.items()
+            ],
+            batch_size=self.batch_size, update_conflicts=True,
+            unique_fields=['product', 'day'], update_fields=['views'],
+        )
+        pending.delete()
+        self.views_added = sum(totals.values())
+        return days
+
+    def rollup_categories(self, days):
+        """Rebuild the per-category rows of ``days`` from the product rows"""
+        totals = (
+            ProductDailyStats.objects.filter(day__in=days)
+            .values('product__category_id', 'day')
+            .annotate(views=Sum('views'), units=Sum('units'), revenue=Sum('revenue'))
+            .order_by()
+        )
+        CategoryDailyStats.objects.filter(day__in=days).delete()
+        CategoryDailyStats.objects.bulk_create(
+            [
+                CategoryDailyStats(category_id=row['product__category_id'], day=row['day'],
+                                   views=row['views'], units=row['units'], revenue=row['revenue'])
+                for row in totals
+            ],
+            batch_size=self.batch_size,
+        )
+
+    def run(self, full=False):
+        with use_primary(), transaction.atomic():
+            state, self.sales_days, latest = self.changed_order_days(full)
+            if self.sales_days:
+                products = self.rollup_sales(self.sales_days)
+                self.log(f'Recomputed sales for {len(self.sales_days)} days ({products} product rows)')
+            self.view_days = self.rollup_views()
+            if self.view_days:
+                self.log(f'Added {self.views_added} views over {len(self.view_days)} days')
+
+            touched = self.sales_days | self.view_days
+            if touched:
+                self.rollup_categories(touched)
+            if latest is not None:
+                state.watermark = max(latest, state.watermark) if state.watermark else latest
+            state.save()
+        return touched
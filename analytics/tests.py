@@ -0,0 +1,129 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.db import DatabaseError
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from store.models import Category, Product
+
+from .dashboard import date_range, subtree_totals
+from .models import CategoryDailyStats, ProductDailyStats, ProductViewCount
+from .rollup import AnalyticsRollup
+from .tracking import ViewBuffer, record_product_view
+
+
+class AnalyticsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.root = Category.objects.create(name='Grocery', slug='grocery')
+        cls.child = Category.objects.create(name='Rice', slug='rice', parent=cls.root)
+        cls.leaf = Category.objects.create(name='Basmati', slug='basmati', parent=cls.child)
+        cls.other = Category.objects.create(name='Spices', slug='spices')
+        cls.oil, cls.rice, cls.basmati, cls.pepper = [
+            Product.objects.create(name=name, slug=name.lower(), category=category, price=Decimal('2.00'))
+            for name, category in [
+                ('Oil', cls.root), ('Rice', cls.child), ('Basmati', cls.leaf), ('Pepper', cls.other),
+            ]
+        ]
+        cls.today = timezone.localdate()
+
+    def order(self, *lines, status='paid'):
+        order = Order.objects.create(status=status)
+        for product, quantity, price in lines:
+            OrderItem.objects.create(order=order, product=product, product_name=product.name,
+                                     price=Decimal(price), quantity=quantity)
+        return order
+
+    def stats(self, product):
+        return ProductDailyStats.objects.filter(product=product, day=self.today).values(
+            'views', 'orders', 'units', 'revenue',
+        ).first()
+
+
+class ViewBufferTests(AnalyticsTestCase):
+    def views(self):
+        return dict(ProductViewCount.objects.values_list('product_id', 'views'))
+
+    def test_flushes_when_full(self):
+        buffer = ViewBuffer(max_size=3, max_age=3600)
+        buffer.record(self.rice.pk)
+        buffer.record(self.rice.pk)
+        self.assertEqual(self.views(), {})
+        buffer.record(self.oil.pk)
+        self.assertEqual(self.views(), {self.rice.pk: 2, self.oil.pk: 1})
+        self.assertEqual(buffer.pending, 0)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_failed_flush_keeps_the_counts(self):
+        buffer = ViewBuffer(max_size=100, max_age=3600)
+        buffer.record(self.rice.pk)
+        with patch.object(ProductViewCount.objects, 'bulk_create', side_effect=DatabaseError):
+            self.assertEqual(buffer.flush(), 0)
+        buffer.record(self.rice.pk)
+        self.assertEqual(buffer.pending, 2)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(self.views(), {self.rice.pk: 2})
+
+    def test_own_tools_are_not_counted(self):
+        buffer = ViewBuffer(max_size=100, max_age=3600)
+        factory = RequestFactory()
+        with patch('analytics.tracking.get_view_buffer', return_value=buffer):
+            record_product_view(factory.get('/', HTTP_USER_AGENT='Mozilla/5.0'), self.rice.pk)
+            record_product_view(factory.get('/', HTTP_USER_AGENT='sr-supermarkt-loadtest/1.0'), self.rice.pk)
+        self.assertEqual(buffer.pending, 1)
+
+
+class RollupTests(AnalyticsTestCase):
+    def test_rerun_does_not_double_count(self):
+        self.order((self.rice, 2, '3.00'), (self.oil, 1, '5.00'))
+        self.order((self.rice, 1, '3.00'))
+        buffer = ViewBuffer(max_size=100, max_age=3600)
+        buffer.record(self.rice.pk)
+        buffer.flush()
+
+        AnalyticsRollup().run()
+        # Orders inside the watermark overlap are recomputed, not added again
+        AnalyticsRollup().run()
+        self.assertEqual(self.stats(self.rice), {'views': 1, 'orders': 2, 'units': 3, 'revenue': Decimal('9.00')})
+        self.assertEqual(self.stats(self.oil)['revenue'], Decimal('5.00'))
+        self.assertFalse(ProductViewCount.objects.exists())
+
+        buffer.record(self.rice.pk)
+        buffer.flush()
+        AnalyticsRollup().run()
+        self.assertEqual(self.stats(self.rice)['views'], 2)
+
+    def test_cancelled_order_drops_out_of_its_day(self):
+        self.order((self.rice, 1, '3.00'))
+        order = self.order((self.rice, 4, '3.00'))
+        self.order((self.pepper, 1, '1.00'), status='pending')
+        AnalyticsRollup().run()
+        self.assertEqual(self.stats(self.rice)['units'], 5)
+        self.assertIsNone(self.stats(self.pepper))
+
+        order.status = 'cancelled'
+        order.save()
+        AnalyticsRollup().run()
+        self.assertEqual(self.stats(self.rice), {'views': 0, 'orders': 1, 'units': 1, 'revenue': Decimal('3.00')})
+        self.assertEqual(CategoryDailyStats.objects.get(category=self.child).units, 1)
+
+
+class DashboardTests(AnalyticsTestCase):
+    def test_subtree_totals(self):
+        self.order((self.oil, 1, '5.00'), (self.rice, 2, '3.00'), (self.basmati, 3, '4.00'), (self.pepper, 1, '1.00'))
+        AnalyticsRollup().run()
+        start, end = date_range(7)
+
+        roots, own = subtree_totals(start, end)
+        self.assertEqual([(category, totals['units']) for category, totals in roots],
+                         [(self.root, 6), (self.other, 1)])
+        self.assertEqual(roots[0][1]['revenue'], Decimal('23.00'))
+        self.assertEqual(own['units'], 0)
+
+        children, own = subtree_totals(start, end, parent=self.root)
+        self.assertEqual([(category, totals['units']) for category, totals in children], [(self.child, 5)])
+        self.assertEqual(children[0][1]['revenue'], Decimal('18.00'))
+        # Products filed directly under the parent
+        self.assertEqual((own['units'], own['revenue']), (1, Decimal('5.00')))
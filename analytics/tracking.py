@@ -0,0 +1,82 @@
+"""
+Cheap product view counting.
+
+product_detail calls record_product_view(), which only bumps an in-memory
+counter keyed by (product, day). Each process flushes its counters as one
+bulk INSERT into ProductViewCount once ANALYTICS_VIEW_FLUSH_SIZE views have
+piled up or ANALYTICS_VIEW_FLUSH_INTERVAL seconds have passed, and once more
+at exit. A crash loses at most one buffer of views, which is fine for
+traffic statistics. Our own tools (loadtest, warm_caches) identify
+themselves by User-Agent and are not counted.
+"""
+import atexit
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .models import ProductViewCount
+
+
+class ViewBuffer:
+    def __init__(self, max_size=None, max_age=None):
+        self.max_size = max_size or getattr(settings, 'ANALYTICS_VIEW_FLUSH_SIZE', 500)
+        self.max_age = max_age if max_age is not None else getattr(settings, 'ANALYTICS_VIEW_FLUSH_INTERVAL', 30.0)
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.pending = 0
+        self.flushed_at = time.monotonic()
+
+    def record(self, product_id):
+        with self.lock:
+            self.counts[(product_id, timezone.localdate())] += 1
+            self.pending += 1
+            due = self.pending >= self.max_size or time.monotonic() - self.flushed_at >= self.max_age
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered counts, one row per (product, day); returns the views written"""
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.pending = 0
+            self.flushed_at = time.monotonic()
+        if not counts:
+            return 0
+        try:
+            ProductViewCount.objects.bulk_create([
+                ProductViewCount(product_id=product_id, day=day, views=views)
+                for (product_id, day), views in counts.items()
+            ])
+        except DatabaseError:
+            # Keep the counts for the next flush rather than failing the page
+            with self.lock:
+                self.counts.update(counts)
+                self.pending += sum(counts.values())
+            return 0
+        return sum(counts.values())
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_view_buffer():
+    """The per-process ViewBuffer, flushed at interpreter exit"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ViewBuffer()
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+def record_product_view(request, product_id):
+    user_agent = request.headers.get('User-Agent', '')
+    if user_agent.startswith(tuple(getattr(settings, 'ANALYTICS_IGNORED_USER_AGENTS', ()))):
+        return
+    get_view_buffer().record(product_id)
@@ -1,3 +1,18 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Order, OrderItem
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    raw_id_fields = ['product']
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'status', 'total', 'created_at', 'updated_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['id', 'user__username', 'user__email']
+    raw_id_fields = ['user']
+    inlines = [OrderItemInline]
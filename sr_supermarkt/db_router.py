@@ -0,0 +1,93 @@
+"""
+Send catalogue reads to read replicas and everything else to ``default``.
+
+Replicas are the DATABASES aliases listed in DATABASE_REPLICAS. Only the
+catalogue models (CATALOGUE_MODELS) are read from them; sessions, auth,
+carts, orders, jobs and every write go to the primary. Replicas may lag,
+which browse pages tolerate, but a client never reads past its own writes:
+
+* once the current request (or command) writes a catalogue model, the rest
+  of it reads that model from the primary;
+* PrimaryPinMiddleware carries the pin over to the client's next requests
+  for REPLICA_PIN_SECONDS and pins the admin outright;
+* ``use_primary()`` pins a block of code explicitly, e.g. an import that
+  must see the rows it is about to deduplicate against.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+PRIMARY = 'default'
+
+CATALOGUE_MODELS = {
+    'store.category',
+    'store.product',
+    'store.productimage',
+    'store.cataloguechange',
+}
+
+_pinned = ContextVar('replica_pinned', default=False)
+_wrote = ContextVar('catalogue_written', default=False)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def catalogue_written():
+    return _wrote.get()
+
+
+@contextmanager
+def use_primary():
+    """Read everything from the primary inside the block"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+@contextmanager
+def routing_scope(pinned=False):
+    """Fresh pin state for one unit of work, such as a request"""
+    pinned_token, wrote_token = _pinned.set(pinned), _wrote.set(False)
+    try:
+        yield
+    finally:
+        _pinned.reset(pinned_token)
+        _wrote.reset(wrote_token)
+
+
+def is_catalogue_model(model):
+    # Not _meta.label_lower: DatabaseCache routes a stand-in model whose
+    # Options only carry app_label and model_name
+    return f'{model._meta.app_label}.{model._meta.model_name}' in CATALOGUE_MODELS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or _pinned.get() or not is_catalogue_model(model):
+            return PRIMARY
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        if is_catalogue_model(model):
+            _pinned.set(True)
+            _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {PRIMARY, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db not in replicas()
@@ -0,0 +1,189 @@
+"""
+Opt-in allocation profiling with tracemalloc.
+
+With MEMORY_PROFILING on, MemoryProfilingMiddleware starts tracemalloc and
+records, per request type (method and resolved view name), how much traced
+memory each request left behind and its allocation peak; background jobs
+are recorded the same way as ``job:<kind>``. Every
+MEMORY_PROFILING_SNAPSHOT_EVERY requests a snapshot is compared with the
+baseline taken after MEMORY_PROFILING_WARMUP requests, keeping the
+allocation sites that grew the most since. ``/__debug__/memory`` shows all
+of it to staff, a POST to ``/__debug__/memory/snapshot`` compares a fresh
+snapshot on demand, and ``manage.py memory_profile`` runs the same profiler
+over a batch of requests in process.
+
+Retained memory is read from the process-wide tracemalloc counters, so it
+is exact for one-request-at-a-time workers (gunicorn sync) and approximate
+under threads. Off, the middleware removes itself from the stack, jobs skip
+the bookkeeping and the endpoints are not routed at all.
+"""
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_POST
+
+
+# The profiler's own allocations and import machinery are never leaks
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+
+def rss_bytes():
+    """Current resident set size, or the peak where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def profiling_enabled():
+    return getattr(settings, 'MEMORY_PROFILING', False)
+
+
+class MemoryProfiler:
+    def __init__(self, frames=None, warmup=None, snapshot_every=None, top=None):
+        self.frames = frames or getattr(settings, 'MEMORY_PROFILING_FRAMES', 10)
+        self.warmup = warmup if warmup is not None else getattr(settings, 'MEMORY_PROFILING_WARMUP', 50)
+        self.snapshot_every = snapshot_every or getattr(settings, 'MEMORY_PROFILING_SNAPSHOT_EVERY', 500)
+        self.top = top or getattr(settings, 'MEMORY_PROFILING_TOP', 25)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.types = defaultdict(lambda: {'requests': 0, 'retained': 0, 'max_retained': 0, 'max_peak': 0})
+            self.baseline = None
+            self.baseline_at = None
+            self.growth = []
+            self.compared_at = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    @contextmanager
+    def measure(self, request_type=None):
+        """
+        Record what the enclosed block left allocated. Yields a dict whose
+        'type' can be filled in once known (a request's view is resolved
+        inside the block).
+        """
+        sample = {'type': request_type}
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            yield sample
+        finally:
+            after, peak = tracemalloc.get_traced_memory()
+            self.record(sample['type'] or 'unknown', after - before, peak - before)
+
+    def record(self, request_type, retained, peak):
+        with self.lock:
+            stats = self.types[request_type]
+            stats['requests'] += 1
+            stats['retained'] += retained
+            stats['max_retained'] = max(stats['max_retained'], retained)
+            stats['max_peak'] = max(stats['max_peak'], peak)
+            self.requests += 1
+            requests = self.requests
+        if requests == self.warmup or (requests > self.warmup and (requests - self.warmup) % self.snapshot_every == 0):
+            self.snapshot()
+
+    def snapshot(self):
+        """Take the baseline, or compare a new snapshot with it"""
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        with self.lock:
+            if self.baseline is None:
+                self.baseline, self.baseline_at = snapshot, self.requests
+                return
+            baseline = self.baseline
+        differences = snapshot.compare_to(baseline, 'traceback')
+        growth = [
+            {
+                'site': str(difference.traceback[-1]) if difference.traceback else '<unknown>',
+                'size_diff': difference.size_diff,
+                'count_diff': difference.count_diff,
+                'size': difference.size,
+                'traceback': difference.traceback.format(most_recent_first=True),
+            }
+            for difference in [difference for difference in differences if difference.size_diff > 0][:self.top]
+        ]
+        with self.lock:
+            self.growth, self.compared_at = growth, self.requests
+
+    def report(self):
+        current, peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            types = {
+                name: {**stats, 'mean_retained': stats['retained'] // stats['requests']}
+                for name, stats in sorted(self.types.items(), key=lambda item: -item[1]['retained'])
+            }
+            return {
+                'pid': os.getpid(),
+                'time': time.time(),
+                'rss': rss_bytes(),
+                'traced': current,
+                'traced_peak': peak,
+                'requests': self.requests,
+                'baseline_at': self.baseline_at,
+                'compared_at': self.compared_at,
+                'types': types,
+                'growth': self.growth,
+            }
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_memory_profiler():
+    """The per-process MemoryProfiler, tracing from the first call"""
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = MemoryProfiler()
+                _profiler.start()
+    return _profiler
+
+
+@contextmanager
+def profile_block(request_type):
+    """profiler.measure() when profiling is on, otherwise nothing"""
+    if not profiling_enabled():
+        yield None
+        return
+    with get_memory_profiler().measure(request_type) as sample:
+        yield sample
+
+
+# Only routed with MEMORY_PROFILING on (see sr_supermarkt/urls.py)
+
+@require_GET
+@staff_member_required
+def memory_report(request):
+    """This worker's profile as JSON"""
+    return JsonResponse(get_memory_profiler().report())
+
+
+@require_POST
+@staff_member_required
+def memory_snapshot(request):
+    """Compare a fresh snapshot with the baseline (or take the baseline), then report"""
+    profiler = get_memory_profiler()
+    profiler.snapshot()
+    return JsonResponse(profiler.report())
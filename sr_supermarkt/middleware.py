@@ -0,0 +1,183 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .db_router import catalogue_written, replicas, routing_scope
+from .memory import get_memory_profiler, profiling_enabled
+from .storage import CONTENT_ADDRESSED_NAME_RE
+
+
+# Names produced by ManifestStaticFilesStorage, e.g. css/style.3f2a9c1b7d4e.css
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+PRIMARY_PIN_COOKIE = 'primary_pin'
+
+
+def accept_encoding_qvalues(header):
+    """``{coding: q}`` from an Accept-Encoding header; malformed q-values count as 0"""
+    qvalues = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding.lower()] = q
+    return qvalues
+
+
+def accepts_encoding(qvalues, encoding):
+    """Whether ``encoding`` is acceptable: listed with q > 0, or covered by ``*`` with q > 0"""
+    return qvalues.get(encoding, qvalues.get('*', 0.0)) > 0
+
+
+class StaticFilesMiddleware:
+    """
+    Serve STATIC_ROOT and MEDIA_ROOT straight from the middleware stack.
+
+    Requests are answered before sessions, auth and URL resolution run, so
+    asset traffic costs a stat() and a sendfile. Pre-compressed ``.br``/``.gz``
+    variants written by collectstatic are picked according to Accept-Encoding,
+    and content-hashed names (manifest static files, content-addressed
+    media) are sent with an immutable far-future Cache-Control. Enabled with the SERVE_STATIC_FILES setting.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVE_STATIC_FILES', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.roots = []
+        if settings.STATIC_URL and settings.STATIC_ROOT:
+            self.roots.append((self._url_prefix(settings.STATIC_URL), str(settings.STATIC_ROOT),
+                               settings.STATIC_MAX_AGE))
+        if settings.MEDIA_URL and settings.MEDIA_ROOT:
+            self.roots.append((self._url_prefix(settings.MEDIA_URL), str(settings.MEDIA_ROOT),
+                               settings.MEDIA_MAX_AGE))
+
+    @staticmethod
+    def _url_prefix(url):
+        # STATIC_URL/MEDIA_URL may be given with or without a leading slash
+        return '/' + url.lstrip('/')
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD'):
+            for prefix, root, max_age in self.roots:
+                if request.path_info.startswith(prefix):
+                    response = self.serve(request, request.path_info[len(prefix):], root, max_age)
+                    if response is not None:
+                        return response
+        return self.get_response(request)
+
+    def serve(self, request, name, root, max_age):
+        try:
+            path = safe_join(root, name)
+        except SuspiciousFileOperation:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        if HASHED_NAME_RE.search(name) or CONTENT_ADDRESSED_NAME_RE.search(name):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = f'public, max-age={max_age}'
+
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+            response = HttpResponseNotModified()
+            response['Cache-Control'] = cache_control
+            response['Vary'] = 'Accept-Encoding'
+            return response
+
+        content_type, _ = mimetypes.guess_type(path)
+        qvalues = accept_encoding_qvalues(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        served_path, content_encoding = path, None
+        for encoding, suffix in ENCODINGS:
+            if accepts_encoding(qvalues, encoding) and os.path.isfile(path + suffix):
+                served_path, content_encoding = path + suffix, encoding
+                break
+
+        response = FileResponse(open(served_path, 'rb'), content_type=content_type or 'application/octet-stream')
+        # FileResponse adds an inline Content-Disposition naming the file it
+        # opened, which for a compressed variant is the .br/.gz name
+        del response['Content-Disposition']
+        if content_encoding:
+            response['Content-Encoding'] = content_encoding
+        response['Vary'] = 'Accept-Encoding'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = cache_control
+        return response
+
+
+class PrimaryPinMiddleware:
+    """
+    Read-your-writes for replica routing (see sr_supermarkt.db_router).
+
+    Every request starts unpinned, so replica reads are allowed until it
+    writes a catalogue model. A request that wrote sets a short-lived cookie
+    that pins the client's following requests to the primary for
+    REPLICA_PIN_SECONDS, long enough for the replicas to catch up. Admin
+    requests always read from the primary. Not used without DATABASE_REPLICAS.
+    """
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.admin_prefix = None
+
+    def __call__(self, request):
+        if self.admin_prefix is None:
+            self.admin_prefix = reverse('admin:index')
+        pinned = PRIMARY_PIN_COOKIE in request.COOKIES or request.path_info.startswith(self.admin_prefix)
+
+        with routing_scope(pinned):
+            response = self.get_response(request)
+            wrote = catalogue_written()
+
+        if wrote:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class MemoryProfilingMiddleware:
+    """
+    Record the memory each request leaves allocated, per method and view
+    (see sr_supermarkt/memory.py). Enabled with the MEMORY_PROFILING setting.
+    """
+
+    def __init__(self, get_response):
+        if not profiling_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.profiler = get_memory_profiler()
+
+    def __call__(self, request):
+        with self.profiler.measure() as sample:
+            response = self.get_response(request)
+            match = request.resolver_match
+            sample['type'] = f'{request.method} {match.view_name if match else "unresolved"}'
+        return response
@@ -41,12 +41,16 @@ INSTALLED_APPS = [
     'store',
     'accounts',
     'orders',
+    'analytics',
     'crispy_forms',
     'django_filters',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'sr_supermarkt.middleware.StaticFilesMiddleware',
+    'sr_supermarkt.middleware.MemoryProfilingMiddleware',
+    'sr_supermarkt.middleware.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -88,6 +92,51 @@ DATABASES = {
     }
 }
 
+# Catalogue reads (products, categories, images, change feed) go to a random
+# alias from DATABASE_REPLICAS; all other reads and every write go to
+# 'default'. A replica for local testing is a copy of the primary kept in
+# sync by `manage.py sync_replicas`:
+#
+#     DATABASES['replica'] = {
+#         'ENGINE': 'django.db.backends.sqlite3',
+#         'NAME': BASE_DIR / 'db.replica.sqlite3',
+#         'TEST': {'MIRROR': 'default'},
+#     }
+#     DATABASE_REPLICAS = ['replica']
+DATABASE_ROUTERS = ['sr_supermarkt.db_router.ReplicaRouter']
+DATABASE_REPLICAS = []
+
+# After a client writes catalogue data, its reads stay on the primary this long
+REPLICA_PIN_SECONDS = 10
+
+# The caches must be shared by every process (web workers, run_jobs,
+# run_change_sets, imports): throttling buckets, and listing results and
+# review pages keyed on the catalogue version (a database row,
+# store.CatalogueVersion), live in them, and a per-process LocMemCache would
+# leave each worker with its own copy (check store.E001). The tables are created by
+# store's migrations; swap in Redis or Memcached where the database should
+# not carry the cache traffic. DatabaseCache culls a third of the table
+# once it holds MAX_ENTRIES rows, Django's default of 300 is far too few.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    # Listing throttle buckets and cached listing result ids (store/throttling.py),
+    # apart so that churning results never culls a client's bucket
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache_throttle',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'listing': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache_listing',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -131,11 +180,99 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Files that must never be served publicly (job uploads and exports); kept
+# outside MEDIA_ROOT and downloaded through the staff-only admin
+PRIVATE_ROOT = BASE_DIR / 'private'
+
+# Hashed file names plus .gz/.br variants are built by collectstatic. The
+# manifest only exists after collectstatic, so development keeps plain names.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # Product and category images: named by content hash so identical
+    # uploads share one file (see `manage.py dedupe_media`)
+    'images': {
+        'BACKEND': 'sr_supermarkt.storage.ContentAddressedStorage',
+    },
+    # Background job input and result files, see JobAdmin for downloads
+    'private': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': PRIVATE_ROOT},
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'sr_supermarkt.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+STATIC_COMPRESSION_WORKERS = None  # defaults to os.cpu_count()
+
+# Serve STATIC_ROOT and MEDIA_ROOT from sr_supermarkt.middleware.StaticFilesMiddleware
+SERVE_STATIC_FILES = True
+STATIC_MAX_AGE = 60 * 60  # unhashed static names; hashed names are cached for a year
+MEDIA_MAX_AGE = 60 * 60 * 24
+
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
 # Cart session
 CART_SESSION_ID = 'cart'
 
+# StockLocation.code that imported and unlocated stock is counted at (store/stock.py)
+DEFAULT_STOCK_LOCATION = 'main'
+
+# Seconds a catalogue change is held back from the change feed, so that
+# transactions holding lower seqs commit before consumers move past them
+CHANGE_FEED_LAG = 5
+
+# Seconds between catalogue version checks by the search suggestion index
+SUGGEST_VERSION_CHECK_INTERVAL = 1.0
+
+# product_list searches, price filters and pages past LISTING_DEEP_PAGE draw
+# from per-client token buckets of (tokens per second, burst); see
+# store/throttling.py. Over the limit, clients get cached results or a 429.
+LISTING_DEEP_PAGE = 5
+LISTING_THROTTLE_RATES = {
+    'search': (0.5, 30),
+    'deep_page': (0.2, 20),
+}
+LISTING_THROTTLE_BOT_FACTOR = 0.25
+# Client addresses never throttled. Empty on purpose: add '127.0.0.1' and
+# '::1' locally to load test without limits, but not where a proxy on the
+# same host forwards all traffic from there
+LISTING_THROTTLE_EXEMPT_IPS = []
+BOT_USER_AGENT_MARKERS = ['bot', 'crawl', 'spider', 'slurp', 'scrapy', 'python-requests', 'curl', 'wget']
+# Reverse proxies in front of the app that append to X-Forwarded-For
+TRUSTED_PROXY_COUNT = 0
+
+# In-process NumPy snapshot answering product listing filters and sorts
+# (store/catalogue_engine.py); needs numpy, falls back to SQL without it
+CATALOGUE_ENGINE_ENABLED = False
+CATALOGUE_ENGINE_CHECK_INTERVAL = 1.0
+
+# product_detail views are counted in memory and written per process in one
+# INSERT after this many views or seconds, whichever comes first; see
+# `manage.py rollup_analytics` for the daily tables built from them
+ANALYTICS_VIEW_FLUSH_SIZE = 500
+ANALYTICS_VIEW_FLUSH_INTERVAL = 30.0
+# Synthetic traffic from `manage.py loadtest`, `warm_caches` and `memory_profile`
+ANALYTICS_IGNORED_USER_AGENTS = ['sr-supermarkt-loadtest', 'sr-supermarkt-warm-caches', 'sr-supermarkt-memory-profile']
+
+# tracemalloc profiling of every request and job, reported per worker at
+# /__debug__/memory (staff only); see sr_supermarkt/memory.py. Costs memory
+# and CPU while on, nothing while off.
+MEMORY_PROFILING = False
+MEMORY_PROFILING_FRAMES = 10
+MEMORY_PROFILING_WARMUP = 50  # requests before the baseline snapshot
+MEMORY_PROFILING_SNAPSHOT_EVERY = 500
+MEMORY_PROFILING_TOP = 25
+
+# Sitemaps are written here by `manage.py build_sitemaps` and served as files
+SITEMAP_ROOT = BASE_DIR / 'sitemaps'
+SITEMAP_SHARD_SIZE = 50000
+SITEMAP_BASE_URL = 'http://localhost:8000'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,164 @@
+"""
+Storage backends for static and media files.
+
+CompressedManifestStaticFilesStorage adds pre-compressed ``.gz`` and ``.br``
+variants next to every hashed static file at collectstatic time, so the
+static serving middleware can hand them out without compressing on request.
+
+ContentAddressedStorage names uploads after the sha256 of their bytes, so
+identical uploads share one file and a name never changes content.
+"""
+import gzip
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip variants are always built
+    brotli = None
+
+
+# Names produced by ContentAddressedStorage, e.g. products/main/3f2a...9c1b.jpg
+CONTENT_HASH_LENGTH = 32
+CONTENT_ADDRESSED_NAME_RE = re.compile(r'(?:^|/)[0-9a-f]{%d}\.[^/.]+$' % CONTENT_HASH_LENGTH)
+
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.html', '.xml', '.ico',
+}
+
+
+def _gzip_bytes(data):
+    # mtime=0 keeps the output deterministic across collectstatic runs
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli_bytes(data):
+    return brotli.compress(data, quality=11)
+
+
+def compress_file(path):
+    """
+    Write ``path.gz`` (and ``path.br`` when brotli is installed) next to ``path``.
+
+    Variants that would not be smaller than the original are skipped.
+    Returns the list of variant paths written.
+    """
+    with open(path, 'rb') as source:
+        data = source.read()
+
+    encoders = [('.gz', _gzip_bytes)]
+    if brotli is not None:
+        encoders.append(('.br', _brotli_bytes))
+
+    written = []
+    for suffix, encode in encoders:
+        compressed = encode(data)
+        if len(compressed) >= len(data):
+            continue
+        with open(path + suffix, 'wb') as target:
+            target.write(compressed)
+        written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest-hashed static files with gzip/brotli variants built in parallel"""
+
+    manifest_strict = False
+
+    def url(self, name, force=False):
+        # A template referencing an asset that was never collected gets the
+        # plain (uncached) URL and a 404 for that asset, not a 500 for the page.
+        try:
+            return super().url(name, force)
+        except ValueError:
+            return StaticFilesStorage.url(self, name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = []
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.append(hashed_name)
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+
+        to_compress = [
+            self.path(name) for name in set(hashed_names)
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS
+        ]
+        workers = getattr(settings, 'STATIC_COMPRESSION_WORKERS', None) or os.cpu_count()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(compress_file, to_compress))
+
+
+def file_digest(fileobj, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_addressed_name(name, digest):
+    """products/main/Ashoka Daal.JPG + digest -> products/main/<digest[:32]>.jpg"""
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, digest[:CONTENT_HASH_LENGTH] + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names every file after a hash of its content.
+
+    The upload_to directory and the extension are kept, the base name is
+    replaced by the content hash. Saving bytes that are already stored
+    returns the existing name without writing anything. Because a name can
+    never point at different bytes, the static files middleware serves
+    these names with an immutable Cache-Control. A file may be shared by
+    several rows, so never delete it through one of them; ``manage.py
+    dedupe_media`` removes files nothing refers to.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Never a suffixed alternative: the name is taken only by the same
+        # bytes, so FileExistsError tells save() it is already stored
+        validate_file_name(name, allow_relative_path=True)
+        if max_length is not None and len(name) > max_length:
+            raise SuspiciousFileOperation(
+                f'Storage can not find an available filename for "{name}". '
+                f'Please make sure that the corresponding file field allows {len(name)} characters.'
+            )
+        if self.exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        validate_file_name(name, allow_relative_path=True)
+
+        content.seek(0)
+        name = content_addressed_name(name, file_digest(content))
+        content.seek(0)
+        try:
+            # _save() asks get_available_name() again when another upload of
+            # the same bytes creates the file first
+            name = self._save(self.get_available_name(name, max_length), content)
+        except FileExistsError:
+            if not self.exists(name):
+                raise
+            return name
+        validate_file_name(name, allow_relative_path=True)
+        return name
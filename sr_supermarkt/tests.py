@@ -0,0 +1,313 @@
+import importlib
+import json
+import os
+import tempfile
+import tracemalloc
+from unittest.mock import patch
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.db import router
+from django.http import HttpResponse, HttpResponseNotFound
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import Resolver404, clear_url_caches, resolve
+from django.utils.http import http_date
+
+from store.models import Product
+
+from . import urls
+from .db_router import catalogue_written, routing_scope, use_primary
+from .memory import MemoryProfiler, memory_report, memory_snapshot
+from .middleware import IMMUTABLE_CACHE_CONTROL, PRIMARY_PIN_COOKIE, PrimaryPinMiddleware, StaticFilesMiddleware
+from .storage import CONTENT_ADDRESSED_NAME_RE, ContentAddressedStorage
+
+
+# Only router decisions are asserted, so the replica alias needs no database
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    def test_catalogue_reads_go_to_a_replica(self):
+        with routing_scope():
+            self.assertEqual(router.db_for_read(Product), 'replica')
+            self.assertEqual(router.db_for_read(User), 'default')
+            self.assertEqual(router.db_for_write(User), 'default')
+            self.assertEqual(router.db_for_read(Product), 'replica')
+            with use_primary():
+                self.assertEqual(router.db_for_read(Product), 'default')
+            self.assertEqual(router.db_for_read(Product), 'replica')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_is_primary(self):
+        with routing_scope():
+            self.assertEqual(router.db_for_read(Product), 'default')
+
+    def test_catalogue_write_pins_the_rest_of_the_scope(self):
+        with routing_scope():
+            self.assertFalse(catalogue_written())
+            self.assertEqual(router.db_for_write(Product), 'default')
+            self.assertTrue(catalogue_written())
+            self.assertEqual(router.db_for_read(Product), 'default')
+
+    def test_pin_does_not_leak_between_scopes(self):
+        with routing_scope():
+            router.db_for_write(Product)
+        with routing_scope():
+            self.assertFalse(catalogue_written())
+            self.assertEqual(router.db_for_read(Product), 'replica')
+        with routing_scope(pinned=True):
+            self.assertEqual(router.db_for_read(Product), 'default')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=10)
+class PrimaryPinMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.routes = []
+        self.middleware = PrimaryPinMiddleware(self.view)
+        self.factory = RequestFactory()
+
+    def view(self, request):
+        if request.GET.get('write'):
+            router.db_for_write(Product)
+        self.routes.append(router.db_for_read(Product))
+        return HttpResponse()
+
+    def get(self, path='/products/', cookies=None, **params):
+        request = self.factory.get(path, params)
+        request.COOKIES.update(cookies or {})
+        return self.middleware(request)
+
+    def test_pin_cookie_carries_over_to_the_next_request(self):
+        response = self.get(write='1')
+        self.assertEqual(response.cookies[PRIMARY_PIN_COOKIE]['max-age'], 10)
+        self.get(cookies={PRIMARY_PIN_COOKIE: response.cookies[PRIMARY_PIN_COOKIE].value})
+        # Without the cookie nothing is carried over
+        response = self.get()
+        self.assertNotIn(PRIMARY_PIN_COOKIE, response.cookies)
+        self.assertEqual(self.routes, ['default', 'default', 'replica'])
+
+    def test_admin_reads_from_the_primary(self):
+        self.get('/admin/store/product/')
+        self.assertEqual(self.routes, ['default'])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_not_used_without_replicas(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            PrimaryPinMiddleware(self.view)
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = ContentAddressedStorage(location=directory.name)
+
+    def test_same_bytes_share_a_name(self):
+        first = self.storage.save('products/main/Daal.JPG', ContentFile(b'daal'))
+        second = self.storage.save('products/main/other.jpg', ContentFile(b'daal'))
+        self.assertEqual(first, second)
+        self.assertRegex(first, CONTENT_ADDRESSED_NAME_RE)
+        self.assertTrue(first.startswith('products/main/') and first.endswith('.jpg'))
+        self.assertEqual(os.listdir(self.storage.path('products/main')), [os.path.basename(first)])
+        self.assertNotEqual(self.storage.save('products/main/rice.jpg', ContentFile(b'rice')), first)
+
+    def test_concurrent_upload_of_the_same_bytes(self):
+        name = self.storage.save('products/main/a.jpg', ContentFile(b'same'))
+        exists = self.storage.exists
+        checks = []
+
+        def exists_after_the_check(name):
+            # The other upload creates the file just after this one looked
+            checks.append(name)
+            return len(checks) > 1 and exists(name)
+
+        with patch.object(self.storage, 'exists', exists_after_the_check):
+            self.assertEqual(self.storage.save('products/main/b.jpg', ContentFile(b'same')), name)
+        self.assertEqual(os.listdir(self.storage.path('products/main')), [os.path.basename(name)])
+
+    def test_names_are_validated(self):
+        with self.assertRaises(SuspiciousFileOperation):
+            self.storage.save('../products/evil.jpg', ContentFile(b'evil'))
+        with self.assertRaises(SuspiciousFileOperation):
+            self.storage.save('products/main/long.jpg', ContentFile(b'long'), max_length=20)
+
+
+class StaticFilesMiddlewareTests(SimpleTestCase):
+    FILES = {
+        'static/css/site.css': b'body {}',
+        'static/css/site.css.br': b'brotli',
+        'static/css/site.css.gz': b'gzip',
+        'static/css/site.3f2a9c1b7d4e.css': b'body {}',
+        'media/products/main/' + '0123456789abcdef' * 2 + '.jpg': b'jpeg',
+    }
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name, content in self.FILES.items():
+            path = os.path.join(directory.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+        self.enterContext(override_settings(
+            SERVE_STATIC_FILES=True, STATIC_MAX_AGE=3600, MEDIA_MAX_AGE=86400,
+            STATIC_ROOT=os.path.join(directory.name, 'static'), MEDIA_ROOT=os.path.join(directory.name, 'media'),
+        ))
+        self.middleware = StaticFilesMiddleware(lambda request: HttpResponseNotFound())
+        self.factory = RequestFactory()
+
+    def get(self, path, **headers):
+        response = self.middleware(self.factory.get(path, headers=headers))
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_encoding_follows_q_values(self):
+        cases = [
+            ('', None, b'body {}'),
+            ('gzip, br', 'br', b'brotli'),
+            ('br;q=0, gzip', 'gzip', b'gzip'),
+            ('br;q=0, gzip;q=0', None, b'body {}'),
+            ('*;q=0.5', 'br', b'brotli'),
+            ('*, br;q=0', 'gzip', b'gzip'),
+            ('identity, br;q=abc', None, b'body {}'),
+        ]
+        for accept_encoding, encoding, body in cases:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get('/static/css/site.css', accept_encoding=accept_encoding)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(response['Content-Type'], 'text/css')
+                self.assertNotIn('Content-Disposition', response)
+                self.assertEqual(self.body(response), body)
+
+    def test_vary_on_200_and_304(self):
+        response = self.get('/static/css/site.css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        response = self.get('/static/css/site.css', if_modified_since=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        response = self.get('/static/css/site.css', if_modified_since=http_date(0))
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_control(self):
+        cases = [
+            ('/static/css/site.css', 'public, max-age=3600'),
+            ('/static/css/site.3f2a9c1b7d4e.css', IMMUTABLE_CACHE_CONTROL),
+            ('/media/products/main/' + '0123456789abcdef' * 2 + '.jpg', IMMUTABLE_CACHE_CONTROL),
+        ]
+        for path, cache_control in cases:
+            with self.subTest(path=path):
+                response = self.get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Cache-Control'], cache_control)
+                response = self.get(path, if_modified_since=response['Last-Modified'])
+                self.assertEqual(response['Cache-Control'], cache_control)
+
+    def test_other_paths_fall_through(self):
+        for path in ['/static/css/missing.css', '/static/css/', '/static/../settings.py', '/products/']:
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path).status_code, 404)
+
+
+class MemoryProfilerTests(SimpleTestCase):
+    def setUp(self):
+        self.profiler = MemoryProfiler(frames=1, warmup=2, snapshot_every=3, top=5)
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+        self.profiler.start()
+
+    def test_measure(self):
+        kept = []
+        with self.profiler.measure() as sample:
+            kept.append(bytearray(100000))
+            sample['type'] = 'GET store:home'
+        with self.profiler.measure('job:report'):
+            bytearray(200000)
+        report = self.profiler.report()
+        home = report['types']['GET store:home']
+        self.assertEqual(home['requests'], 1)
+        self.assertGreaterEqual(home['retained'], 100000)
+        self.assertEqual(home['mean_retained'], home['retained'])
+        # Freed by the end of the block: a peak but nothing retained
+        job = report['types']['job:report']
+        self.assertLess(job['retained'], 100000)
+        self.assertGreaterEqual(job['max_peak'], 200000)
+
+    def test_snapshots_follow_warmup_and_interval(self):
+        self.profiler.record('GET a', 0, 0)
+        self.assertIsNone(self.profiler.baseline)
+        self.profiler.record('GET a', 0, 0)
+        self.assertEqual(self.profiler.report()['baseline_at'], 2)
+
+        self.leak = [bytearray(1000) for _ in range(200)]
+        for _ in range(3):
+            self.profiler.record('GET a', 10, 20)
+        report = self.profiler.report()
+        self.assertEqual((report['requests'], report['compared_at']), (5, 5))
+        self.assertEqual(report['types']['GET a'], {
+            'requests': 5, 'retained': 30, 'max_retained': 10, 'max_peak': 20, 'mean_retained': 6,
+        })
+        self.assertTrue(any(__file__ in site['site'] for site in report['growth']))
+        self.assertLessEqual(len(report['growth']), 5)
+
+        self.profiler.reset()
+        self.assertEqual(self.profiler.report()['types'], {})
+
+
+class MemoryReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        cls.shopper = User.objects.create_user('shopper', password='password')
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.profiler = MemoryProfiler()
+        self.enterContext(patch('sr_supermarkt.memory.get_memory_profiler', return_value=self.profiler))
+
+    def request(self, view, method='get', user=None):
+        request = getattr(self.factory, method)('/__debug__/memory')
+        request.user = user or AnonymousUser()
+        return view(request)
+
+    def test_not_routed_without_profiling(self):
+        for path in ['/__debug__/memory', '/__debug__/memory/snapshot']:
+            with self.subTest(path=path):
+                with self.assertRaises(Resolver404):
+                    resolve(path)
+                self.assertEqual(self.client.get(path).status_code, 404)
+
+    def test_routed_with_profiling(self):
+        def reload_urls():
+            importlib.reload(urls)
+            clear_url_caches()
+
+        self.addCleanup(reload_urls)
+        with override_settings(MEMORY_PROFILING=True):
+            reload_urls()
+        self.assertEqual(resolve('/__debug__/memory').func, memory_report)
+        self.assertEqual(resolve('/__debug__/memory/snapshot').func, memory_snapshot)
+
+    def test_staff_only(self):
+        for view, method in [(memory_report, 'get'), (memory_snapshot, 'post')]:
+            for user in [None, self.shopper]:
+                with self.subTest(view=view.__name__, user=user):
+                    response = self.request(view, method, user)
+                    self.assertEqual(response.status_code, 302)
+                    self.assertIn('/admin/login/', response['Location'])
+        response = self.request(memory_report, user=self.staff)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['requests'], 0)
+
+    def test_snapshot_needs_a_post(self):
+        self.assertEqual(self.request(memory_snapshot, 'get', self.staff).status_code, 405)
+        self.assertEqual(self.request(memory_report, 'post', self.staff).status_code, 405)
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+        self.profiler.start()
+        response = self.request(memory_snapshot, 'post', self.staff)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(self.profiler.baseline)
@@ -18,9 +18,19 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from .memory import memory_report, memory_snapshot, profiling_enabled
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+]
+
+if profiling_enabled():
+    urlpatterns += [
+        path('__debug__/memory', memory_report, name='debug_memory'),
+        path('__debug__/memory/snapshot', memory_snapshot, name='debug_memory_snapshot'),
+    ]
+
+urlpatterns += [
     path('', include('store.urls')),
 ]
 
@@ -2,5 +2,71 @@
 document.addEventListener('DOMContentLoaded', function() {
     console.log('Sunrise Supermarkt loaded successfully!');
 
-    // Add any interactive functionality here
-});
\ No newline at end of file
+    // Search-as-you-type suggestions for the navbar search box
+    document.querySelectorAll('input[data-suggest-url]').forEach(function(input) {
+        var menu = input.parentElement.querySelector('.search-suggestions');
+        var timer = null;
+        var lastQuery = '';
+
+        function hide() {
+            menu.classList.remove('show');
+            menu.innerHTML = '';
+        }
+
+        function render(suggestions) {
+            menu.innerHTML = '';
+            suggestions.forEach(function(suggestion) {
+                var item = document.createElement('li');
+                var link = document.createElement('a');
+                link.className = 'dropdown-item';
+                link.href = suggestion.url;
+                link.textContent = suggestion.label;
+                if (suggestion.type !== 'product') {
+                    var badge = document.createElement('small');
+                    badge.className = 'text-muted ms-2';
+                    badge.textContent = suggestion.type;
+                    link.appendChild(badge);
+                }
+                item.appendChild(link);
+                menu.appendChild(item);
+            });
+            menu.classList.toggle('show', suggestions.length > 0);
+        }
+
+        input.addEventListener('input', function() {
+            var query = input.value.trim();
+            clearTimeout(timer);
+            if (query.length < 2) {
+                lastQuery = '';
+                hide();
+                return;
+            }
+            timer = setTimeout(function() {
+                if (query === lastQuery) {
+                    return;
+                }
+                lastQuery = query;
+                fetch(input.dataset.suggestUrl + '?q=' + encodeURIComponent(query))
+                    .then(function(response) { return response.json(); })
+                    .then(function(data) {
+                        if (data.query === input.value.trim()) {
+                            render(data.suggestions);
+                        }
+                    })
+                    .catch(hide);
+            }, 150);
+        });
+
+        input.addEventListener('keydown', function(event) {
+            if (event.key === 'Escape') {
+                hide();
+            }
+        });
+
+        document.addEventListener('click', function(event) {
+            if (!input.parentElement.contains(event.target)) {
+                hide();
+            }
+        });
+    });
+});
@@ -1,13 +1,17 @@
 from django.contrib import admin
-from django.http import HttpResponse
-from django.urls import path
-from django.shortcuts import render, redirect
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import messages
 import csv
-import pandas as pd
-from django.utils.text import slugify
 from mptt.admin import MPTTModelAdmin
-from .models import Product, Category, ProductImage, ProductReview
+from .models import Product, Category, ProductImage, ProductReview, InventoryReportRun, Job, StockLevel, StockLocation, ProductChangeSet
+from .jobs import enqueue
+from .inventory import run_report, stream_csv
+from .change_sets import end_change_set, retry_change_set
+from .reviews import invalidate_reviews
+from .stock import set_stock_counts
 
 
 class ProductImportExportAdmin(admin.ModelAdmin):
@@ -16,9 +20,10 @@ class ProductImportExportAdmin(admin.ModelAdmin):
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
-            path('import-products/', self.import_products, name='import_products'),
-            path('export-products/', self.export_products, name='export_products'),
-            path('download-template/', self.download_template, name='download_template'),
+            path('import-products/', self.admin_site.admin_view(self.import_products), name='import_products'),
+            path('export-products/', self.admin_site.admin_view(self.export_products), name='export_products'),
+            path('download-template/', self.admin_site.admin_view(self.download_template), name='download_template'),
+            path('inventory-report/', self.admin_site.admin_view(self.inventory_report), name='inventory_report'),
         ]
         return custom_urls + urls
 
@@ -31,71 +36,45 @@ class ProductImportExportAdmin(admin.ModelAdmin):
                 messages.error(request, 'Please select a file to import.')
                 return redirect('..')
 
-            try:
-                imported_count = 0
-                error_count = 0
-
-                if file_format == 'csv':
-                    decoded_file = file.read().decode('utf-8').splitlines()
-                    reader = csv.DictReader(decoded_file)
-                    for row in reader:
-                        if self.create_product_from_row(row):
-                            imported_count += 1
-                        else:
-                            error_count += 1
-
-                elif file_format == 'excel':
-                    df = pd.read_excel(file)
-                    for index, row in df.iterrows():
-                        if self.create_product_from_row(row.to_dict()):
-                            imported_count += 1
-                        else:
-                            error_count += 1
-
-                if imported_count > 0:
-                    messages.success(request, f'Successfully imported {imported_count} products.')
-                if error_count > 0:
-                    messages.warning(request, f'{error_count} products could not be imported.')
-
-            except Exception as e:
-                messages.error(request, f'Error importing products: {str(e)}')
-
-            return redirect('..')
+            job = enqueue(
+                'import_products',
+                options={'format': file_format, 'source_name': file.name,
+                         'resume': request.POST.get('restart') != '1'},
+                input_file=file,
+                user=request.user,
+            )
+            messages.info(request, f'Import of {file.name} queued as job #{job.pk}.')
+            return redirect('admin:store_job_change', job.pk)
 
         return render(request, 'admin/store/product/import_products.html')
 
     def export_products(self, request):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="products_export.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'name', 'slug', 'description', 'price', 'wholesale_price',
-            'category', 'product_type', 'brand', 'origin_country',
-            'weight', 'stock_quantity', 'is_available', 'is_wholesale',
-            'is_halal', 'is_vegetarian'
-        ])
-
-        products = Product.objects.all()
-        for product in products:
-            writer.writerow([
-                product.name,
-                product.slug,
-                product.description,
-                product.price,
-                product.wholesale_price,
-                product.category.name if product.category else '',
-                product.product_type,
-                product.brand,
-                product.origin_country,
-                product.weight,
-                product.stock_quantity,
-                product.is_available,
-                product.is_wholesale,
-                product.is_halal,
-                product.is_vegetarian,
-            ])
-
+        job = enqueue('export_products', user=request.user)
+        messages.info(request, f'Export queued as job #{job.pk}; download it here once it is done.')
+        return redirect('admin:store_job_change', job.pk)
+
+    def inventory_report(self, request):
+        # Starting a run moves the incremental window, so only a POST does it
+        if request.method != 'POST':
+            return render(request, 'admin/store/product/inventory_report.html')
+
+        report = request.POST.get('report', 'all')
+        if report not in ('low_stock', 'expiring', 'all'):
+            report = 'all'
+        try:
+            days = int(request.POST.get('days', 30))
+        except ValueError:
+            days = 30
+
+        run, rows = run_report(
+            report=report,
+            days=days,
+            incremental=request.POST.get('incremental') == '1',
+        )
+        response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+        response['Content-Disposition'] = (
+            f'attachment; filename="inventory_{report}_{run.started_at:%Y%m%d}.csv"'
+        )
         return response
 
     def download_template(self, request):
@@ -121,7 +100,7 @@ class ProductImportExportAdmin(admin.ModelAdmin):
                 f'Description for example product {i + 1}',
                 '10.99',
                 '8.99',
-                category.name,
+                category.path_names,
                 'grocery',
                 'Example Brand',
                 'India',
@@ -135,41 +114,12 @@ class ProductImportExportAdmin(admin.ModelAdmin):
 
         return response
 
-    def create_product_from_row(self, data):
-        try:
-            category_name = data.get('category', '').strip()
-            if not category_name:
-                return False
-
-            category = Category.objects.filter(name__iexact=category_name).first()
-            if not category:
-                return False
-
-            product, created = Product.objects.get_or_create(
-                name=data['name'].strip(),
-                defaults={
-                    'slug': data.get('slug', '').strip() or slugify(data['name']),
-                    'description': data.get('description', '').strip(),
-                    'price': float(data.get('price', 0)),
-                    'wholesale_price': float(data.get('wholesale_price', 0)) or None,
-                    'category': category,
-                    'product_type': data.get('product_type', 'grocery'),
-                    'origin_country': data.get('origin_country', '').strip(),
-                    'brand': data.get('brand', '').strip(),
-                    'weight': data.get('weight', '').strip(),
-                    'stock_quantity': int(data.get('stock_quantity', 0)),
-                    'is_available': data.get('is_available', 'True').lower() == 'true',
-                    'is_wholesale': data.get('is_wholesale', 'False').lower() == 'true',
-                    'is_halal': data.get('is_halal', 'False').lower() == 'true',
-                    'is_vegetarian': data.get('is_vegetarian', 'False').lower() == 'true',
-                }
-            )
 
-            return created
-
-        except Exception as e:
-            print(f"Error creating product: {str(e)}")
-            return False
+class StockLevelInline(admin.TabularInline):
+    model = StockLevel
+    extra = 0
+    fields = ['location', 'quantity', 'updated_at']
+    readonly_fields = ['updated_at']
 
 
 @admin.register(Product)
@@ -178,7 +128,8 @@ class ProductAdmin(ProductImportExportAdmin):
     list_filter = ['is_available', 'category', 'product_type', 'origin_country']
     search_fields = ['name', 'sku', 'brand']
     prepopulated_fields = {'slug': ('name',)}
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['stock_quantity', 'created_at', 'updated_at']
+    inlines = [StockLevelInline]
 
     fieldsets = (
         ('Basic Information', {
@@ -201,12 +152,32 @@ class ProductAdmin(ProductImportExportAdmin):
         }),
     )
 
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not StockLevel:
+            return super().save_formset(request, form, formset, change)
+        # Edited levels go through set_stock_counts() so stock_quantity moves
+        # by the same delta; a removed level is counted as zero
+        formset.save(commit=False)
+        product = form.instance
+        counts = {}
+        for level_form in formset.forms:
+            if not level_form.has_changed() or not level_form.cleaned_data:
+                continue
+            deleted = level_form in formset.deleted_forms
+            initial_location = level_form.initial.get('location')
+            location = level_form.cleaned_data.get('location')
+            if initial_location and (deleted or initial_location != location.pk):
+                counts[(product.pk, initial_location)] = 0
+            if not deleted:
+                counts[(product.pk, location.pk)] = level_form.cleaned_data['quantity']
+        set_stock_counts(counts)
+
 
 @admin.register(Category)
 class CategoryAdmin(MPTTModelAdmin):
-    list_display = ['name', 'slug', 'parent', 'is_active']
+    list_display = ['name', 'slug', 'path_names', 'is_active']
     list_filter = ['is_active', 'parent']
-    search_fields = ['name']
+    search_fields = ['name', 'path_names']
     prepopulated_fields = {'slug': ('name',)}
     mptt_level_indent = 20
 
@@ -220,4 +191,137 @@ class ProductImageInline(admin.TabularInline):
 class ProductReviewAdmin(admin.ModelAdmin):
     list_display = ['product', 'user', 'rating', 'is_approved', 'created_at']
     list_filter = ['rating', 'is_approved', 'created_at']
-    search_fields = ['product__name', 'user__username', 'title']
\ No newline at end of file
+    search_fields = ['product__name', 'user__username', 'title']
+    list_select_related = ['product', 'user']
+    actions = ['approve_reviews', 'reject_reviews']
+
+    def _set_approved(self, request, queryset, approved):
+        # One UPDATE for the whole selection; it bypasses signals, so the
+        # cached review pages are invalidated here
+        product_ids = set(queryset.values_list('product_id', flat=True))
+        updated = queryset.update(is_approved=approved)
+        invalidate_reviews(product_ids)
+        self.message_user(request, f"{updated} reviews {'approved' if approved else 'rejected'}.", messages.SUCCESS)
+
+    @admin.action(description='Approve selected reviews')
+    def approve_reviews(self, request, queryset):
+        self._set_approved(request, queryset, True)
+
+    @admin.action(description='Reject selected reviews')
+    def reject_reviews(self, request, queryset):
+        self._set_approved(request, queryset, False)
+
+
+@admin.register(StockLocation)
+class StockLocationAdmin(admin.ModelAdmin):
+    list_display = ['name', 'code', 'priority', 'is_active']
+    list_editable = ['priority', 'is_active']
+    prepopulated_fields = {'code': ('name',)}
+
+
+@admin.register(ProductChangeSet)
+class ProductChangeSetAdmin(admin.ModelAdmin):
+    list_display = ['name', 'starts_at', 'ends_at', 'status', 'product_count']
+    list_filter = ['status']
+    search_fields = ['name', 'brand']
+    date_hierarchy = 'starts_at'
+    status_fields = ['status', 'product_count', 'applied_at', 'reverted_at', 'error', 'created_by']
+    actions = ['retry_change_sets', 'end_change_sets']
+
+    fieldsets = (
+        (None, {
+            'fields': ('name', 'starts_at', 'ends_at')
+        }),
+        ('Products', {
+            'fields': ('category', 'brand', 'skus')
+        }),
+        ('Changes', {
+            'fields': ('price_mode', 'price_value', 'is_available', 'is_featured', 'is_bestseller')
+        }),
+        ('Status', {
+            'fields': status_fields
+        }),
+    )
+
+    def get_readonly_fields(self, request, obj=None):
+        # Once the runner has started on a set, its items record what it did;
+        # a retried set is scheduled again but may already have items
+        if obj is not None and (obj.status != 'scheduled' or obj.items.exists()):
+            return [field for fieldset in self.fieldsets for field in fieldset[1]['fields']]
+        return self.status_fields
+
+    @admin.action(description='Retry selected failed change sets')
+    def retry_change_sets(self, request, queryset):
+        retried = sum(retry_change_set(change_set) for change_set in queryset)
+        self.message_user(request, f'{retried} change sets queued for the runner again.', messages.SUCCESS)
+
+    @admin.action(description='End selected change sets now and revert them')
+    def end_change_sets(self, request, queryset):
+        ended = sum(end_change_set(change_set) for change_set in queryset)
+        self.message_user(request, f'{ended} change sets will be reverted on the next run.', messages.SUCCESS)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(InventoryReportRun)
+class InventoryReportRunAdmin(admin.ModelAdmin):
+    list_display = ['report', 'started_at', 'finished_at', 'row_count']
+    list_filter = ['report']
+    readonly_fields = ['report', 'started_at', 'finished_at', 'row_count']
+
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'kind', 'status', 'progress', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status']
+    fields = ['kind', 'status', 'progress', 'message', 'download', 'options', 'input_download',
+              'created_by', 'worker', 'created_at', 'started_at', 'heartbeat_at', 'finished_at', 'error']
+    readonly_fields = fields
+    # Job files are in private storage; this is their only way out
+    FILE_FIELDS = {'input': 'input_file', 'result': 'result_file'}
+
+    def get_urls(self):
+        return [
+            path('<int:job_id>/file/<str:which>/', self.admin_site.admin_view(self.download_file),
+                 name='store_job_file'),
+        ] + super().get_urls()
+
+    def download_file(self, request, job_id, which):
+        job = get_object_or_404(Job, pk=job_id)
+        if which not in self.FILE_FIELDS or not self.has_view_permission(request, job):
+            raise Http404
+        file = getattr(job, self.FILE_FIELDS[which])
+        if not file:
+            raise Http404
+        return FileResponse(file.open('rb'), as_attachment=True, filename=file.name.rsplit('/', 1)[-1])
+
+    def _file_link(self, obj, which):
+        file = getattr(obj, self.FILE_FIELDS[which])
+        if not file:
+            return '-'
+        url = reverse('admin:store_job_file', args=[obj.pk, which])
+        return format_html('<a href="{}">{}</a>', url, file.name.rsplit('/', 1)[-1])
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Progress')
+    def progress(self, obj):
+        if obj.rows_total:
+            return f'{obj.rows_done} / {obj.rows_total} rows'
+        return f'{obj.rows_done} rows'
+
+    @admin.display(description='Result')
+    def download(self, obj):
+        return self._file_link(obj, 'result')
+
+    @admin.display(description='Input file')
+    def input_download(self, obj):
+        return self._file_link(obj, 'input')
@@ -0,0 +1,212 @@
+"""
+Read-only JSON catalogue API.
+
+Rows are serialised straight from values() so large pages never build model
+instances. Every endpoint supports ``?fields=`` (sparse fieldsets, only the
+requested columns are selected) and ``?ids=``/``?slugs=`` batch lookups;
+product listings use keyset pagination on id. Responses carry an ETag derived
+from the catalogue version and the request, so unchanged conditional requests
+get a 304 without touching the database.
+"""
+import hashlib
+
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from .catalogue import get_catalogue_version
+from .models import Category, Product
+
+
+# API field name -> ORM field
+PRODUCT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'slug': 'slug',
+    'description': 'description',
+    'category': 'category_id',
+    'category_path': 'category_path',
+    'product_type': 'product_type',
+    'price': 'price',
+    'wholesale_price': 'wholesale_price',
+    'wholesale_min_quantity': 'wholesale_min_quantity',
+    'sku': 'sku',
+    'stock_quantity': 'stock_quantity',
+    'weight': 'weight',
+    'weight_unit': 'weight_unit',
+    'unit_price': 'unit_price',
+    'unit_price_unit': 'unit_price_unit',
+    'brand': 'brand',
+    'origin_country': 'origin_country',
+    'is_halal': 'is_halal',
+    'is_vegetarian': 'is_vegetarian',
+    'is_featured': 'is_featured',
+    'is_bestseller': 'is_bestseller',
+    'main_image': 'main_image',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+PRODUCT_DEFAULT_FIELDS = ['id', 'name', 'slug', 'category', 'price', 'brand', 'main_image']
+
+CATEGORY_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'slug': 'slug',
+    'description': 'description',
+    'parent': 'parent_id',
+    'path': 'path',
+    'level': 'level',
+    'image': 'image',
+}
+CATEGORY_DEFAULT_FIELDS = ['id', 'name', 'slug', 'parent']
+
+IMAGE_FIELDS = {'main_image', 'image'}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BATCH_SIZE = 200
+
+
+class ApiError(Exception):
+    pass
+
+
+def catalogue_etag(request, *args, **kwargs):
+    key = f'{get_catalogue_version()}:{request.get_full_path()}'
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def api_view(view):
+    """GET-only, ETag-conditional JSON view; ApiError becomes a 400 response"""
+    @require_GET
+    @condition(etag_func=catalogue_etag)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return wrapper
+
+
+def _csv_param(request, name):
+    return [value.strip() for value in request.GET.get(name, '').split(',') if value.strip()]
+
+
+def _int_param(request, name, default, minimum=None, maximum=None):
+    try:
+        value = int(request.GET.get(name, default))
+    except (TypeError, ValueError):
+        raise ApiError(f'{name} must be an integer')
+    if minimum is not None:
+        value = max(value, minimum)
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
+
+
+def _selected_fields(request, available, default):
+    """Map ``?fields=`` to ``(api_names, orm_fields)``, always including id"""
+    names = _csv_param(request, 'fields') or default
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError(f'Unknown fields: {", ".join(unknown)}')
+    if 'id' not in names:
+        names = ['id', *names]
+    return names, [available[name] for name in names]
+
+
+def _serialise(rows, names, orm_fields):
+    image_columns = [
+        (name, orm_field) for name, orm_field in zip(names, orm_fields) if name in IMAGE_FIELDS
+    ]
+    results = []
+    for row in rows:
+        item = {name: row[orm_field] for name, orm_field in zip(names, orm_fields)}
+        for name, orm_field in image_columns:
+            item[name] = default_storage.url(row[orm_field]) if row[orm_field] else None
+        results.append(item)
+    return results
+
+
+def _apply_batch(queryset, request):
+    """Restrict ``queryset`` to ``?ids=`` / ``?slugs=``; returns None when neither is given"""
+    ids, slugs = _csv_param(request, 'ids'), _csv_param(request, 'slugs')
+    if not ids and not slugs:
+        return None
+    if len(ids) + len(slugs) > MAX_BATCH_SIZE:
+        raise ApiError(f'At most {MAX_BATCH_SIZE} ids and slugs per request')
+    try:
+        ids = [int(value) for value in ids]
+    except ValueError:
+        raise ApiError('ids must be integers')
+    if ids and slugs:
+        return queryset.filter(id__in=ids) | queryset.filter(slug__in=slugs)
+    if ids:
+        return queryset.filter(id__in=ids)
+    return queryset.filter(slug__in=slugs)
+
+
+@api_view
+def product_list(request):
+    """Available products, keyset-paginated on id (?after=<id>&limit=)"""
+    names, orm_fields = _selected_fields(request, PRODUCT_FIELDS, PRODUCT_DEFAULT_FIELDS)
+    products = Product.objects.filter(is_available=True)
+
+    category_slug = request.GET.get('category')
+    if category_slug:
+        category = Category.objects.filter(slug=category_slug).first()
+        if category is None:
+            return JsonResponse({'error': f'Unknown category: {category_slug}'}, status=404)
+        products = products.in_category(category)
+
+    batch = _apply_batch(products, request)
+    if batch is not None:
+        rows = batch.order_by('id').values(*orm_fields)
+        return JsonResponse({'results': _serialise(rows, names, orm_fields)})
+
+    limit = _int_param(request, 'limit', DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    after = _int_param(request, 'after', 0)
+    rows = list(products.filter(id__gt=after).order_by('id').values(*orm_fields)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_url = None
+    if has_more:
+        params = request.GET.copy()
+        params['after'] = rows[-1]['id']
+        next_url = f'{request.path}?{params.urlencode()}'
+    return JsonResponse({'results': _serialise(rows, names, orm_fields), 'next': next_url})
+
+
+@api_view
+def category_list(request):
+    """Active categories in tree order"""
+    names, orm_fields = _selected_fields(request, CATEGORY_FIELDS, CATEGORY_DEFAULT_FIELDS)
+    categories = Category.objects.filter(is_active=True)
+    batch = _apply_batch(categories, request)
+    if batch is not None:
+        categories = batch
+    rows = categories.order_by('tree_id', 'lft').values(*orm_fields)
+    return JsonResponse({'results': _serialise(rows, names, orm_fields)})
+
+
+@api_view
+def category_tree(request):
+    """Nested category tree built from a single query"""
+    rows = (
+        Category.objects.filter(is_active=True)
+        .order_by('tree_id', 'lft')
+        .values('id', 'name', 'slug', 'parent_id')
+    )
+    nodes, roots = {}, []
+    for row in rows:
+        node = {'id': row['id'], 'name': row['name'], 'slug': row['slug'], 'children': []}
+        nodes[row['id']] = node
+        parent = nodes.get(row['parent_id'])
+        if parent is not None:
+            parent['children'].append(node)
+        elif row['parent_id'] is None:
+            roots.append(node)
+    return JsonResponse({'results': roots})
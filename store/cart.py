@@ -1,15 +1,30 @@
 from decimal import Decimal
 from django.conf import settings
+from accounts.cart import PersistentCart
 from store.models import Product
 
 
+def get_cart(request):
+    """
+    The request's cart, created once per request: a PersistentCart for
+    logged-in users, the session Cart for everyone else.
+    """
+    cart = getattr(request, '_cart', None)
+    if cart is None:
+        if request.user.is_authenticated:
+            cart = PersistentCart(request.user)
+        else:
+            cart = Cart(request)
+        request._cart = cart
+    return cart
+
+
 class Cart:
     def __init__(self, request):
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        # Only stored in the session once something is added, so browsing
+        # with an empty cart never forces a session write
+        self.cart = self.session.get(settings.CART_SESSION_ID) or {}
 
     def add(self, product, quantity=1, override_quantity=False):
         product_id = str(product.id)
@@ -26,6 +41,7 @@ class Cart:
         self.save()
 
     def save(self):
+        self.session[settings.CART_SESSION_ID] = self.cart
         self.session.modified = True
 
     def remove(self, product):
@@ -36,7 +52,8 @@ class Cart:
 
     def __iter__(self):
         product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
+        # No ordering: the default -created_at would add a sort to a primary key lookup
+        products = Product.objects.filter(id__in=product_ids).order_by()
         cart = self.cart.copy()
         for product in products:
             cart[str(product.id)]['product'] = product
@@ -52,5 +69,5 @@ class Cart:
         return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
 
     def clear(self):
-        del self.session[settings.CART_SESSION_ID]
-        self.save()
\ No newline at end of file
+        self.session.pop(settings.CART_SESSION_ID, None)
+        self.cart = {}
\ No newline at end of file
@@ -0,0 +1,33 @@
+import time
+
+from django.db.models import F
+
+from .models import CatalogueVersion
+
+
+VERSION_ROW = 1
+
+
+def get_catalogue_version():
+    """
+    Current catalogue version, an opaque integer that changes whenever the
+    catalogue does. Per-process snapshots and cache keys derived from the
+    catalogue compare against it instead of re-reading the catalogue. It is
+    a row in the primary database, not a cache entry, so every process sees
+    the same value and a full cache cannot evict it.
+    """
+    version = CatalogueVersion.objects.filter(pk=VERSION_ROW).values_list('version', flat=True).first()
+    if version is None:
+        # Seed from the clock so a recreated row never repeats an old version
+        version = CatalogueVersion.objects.get_or_create(
+            pk=VERSION_ROW, defaults={'version': int(time.time() * 1000)},
+        )[0].version
+    return version
+
+
+def bump_catalogue_version():
+    """Invalidate everything keyed on the catalogue version"""
+    if not CatalogueVersion.objects.filter(pk=VERSION_ROW).update(version=F('version') + 1):
+        get_catalogue_version()
+        CatalogueVersion.objects.filter(pk=VERSION_ROW).update(version=F('version') + 1)
+    return get_catalogue_version()
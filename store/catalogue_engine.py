@@ -0,0 +1,220 @@
+"""
+Optional in-process columnar snapshot of the filterable Product columns.
+
+With CATALOGUE_ENGINE_ENABLED, product_list and category_products answer
+filter + sort + paginate from NumPy arrays held per worker: filters are
+vectorised boolean masks and every sort order is a precomputed permutation,
+so a query is a few O(n) array operations and only the requested page's
+rows are fetched from the database. The snapshot follows the catalogue
+version; when it moves, changed products are read from the change feed and
+patched in, and category changes (which can shift MPTT ranges) trigger a
+full reload. Queries the engine cannot answer (text search) fall back to SQL.
+`manage.py benchmark_listing` times both paths on the current catalogue.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from sr_supermarkt.db_router import use_primary
+
+from .catalogue import get_catalogue_version
+from .changefeed import changes_since, latest_cursor
+from .models import Product
+
+
+SORT_KEYS = ('name', 'price_low', 'price_high', 'newest', 'unit_price')
+
+_COLUMNS = [
+    'id', 'price', 'is_available', 'is_halal', 'is_vegetarian',
+    'category__tree_id', 'category__lft', 'created_at', 'name', 'unit_price',
+]
+
+
+class CatalogueSnapshot:
+    COLUMNS = (
+        'ids', 'price', 'is_available', 'is_halal', 'is_vegetarian', 'tree_id', 'lft', 'created', 'names',
+        'unit_price',
+    )
+
+    def __init__(self, columns, cursor):
+        import numpy as np
+
+        self.cursor = cursor
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+
+        # One permutation per sort order, ties broken by id in the direction
+        # of the sort, like ProductQuerySet.sorted_by()
+        self.orders = {
+            'name': np.lexsort((self.ids, self.names)),
+            'price_low': np.lexsort((self.ids, self.price)),
+            'price_high': np.lexsort((-self.ids, -self.price)),
+            'newest': np.lexsort((-self.ids, -self.created)),
+            # NaN (no unit price) sorts last
+            'unit_price': np.lexsort((self.ids, self.unit_price)),
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def columns_from_rows(rows):
+        import numpy as np
+
+        rows = list(rows)
+        return {
+            'ids': np.array([row[0] for row in rows], dtype=np.int64),
+            'price': np.array([float(row[1]) for row in rows], dtype=np.float64),
+            'is_available': np.array([row[2] for row in rows], dtype=bool),
+            'is_halal': np.array([row[3] for row in rows], dtype=bool),
+            'is_vegetarian': np.array([row[4] for row in rows], dtype=bool),
+            'tree_id': np.array([row[5] for row in rows], dtype=np.int64),
+            'lft': np.array([row[6] for row in rows], dtype=np.int64),
+            'created': np.array([row[7].timestamp() for row in rows], dtype=np.float64),
+            'names': np.array([row[8] for row in rows], dtype=str),
+            'unit_price': np.array(
+                [float(row[9]) if row[9] is not None else np.nan for row in rows], dtype=np.float64
+            ),
+        }
+
+    @classmethod
+    def load(cls):
+        # Read the cursor first: changes racing with the load are re-applied later
+        cursor = latest_cursor()
+        rows = Product.objects.order_by().values_list(*_COLUMNS).iterator(chunk_size=5000)
+        return cls(cls.columns_from_rows(rows), cursor)
+
+    def patched(self, product_ids, cursor):
+        """A new snapshot with ``product_ids`` re-read from the database (or dropped if deleted)"""
+        import numpy as np
+
+        keep = ~np.isin(self.ids, np.fromiter(product_ids, dtype=np.int64))
+        fresh = self.columns_from_rows(
+            Product.objects.filter(id__in=product_ids).order_by().values_list(*_COLUMNS)
+        )
+        columns = {
+            name: np.concatenate([getattr(self, name)[keep], fresh[name]]) for name in self.COLUMNS
+        }
+        return CatalogueSnapshot(columns, cursor)
+
+    def product_ids(self, category=None, min_price=None, max_price=None, min_unit_price=None,
+                    max_unit_price=None, halal=False, vegetarian=False, sort_by='name'):
+        """Ids of available products matching the filters, in ``sort_by`` order"""
+        mask = self.is_available.copy()
+        if category is not None:
+            mask &= (self.tree_id == category.tree_id) & (self.lft >= category.lft) & (self.lft <= category.rght)
+        if min_price is not None:
+            mask &= self.price >= float(min_price)
+        if max_price is not None:
+            mask &= self.price <= float(max_price)
+        if min_unit_price is not None:
+            mask &= self.unit_price >= float(min_unit_price)
+        if max_unit_price is not None:
+            mask &= self.unit_price <= float(max_unit_price)
+        if halal:
+            mask &= self.is_halal
+        if vegetarian:
+            mask &= self.is_vegetarian
+        order = self.orders.get(sort_by, self.orders['name'])
+        return self.ids[order[mask[order]]]
+
+
+class ProductPage:
+    """
+    Sequence of products over an id array for Paginator: len() is free and
+    slicing fetches only that slice's products, in snapshot order.
+    """
+
+    def __init__(self, ids, queryset=None):
+        self.ids = ids
+        self.queryset = queryset if queryset is not None else Product.objects.all()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def count(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        page_ids = [int(product_id) for product_id in self.ids[index]]
+        products = self.queryset.in_bulk(page_ids)
+        return [products[product_id] for product_id in page_ids if product_id in products]
+
+
+class CatalogueEngine:
+    # Above this share of changed rows a full reload is cheaper than patching
+    FULL_RELOAD_RATIO = 0.2
+
+    def __init__(self):
+        self.snapshot = None
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def current(self):
+        """The up-to-date snapshot, refreshed at most once per check interval"""
+        now = time.monotonic()
+        if self.snapshot is not None and now - self.checked_at < settings.CATALOGUE_ENGINE_CHECK_INTERVAL:
+            return self.snapshot
+
+        version = get_catalogue_version()
+        self.checked_at = now
+        if self.snapshot is not None and version == self.version:
+            return self.snapshot
+
+        # Read from the primary: a lagging replica would pin stale rows to this version
+        with self.lock, use_primary():
+            if self.snapshot is None or self.version != version:
+                self.snapshot = self.refresh(self.snapshot)
+                self.version = version
+        return self.snapshot
+
+    def refresh(self, snapshot):
+        if snapshot is None:
+            return CatalogueSnapshot.load()
+
+        # Every committed change is patched in, but the cursor only moves past
+        # settled ones: the rest are read again next time, in case a change
+        # with a lower seq commits late (see store.changefeed._settled)
+        product_ids, cursor = set(), snapshot.cursor
+        settled_cursor, settled = cursor, True
+        settled_before = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_LAG)
+        limit = max(int(len(snapshot) * self.FULL_RELOAD_RATIO), 100)
+        while True:
+            changes, cursor = changes_since(cursor, limit=1000, models=['product', 'category'], lag=0)
+            if any(change['model'] == 'category' for change in changes):
+                return CatalogueSnapshot.load()
+            product_ids.update(change['object_id'] for change in changes)
+            if len(product_ids) > limit:
+                return CatalogueSnapshot.load()
+            for change in changes:
+                settled = settled and change['changed_at'] < settled_before
+                if settled:
+                    settled_cursor = change['seq']
+            if len(changes) < 1000:
+                break
+        if not product_ids:
+            return snapshot
+        return snapshot.patched(product_ids, settled_cursor)
+
+
+_engine = None
+
+
+def get_catalogue_engine():
+    """The per-process engine, or None when disabled or NumPy is not installed"""
+    global _engine
+    if not getattr(settings, 'CATALOGUE_ENGINE_ENABLED', False):
+        return None
+    if _engine is None:
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            return None
+        _engine = CatalogueEngine()
+    return _engine
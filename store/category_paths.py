@@ -0,0 +1,111 @@
+"""
+Materialised category paths.
+
+Every Category stores its root-to-self path (ids, slugs and names) and every
+Product a copy of its category's path, so breadcrumbs, exports and imports
+never walk the tree. Saving or moving a category whose path no longer
+matches recomputes its whole subtree from one ordered query, writes the
+categories back with bulk_update and mirrors the new paths onto products
+with one UPDATE per changed category. Neither write runs signals, so the
+changed categories and products are recorded in the change feed directly.
+"""
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from .changefeed import record_changes
+from .models import Category, Product
+
+
+PATH_SEPARATOR = ' > '
+
+
+def path_entry(category):
+    return {'id': category.pk, 'slug': category.slug, 'name': category.name}
+
+
+def join_names(path):
+    return PATH_SEPARATOR.join(entry['name'] for entry in path)
+
+
+def path_is_stale(category):
+    """True when the category's stored path does not end in its own name, slug and parent"""
+    path = category.path
+    if not path or path[-1] != path_entry(category):
+        return True
+    parent_id = path[-2]['id'] if len(path) > 1 else None
+    return parent_id != category.parent_id
+
+
+def refresh_subtree(category, batch_size=500):
+    """Recompute the paths of ``category`` and its descendants; returns the number changed"""
+    root = Category.objects.only('tree_id', 'lft', 'rght', 'parent_id').get(pk=category.pk)
+    parent_path = []
+    if root.parent_id:
+        parent_path = Category.objects.values_list('path', flat=True).get(pk=root.parent_id)
+
+    rows = (
+        Category.objects.filter(tree_id=root.tree_id, lft__gte=root.lft, lft__lte=root.rght)
+        .order_by('lft')
+        .values_list('id', 'parent_id', 'slug', 'name', 'path')
+    )
+    paths = {root.parent_id: parent_path}
+    changed = []
+    for category_id, parent_id, slug, name, old_path in rows:
+        path = paths[parent_id] + [{'id': category_id, 'slug': slug, 'name': name}]
+        paths[category_id] = path
+        if path != old_path:
+            changed.append(Category(pk=category_id, path=path, path_names=join_names(path)))
+
+    with transaction.atomic():
+        Category.objects.bulk_update(changed, ['path', 'path_names'], batch_size=batch_size)
+        product_ids = []
+        for changed_category in changed:
+            products = Product.objects.filter(category_id=changed_category.pk)
+            product_ids.extend(products.order_by().values_list('id', flat=True))
+            products.update(category_path=changed_category.path)
+        record_changes('category', [changed_category.pk for changed_category in changed])
+        record_changes('product', product_ids)
+
+    category.path = paths[category.pk]
+    category.path_names = join_names(category.path)
+    return len(changed)
+
+
+def rebuild_all():
+    """Recompute every path, e.g. after bulk tree changes that bypass signals"""
+    return sum(refresh_subtree(root) for root in Category.objects.filter(parent__isnull=True))
+
+
+def resolve_categories(values):
+    """
+    Map category column values to categories, case-insensitively.
+
+    A value containing '>' is matched against the full path;
+    a bare name only resolves when exactly one category has that name.
+    Returns ``(categories, ambiguous)``: a dict keyed by lower-cased value
+    and the set of lower-cased names shared by several categories.
+    """
+    values = {value.lower() for value in values}
+    paths = {value for value in values if '>' in value}
+    names = values - paths
+
+    categories, ambiguous = {}, set()
+    if paths:
+        # Tolerate 'Indian>Rice & Flour' and other spacing around the separator
+        normalised = {value: join_names({'name': part.strip()} for part in value.split('>')) for value in paths}
+        found = {
+            category.lower_path: category
+            for category in Category.objects.annotate(lower_path=Lower('path_names'))
+            .filter(lower_path__in=set(normalised.values())).order_by()
+        }
+        for value, path in normalised.items():
+            if path in found:
+                categories[value] = found[path]
+    if names:
+        for category in Category.objects.annotate(lower_name=Lower('name')).filter(lower_name__in=names).order_by():
+            if category.lower_name in categories:
+                ambiguous.add(category.lower_name)
+            categories[category.lower_name] = category
+        for name in ambiguous:
+            del categories[name]
+    return categories, ambiguous
@@ -0,0 +1,234 @@
+"""
+Scheduled bulk price and flag changes (ProductChangeSet).
+
+``manage.py run_change_sets`` applies change sets whose start has passed and
+reverts those whose end has, from cron or in a loop with --watch. Products
+are handled a chunk at a time in id order, each chunk one transaction that
+snapshots the current values into ProductChangeSetItem, writes the chunk
+with bulk_update() (an UPDATE ... SET price = CASE id WHEN ... END, instead
+of a save() per product) and records it in the change feed, so catalogue
+caches are invalidated once per chunk rather than once per product.
+Product.save() and its signals do not run; unit prices are recomputed here.
+
+Reverting restores only what is still as the change set left it: a price or
+flag edited since, by hand or by a later change set, is kept. Sets are
+claimed with a conditional UPDATE of their status and send a heartbeat per
+chunk; one whose runner stopped is picked up again after STALE_AFTER,
+applying from the first product it had not reached yet.
+
+A set that fails is left 'failed' with the chunks it committed in place.
+Once its end passes the runner reverts what it did like any active set;
+before that, retry_change_set() puts it back in the runner's queue (an
+apply resumes where it stopped) and end_change_set() has it reverted on the
+next run. The admin offers both as actions.
+"""
+import csv
+import io
+import traceback
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from sr_supermarkt.db_router import use_primary
+
+from .changefeed import record_changes
+from .models import Product, ProductChangeSet, ProductChangeSetItem
+
+
+DEFAULT_BATCH_SIZE = 500
+STALE_AFTER = timedelta(minutes=10)
+CENT = Decimal('0.01')
+
+
+def parse_skus(text):
+    """SKUs from a comma or newline separated list, or from CSV text with a sku column"""
+    rows = [row for row in csv.reader(io.StringIO(text.strip())) if any(cell.strip() for cell in row)]
+    header = [cell.strip().lower() for cell in rows[0]] if rows else []
+    if 'sku' in header:
+        column = header.index('sku')
+        return [row[column].strip() for row in rows[1:] if len(row) > column and row[column].strip()]
+    return [cell.strip() for row in rows for cell in row if cell.strip()]
+
+
+def scope(change_set):
+    """The products a change set covers"""
+    products = Product.objects.all()
+    if change_set.category_id:
+        return products.in_category(change_set.category)
+    if change_set.brand.strip():
+        return products.filter(brand__iexact=change_set.brand.strip())
+    return products.filter(sku__in=parse_skus(change_set.skus))
+
+
+def changed_price(change_set, price):
+    value = change_set.price_value
+    if change_set.price_mode == 'percent':
+        price = price * (100 + value) / 100
+    elif change_set.price_mode == 'amount':
+        price = price + value
+    elif change_set.price_mode == 'fixed':
+        price = value
+    return max(price.quantize(CENT, ROUND_HALF_UP), CENT)
+
+
+def _update_fields(change_set):
+    fields = list(change_set.flag_changes())
+    if change_set.price_mode:
+        fields += ['price', 'unit_price', 'unit_price_unit']
+    return fields + ['updated_at']
+
+
+def _locked_products(product_ids):
+    return Product.objects.select_for_update().only(
+        'price', 'weight', 'weight_unit', *ProductChangeSet.FLAG_FIELDS,
+    ).filter(pk__in=product_ids).order_by('pk')
+
+
+def _write(products, fields):
+    if products:
+        Product.objects.bulk_update(products, fields)
+        record_changes('product', [product.pk for product in products])
+
+
+def _apply_chunk(change_set, product_ids, now):
+    flags = change_set.flag_changes()
+    products, items = list(_locked_products(product_ids)), []
+    for product in products:
+        item = ProductChangeSetItem(
+            change_set=change_set, product_id=product.pk, old_price=product.price, new_price=product.price,
+            **{f'old_{name}': getattr(product, name) for name in ProductChangeSet.FLAG_FIELDS},
+        )
+        if change_set.price_mode:
+            product.price = item.new_price = changed_price(change_set, product.price)
+            product.set_unit_price()
+        for name, value in flags.items():
+            setattr(product, name, value)
+        product.updated_at = now
+        items.append(item)
+    ProductChangeSetItem.objects.bulk_create(items)
+    _write(products, _update_fields(change_set))
+    return len(products)
+
+
+def _revert_chunk(change_set, items, now):
+    flags = change_set.flag_changes()
+    products = {product.pk: product for product in _locked_products([item.product_id for item in items])}
+    reverted = []
+    for item in items:
+        product = products.get(item.product_id)
+        if product is None:
+            continue
+        changed = False
+        if change_set.price_mode and product.price == item.new_price != item.old_price:
+            product.price = item.old_price
+            product.set_unit_price()
+            changed = True
+        for name, value in flags.items():
+            old = getattr(item, f'old_{name}')
+            if getattr(product, name) == value != old:
+                setattr(product, name, old)
+                changed = True
+        if changed:
+            product.updated_at = now
+            reverted.append(product)
+    _write(reverted, _update_fields(change_set))
+    return len(reverted)
+
+
+def _claim(change_set, from_status, to_status, now):
+    """Move the set to ``to_status`` unless another runner got there first (or went stale)"""
+    claimable = Q(status=from_status) | Q(status=to_status, heartbeat_at__lt=now - STALE_AFTER)
+    return ProductChangeSet.objects.filter(claimable, pk=change_set.pk).update(status=to_status, heartbeat_at=now)
+
+
+def _heartbeat(change_set):
+    ProductChangeSet.objects.filter(pk=change_set.pk).update(heartbeat_at=timezone.now())
+
+
+def apply_change_set(change_set, batch_size=DEFAULT_BATCH_SIZE):
+    """Apply the change to every product in scope; returns the number of products changed"""
+    products = scope(change_set).order_by('pk')
+    # Resume after the products a stopped runner already did
+    cursor = change_set.items.aggregate(last=Max('product_id'))['last'] or 0
+    while True:
+        product_ids = list(products.filter(pk__gt=cursor).values_list('pk', flat=True)[:batch_size])
+        if not product_ids:
+            break
+        with transaction.atomic():
+            _apply_chunk(change_set, product_ids, timezone.now())
+        cursor = product_ids[-1]
+        _heartbeat(change_set)
+    count = change_set.items.count()
+    ProductChangeSet.objects.filter(pk=change_set.pk).update(
+        status='active', applied_at=timezone.now(), product_count=count,
+    )
+    return count
+
+
+def revert_change_set(change_set, batch_size=DEFAULT_BATCH_SIZE):
+    """Undo the change where it is still in place; returns the number of products reverted"""
+    items = change_set.items.order_by('product_id')
+    cursor, reverted = 0, 0
+    while True:
+        chunk = list(items.filter(product_id__gt=cursor)[:batch_size])
+        if not chunk:
+            break
+        with transaction.atomic():
+            reverted += _revert_chunk(change_set, chunk, timezone.now())
+        cursor = chunk[-1].product_id
+        _heartbeat(change_set)
+    ProductChangeSet.objects.filter(pk=change_set.pk).update(status='reverted', reverted_at=timezone.now())
+    return reverted
+
+
+def _run(change_set, action, batch_size, log):
+    verb = 'Applied' if action is apply_change_set else 'Reverted'
+    try:
+        count = action(change_set, batch_size)
+    except Exception:
+        ProductChangeSet.objects.filter(pk=change_set.pk).update(status='failed', error=traceback.format_exc())
+        log(f'{change_set} failed:\n{traceback.format_exc()}')
+        return
+    log(f'{verb} {change_set}: {count} products')
+
+
+def retry_change_set(change_set):
+    """Queue a failed set again: an apply carries on from where it stopped, a revert starts over"""
+    status = 'active' if change_set.applied_at else 'scheduled'
+    return ProductChangeSet.objects.filter(pk=change_set.pk, status='failed').update(status=status, error='')
+
+
+def end_change_set(change_set, now=None):
+    """End an active or failed set now, so the next run reverts it"""
+    return ProductChangeSet.objects.filter(pk=change_set.pk, status__in=['active', 'failed']).update(
+        ends_at=now or timezone.now(),
+    )
+
+
+def run_due_change_sets(now=None, batch_size=DEFAULT_BATCH_SIZE, log=print):
+    """Apply and revert every change set that is due; returns the number handled"""
+    now = now or timezone.now()
+    stale = now - STALE_AFTER
+    handled = 0
+    with use_primary():
+        due_to_apply = ProductChangeSet.objects.filter(
+            Q(status='scheduled') | Q(status='applying', heartbeat_at__lt=stale), starts_at__lte=now,
+        ).order_by('starts_at', 'pk')
+        for change_set in due_to_apply:
+            if _claim(change_set, 'scheduled', 'applying', now):
+                _run(change_set, apply_change_set, batch_size, log)
+                handled += 1
+
+        # Failed sets too: whatever part of the change went in comes out again
+        due_to_revert = ProductChangeSet.objects.filter(
+            Q(status__in=['active', 'failed']) | Q(status='reverting', heartbeat_at__lt=stale), ends_at__lte=now,
+        ).order_by('ends_at', 'pk')
+        for change_set in due_to_revert:
+            from_status = 'failed' if change_set.status == 'failed' else 'active'
+            if _claim(change_set, from_status, 'reverting', now):
+                _run(change_set, revert_change_set, batch_size, log)
+                handled += 1
+    return handled
@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from .catalogue import bump_catalogue_version
+from .models import CatalogueChange
+
+
+CHANGE_FIELDS = ['seq', 'model', 'object_id', 'action', 'changed_at']
+
+
+def record_change(model, object_id, action='save'):
+    """Append a single change and invalidate catalogue caches once the transaction commits"""
+    change = CatalogueChange.objects.create(model=model, object_id=object_id, action=action)
+    transaction.on_commit(bump_catalogue_version)
+    return change
+
+
+def record_changes(model, object_ids, action='save', batch_size=1000):
+    """
+    Append changes for many objects of one model in bulk.
+
+    For bulk updates that bypass Model.save() and its signals, e.g.
+    ``QuerySet.update()``; the catalogue version is bumped once, not per row.
+    """
+    changes = [
+        CatalogueChange(model=model, object_id=object_id, action=action)
+        for object_id in object_ids
+    ]
+    if changes:
+        CatalogueChange.objects.bulk_create(changes, batch_size=batch_size)
+        transaction.on_commit(bump_catalogue_version)
+    return len(changes)
+
+
+def _settled(changes, lag):
+    """
+    Only changes older than ``lag`` seconds (CHANGE_FEED_LAG by default).
+
+    A seq is handed out when its row is inserted, not when the transaction
+    commits, so on a database with concurrent writers (PostgreSQL, MySQL) a
+    change can become visible after one with a higher seq has been read,
+    and a consumer past that seq would skip it for good. Holding recent
+    rows back gives such transactions time to commit; one that stays open
+    longer than the lag can still be skipped. SQLite serialises writers.
+    """
+    lag = settings.CHANGE_FEED_LAG if lag is None else lag
+    if lag:
+        changes = changes.filter(changed_at__lt=timezone.now() - timedelta(seconds=lag))
+    return changes
+
+
+def latest_cursor(lag=None):
+    """Seq of the newest settled change, or 0 when there is none"""
+    return _settled(CatalogueChange.objects.all(), lag).aggregate(seq=Max('seq'))['seq'] or 0
+
+
+def changes_since(cursor=0, limit=500, models=None, lag=None):
+    """
+    Return ``(changes, next_cursor)`` for up to ``limit`` changes after ``cursor``.
+
+    Changes are dicts ordered by seq; pass ``next_cursor`` back in to fetch
+    the following batch. When nothing is left, ``next_cursor == cursor``.
+    Changes younger than ``lag`` seconds are not returned yet (see _settled()).
+    """
+    changes = _settled(CatalogueChange.objects.filter(seq__gt=cursor), lag)
+    if models:
+        changes = changes.filter(model__in=models)
+    rows = list(changes.order_by('seq').values(*CHANGE_FIELDS)[:limit])
+    next_cursor = rows[-1]['seq'] if rows else cursor
+    return rows, next_cursor
+
+
+def iter_changes(cursor=0, batch_size=500, models=None, lag=None):
+    """Yield every settled change after ``cursor``, fetched in batches of ``batch_size``"""
+    while True:
+        rows, cursor = changes_since(cursor, limit=batch_size, models=models, lag=lag)
+        yield from rows
+        if len(rows) < batch_size:
+            return
+
+
+def compact(before):
+    """
+    Delete entries older than ``before`` that a later entry for the same
+    object supersedes. The newest entry per object is always kept, so a
+    consumer replaying from any cursor still sees every object's final state.
+    Returns the number of deleted entries.
+    """
+    newer = CatalogueChange.objects.filter(
+        model=OuterRef('model'),
+        object_id=OuterRef('object_id'),
+        seq__gt=OuterRef('seq'),
+    )
+    deleted, _ = CatalogueChange.objects.filter(changed_at__lt=before).filter(Exists(newer)).delete()
+    return deleted
+
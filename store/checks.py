@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+# Backends whose contents are private to one process
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def process_local_caches():
+    """``{alias: backend}`` for the CACHES whose contents stay in one process"""
+    backends = {
+        alias: config.get('BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+        for alias, config in settings.CACHES.items()
+    }
+    return {alias: backend for alias, backend in backends.items() if backend in PROCESS_LOCAL_CACHES}
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """Everything keyed on the catalogue version needs caches all processes share"""
+    return [
+        Error(
+            f'The {alias!r} cache ({backend}) is not shared between processes.',
+            hint='Listing results, throttling buckets and review pages would be kept per worker. '
+                 'Configure a shared backend such as DatabaseCache, Redis or Memcached.',
+            id='store.E001',
+        )
+        for alias, backend in process_local_caches().items()
+    ]
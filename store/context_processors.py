@@ -1,5 +1,7 @@
+from django.utils.functional import SimpleLazyObject
+
 from .models import Category
-from .cart import Cart
+from .cart import get_cart
 
 def categories(request):
     """
@@ -11,8 +13,9 @@ def categories(request):
 
 def cart(request):
     """
-    Context processor to make cart available in all templates
+    Context processor to make cart available in all templates; nothing is
+    loaded unless a template actually uses it
     """
     return {
-        'cart': Cart(request)
+        'cart': SimpleLazyObject(lambda: get_cart(request))
     }
\ No newline at end of file
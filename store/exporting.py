@@ -0,0 +1,41 @@
+import csv
+
+from .importing import IMPORT_COLUMNS
+from .models import Product
+
+
+# Same layout as the import template, so an export can be re-imported
+EXPORT_COLUMNS = IMPORT_COLUMNS
+
+_EXPORT_FIELDS = [
+    'name', 'slug', 'description', 'price', 'wholesale_price',
+    'category__path_names', 'product_type', 'brand', 'origin_country',
+    'weight', 'weight_unit', 'stock_quantity', 'is_available', 'is_wholesale_available',
+    'is_halal', 'is_vegetarian',
+]
+
+
+def export_rows(chunk_size=2000):
+    """Yield export rows matching EXPORT_COLUMNS without instantiating Product objects"""
+    rows = Product.objects.order_by('pk').values_list(*_EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    for row in rows:
+        weight, weight_unit = row[9], row[10]
+        yield [*row[:9], f'{weight}{weight_unit}' if weight is not None else '', *row[11:]]
+
+
+def write_products_csv(fileobj, progress=None, progress_every=1000):
+    """
+    Write the product export to a text file object and return the row count.
+
+    ``progress`` is called with the number of rows written so far every
+    ``progress_every`` rows.
+    """
+    writer = csv.writer(fileobj)
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for row in export_rows():
+        writer.writerow(row)
+        count += 1
+        if progress and count % progress_every == 0:
+            progress(count)
+    return count
@@ -0,0 +1,349 @@
+"""
+Chunked product import shared by the admin importer and the import_products command.
+
+Files are read as a stream (csv.DictReader over the byte stream, openpyxl in
+read-only mode for Excel) and handled a chunk of rows at a time: each chunk is
+validated with vectorised pandas operations, optionally in a process pool,
+then written with a single bulk_create. Progress is checkpointed per chunk in
+ImportCheckpoint, keyed by the file's sha256, so re-running a failed import
+resumes after the last committed chunk.
+"""
+import codecs
+import csv
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.text import slugify
+
+from sr_supermarkt.db_router import use_primary
+
+from .category_paths import resolve_categories
+from .changefeed import record_changes
+from .models import ImportCheckpoint, Product
+from .stock import create_initial_levels
+
+
+IMPORT_COLUMNS = [
+    'name', 'slug', 'description', 'price', 'wholesale_price',
+    'category', 'product_type', 'brand', 'origin_country',
+    'weight', 'stock_quantity', 'is_available', 'is_wholesale',
+    'is_halal', 'is_vegetarian',
+]
+
+TEXT_COLUMNS = [
+    'name', 'slug', 'description', 'category', 'product_type',
+    'brand', 'origin_country', 'weight',
+]
+
+TRUE_VALUES = ['true', '1', 'yes', 'y']
+
+PRODUCT_TYPES = {choice for choice, _ in Product.PRODUCT_TYPE_CHOICES}
+WEIGHT_UNITS = {choice for choice, _ in Product.WEIGHT_UNIT_CHOICES}
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Sorts after every string starting with a given SKU prefix
+SKU_PREFIX_END = '\U0010ffff'
+
+
+def file_digest(fileobj, block_size=1024 * 1024):
+    """sha256 of a binary file object, read in blocks; the file is rewound afterwards"""
+    digest = hashlib.sha256()
+    for block in iter(lambda: fileobj.read(block_size), b''):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def read_csv_rows(fileobj):
+    """Yield dict rows from a binary CSV file object without loading it into memory"""
+    yield from csv.DictReader(codecs.iterdecode(fileobj, 'utf-8-sig'))
+
+
+def read_excel_rows(fileobj):
+    """Yield dict rows from the first sheet of an .xlsx file using openpyxl's read-only mode"""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        for values in rows:
+            if all(value is None for value in values):
+                continue
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def iter_chunks(rows, chunk_size):
+    """Yield ``(first_row_number, rows)`` lists of at most ``chunk_size`` rows"""
+    rows = iter(rows)
+    start = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def _flags(text, default):
+    lowered = text.str.lower()
+    return lowered.isin(TRUE_VALUES).where(lowered != '', default)
+
+
+def validate_chunk(rows, start=0):
+    """
+    Validate and convert a chunk of raw rows column by column.
+
+    Returns ``(records, errors)``: records are dicts of Product field values
+    ready for import_records(), errors are ``(row_number, message)`` tuples.
+    Touches no database state, so it can run in a worker process.
+    """
+    # pandas costs a noticeable amount of import time and memory; only pay it here
+    import pandas as pd
+
+    frame = pd.DataFrame.from_records(rows).reindex(columns=IMPORT_COLUMNS)
+    frame.index = range(start + 1, start + 1 + len(frame))
+
+    text = pd.DataFrame({
+        column: frame[column].fillna('').astype(str).str.strip() for column in TEXT_COLUMNS
+    }, index=frame.index)
+
+    price = pd.to_numeric(frame['price'], errors='coerce')
+    wholesale_price = pd.to_numeric(frame['wholesale_price'], errors='coerce')
+    # A blank stock is 0; anything else must be a whole number, not coerced to one
+    stock_text = frame['stock_quantity'].fillna('').astype(str).str.strip()
+    stock_quantity = pd.to_numeric(stock_text.where(stock_text != ''), errors='coerce')
+    invalid_stock = (stock_text != '') & (
+        stock_quantity.isna() | (stock_quantity != stock_quantity.round()) | (stock_quantity < 0)
+    )
+    stock_quantity = stock_quantity.fillna(0)
+    product_type = text['product_type'].str.lower().where(text['product_type'] != '', 'grocery')
+
+    # "500g", "1.5 kg", "12 pcs" or a bare number
+    weight_parts = text['weight'].str.extract(r'^([0-9]+(?:[.,][0-9]+)?)\s*([A-Za-z]*)$')
+    weight = pd.to_numeric(weight_parts[0].str.replace(',', '.'), errors='coerce')
+    weight_unit = weight_parts[1].fillna('').str.lower()
+
+    checks = [
+        (text['name'] == '', 'missing name'),
+        (text['category'] == '', 'missing category'),
+        (price.isna() | (price < 0), 'invalid price'),
+        (invalid_stock, 'invalid stock quantity'),
+        (~product_type.isin(PRODUCT_TYPES), 'unknown product type'),
+        ((text['weight'] != '') & weight.isna(), 'invalid weight'),
+        (~weight_unit.isin(WEIGHT_UNITS | {''}), 'unknown weight unit'),
+    ]
+    invalid = pd.Series(False, index=frame.index)
+    errors = []
+    for mask, message in checks:
+        new_errors = mask & ~invalid
+        errors.extend((row_number, message) for row_number in frame.index[new_errors])
+        invalid |= mask
+
+    valid = ~invalid
+    slug = text['slug'].where(text['slug'] != '', text['name'].map(slugify))
+    records = pd.DataFrame({
+        'row_number': frame.index,
+        'name': text['name'],
+        'slug': slug,
+        'description': text['description'],
+        'category': text['category'],
+        'product_type': product_type,
+        'brand': text['brand'],
+        'origin_country': text['origin_country'],
+        'price': price.round(2).map('{:.2f}'.format, na_action='ignore'),
+        'wholesale_price': wholesale_price.where(wholesale_price > 0).round(2).map(
+            '{:.2f}'.format, na_action='ignore'),
+        'weight': weight.round(2).map('{:.2f}'.format, na_action='ignore'),
+        'weight_unit': weight_unit,
+        'stock_quantity': stock_quantity,
+        'is_available': _flags(frame['is_available'].fillna('').astype(str).str.strip(), True),
+        'is_wholesale_available': _flags(frame['is_wholesale'].fillna('').astype(str).str.strip(), False),
+        'is_halal': _flags(frame['is_halal'].fillna('').astype(str).str.strip(), False),
+        'is_vegetarian': _flags(frame['is_vegetarian'].fillna('').astype(str).str.strip(), False),
+    }, index=frame.index)[valid]
+
+    records = records.astype(object).where(records.notna(), None)
+    records['stock_quantity'] = records['stock_quantity'].map(int)
+    return records.to_dict('records'), errors
+
+
+def _assign_skus(products, batch_size=200):
+    """Bulk equivalent of the SKU generation in Product.save()"""
+    bases = [
+        f"{product.category.name[:3].upper()}{product.name[:3].upper()}" for product in products
+    ]
+    unique_bases = sorted(set(bases))
+    taken = set()
+    for i in range(0, len(unique_bases), batch_size):
+        prefixes = Q()
+        for base in unique_bases[i:i + batch_size]:
+            # A range rather than startswith: SQLite's LIKE cannot use the sku index
+            prefixes |= Q(sku__gte=base, sku__lt=base + SKU_PREFIX_END)
+        taken.update(Product.objects.filter(prefixes).order_by().values_list('sku', flat=True))
+
+    counters = {}
+    for product, base in zip(products, bases):
+        counter = counters.get(base, 1)
+        while f"{base}{counter:03d}" in taken:
+            counter += 1
+        product.sku = f"{base}{counter:03d}"
+        taken.add(product.sku)
+        counters[base] = counter + 1
+
+
+def import_records(records):
+    """
+    Create products for validated records with a handful of queries per chunk.
+
+    As with get_or_create(name=...), rows whose name
+    already exists are skipped. Returns ``(created, skipped, errors)``.
+    """
+    if not records:
+        return 0, 0, []
+
+    categories, ambiguous = resolve_categories(record['category'] for record in records)
+
+    existing_names = set(
+        Product.objects.filter(name__in={record['name'] for record in records})
+        .order_by().values_list('name', flat=True)
+    )
+    taken_slugs = set(
+        Product.objects.filter(slug__in={record['slug'] for record in records})
+        .order_by().values_list('slug', flat=True)
+    )
+
+    products, errors, skipped = [], [], 0
+    for record in records:
+        record = dict(record)
+        row_number = record.pop('row_number')
+        category_value = record.pop('category').lower()
+        category = categories.get(category_value)
+        if category is None:
+            if category_value in ambiguous:
+                errors.append((row_number, 'category name is ambiguous, use the full path (e.g. Indian > Snacks & Sweets > Snacks)'))
+            else:
+                errors.append((row_number, 'category not found'))
+            continue
+        if record['name'] in existing_names:
+            skipped += 1
+            continue
+        if record['slug'] in taken_slugs:
+            errors.append((row_number, f"slug already in use: {record['slug']}"))
+            continue
+        existing_names.add(record['name'])
+        taken_slugs.add(record['slug'])
+        product = Product(category=category, category_path=category.path, **record)
+        product.set_unit_price()
+        products.append(product)
+
+    _assign_skus(products)
+    Product.objects.bulk_create(products)
+    # Imported stock is counted at the default location
+    if any(product.stock_quantity for product in products):
+        create_initial_levels(products)
+    record_changes('product', [product.pk for product in products])
+    return len(products), skipped, errors
+
+
+def _validated_chunks(chunks, workers):
+    """Validate chunks in order, fanning out to ``workers`` processes when > 1"""
+    if workers <= 1:
+        for start, rows in chunks:
+            yield validate_chunk(rows, start)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep a bounded window in flight so large files are never fully buffered
+        pending = deque()
+        for start, rows in chunks:
+            pending.append(executor.submit(validate_chunk, rows, start))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class ProductImporter:
+    """
+    Import products from a CSV or Excel file object, one committed chunk at a time.
+
+    ``log`` is called with a progress message and ``progress`` with the
+    ImportCheckpoint after every chunk.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, resume=True, log=None, progress=None):
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.resume = resume
+        self.log = log or (lambda message: None)
+        self.progress = progress or (lambda checkpoint: None)
+        self.errors = []
+        # Set when the file's checkpoint was already complete and nothing ran
+        self.already_imported = False
+
+    def rows(self, fileobj, file_format):
+        if file_format == 'excel':
+            return read_excel_rows(fileobj)
+        return read_csv_rows(fileobj)
+
+    def checkpoint_for(self, fileobj, source_name):
+        source_key = file_digest(fileobj)
+        checkpoint, created = ImportCheckpoint.objects.get_or_create(
+            source_key=source_key,
+            defaults={'source_name': source_name, 'chunk_size': self.chunk_size},
+        )
+        if not created and (not self.resume or checkpoint.chunk_size != self.chunk_size):
+            # Start over: chunk boundaries only line up with the same chunk size
+            ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                source_name=source_name, chunk_size=self.chunk_size, chunks_done=0, rows_done=0,
+                created_count=0, skipped_count=0, error_count=0, completed=False,
+            )
+            checkpoint.refresh_from_db()
+        return checkpoint
+
+    def run(self, fileobj, file_format='csv', source_name=''):
+        """Import ``fileobj`` and return its ImportCheckpoint"""
+        # Deduplication must see every row already written, so skip the replicas
+        with use_primary():
+            return self._run(fileobj, file_format, source_name)
+
+    def _run(self, fileobj, file_format, source_name):
+        checkpoint = self.checkpoint_for(fileobj, source_name)
+        if checkpoint.completed:
+            self.already_imported = True
+            self.log(f'{source_name} was already imported, nothing to do')
+            return checkpoint
+        if checkpoint.chunks_done:
+            self.log(f'Resuming {source_name} after row {checkpoint.rows_done}')
+
+        chunks = islice(
+            iter_chunks(self.rows(fileobj, file_format), self.chunk_size), checkpoint.chunks_done, None
+        )
+        for records, errors in _validated_chunks(chunks, self.workers):
+            chunk_rows = len(records) + len(errors)
+            with transaction.atomic():
+                created, skipped, import_errors = import_records(records)
+                errors = errors + import_errors
+                ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                    chunks_done=F('chunks_done') + 1,
+                    rows_done=F('rows_done') + chunk_rows,
+                    created_count=F('created_count') + created,
+                    skipped_count=F('skipped_count') + skipped,
+                    error_count=F('error_count') + len(errors),
+                )
+            self.errors.extend(errors)
+            checkpoint.refresh_from_db()
+            self.log(f'{checkpoint.rows_done} rows processed, {checkpoint.created_count} products created')
+            self.progress(checkpoint)
+
+        ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(completed=True)
+        checkpoint.refresh_from_db()
+        return checkpoint
@@ -0,0 +1,109 @@
+import csv
+from datetime import timedelta
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import InventoryReportRun, Product
+
+
+REPORT_COLUMNS = [
+    'reason', 'sku', 'name', 'brand', 'category', 'stock_quantity',
+    'low_stock_threshold', 'expiry_date', 'batch_number', 'is_available',
+]
+
+_ROW_FIELDS = [
+    'sku', 'name', 'brand', 'category__name', 'stock_quantity',
+    'low_stock_threshold', 'expiry_date', 'batch_number', 'is_available',
+]
+
+
+def low_stock_products(since=None):
+    """Products at or below their low stock threshold (served by product_low_stock_idx)"""
+    products = Product.objects.filter(stock_quantity__lte=F('low_stock_threshold'))
+    if since is not None:
+        products = products.filter(updated_at__gt=since)
+    return products.order_by('stock_quantity')
+
+
+def expiring_products(days=30, today=None):
+    """
+    Products whose batch expires within ``days`` days (served by product_expiry_idx).
+
+    Never narrowed to recently changed products: a product enters the window
+    as days pass, without being saved.
+    """
+    today = today or timezone.localdate()
+    products = Product.objects.filter(
+        expiry_date__isnull=False,
+        expiry_date__lte=today + timedelta(days=days),
+    )
+    return products.order_by('expiry_date')
+
+
+def report_rows(report='all', days=30, since=None, chunk_size=2000):
+    """
+    Yield report rows as lists matching REPORT_COLUMNS.
+
+    Rows are read with values_list() and iterator() so the whole store can be
+    reported on without instantiating Product objects.
+    """
+    querysets = []
+    if report in ('low_stock', 'all'):
+        querysets.append(('low_stock', low_stock_products(since=since)))
+    if report in ('expiring', 'all'):
+        querysets.append(('expiring', expiring_products(days=days)))
+
+    for reason, products in querysets:
+        for row in products.values_list(*_ROW_FIELDS).iterator(chunk_size=chunk_size):
+            yield [reason, *row]
+
+
+def last_run_started_at(report):
+    """Start time of the previous completed run of ``report``, or None on the first run"""
+    return (
+        InventoryReportRun.objects.filter(report=report, finished_at__isnull=False)
+        .values_list('started_at', flat=True)
+        .first()
+    )
+
+
+class _Echo:
+    """File-like object whose write() hands the value back, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, header=True):
+    """Yield CSV encoded lines for ``rows`` one at a time"""
+    writer = csv.writer(_Echo())
+    if header:
+        yield writer.writerow(REPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def run_report(report='all', days=30, incremental=False):
+    """
+    Start a report run and return ``(run, rows)``.
+
+    ``rows`` is a generator; the run is marked finished once it is exhausted,
+    so an interrupted run does not move the incremental window forward.
+    When ``incremental`` is set only low stock products changed since the
+    previous run of the same report are included; expiring products are
+    always reported in full.
+    """
+    since = last_run_started_at(report) if incremental else None
+    run = InventoryReportRun.objects.create(report=report, started_at=timezone.now())
+
+    def rows():
+        count = 0
+        for row in report_rows(report=report, days=days, since=since):
+            count += 1
+            yield row
+        run.row_count = count
+        run.finished_at = timezone.now()
+        run.save(update_fields=['row_count', 'finished_at'])
+
+    return run, rows()
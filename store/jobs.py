@@ -0,0 +1,157 @@
+"""
+Database-backed background jobs.
+
+Admin actions enqueue a Job row and return immediately; ``manage.py run_jobs``
+claims queued jobs one at a time and runs the handler registered for the
+job's kind. Claiming is a conditional UPDATE, so several workers can poll the
+same table without a broker or row locks.
+"""
+import io
+import os
+import socket
+import tempfile
+import traceback
+from datetime import timedelta
+
+from django.core.files import File
+from django.utils import timezone
+
+from sr_supermarkt.db_router import routing_scope
+from sr_supermarkt.memory import profile_block
+
+from .models import Job, Product
+
+
+JOB_HANDLERS = {}
+
+# Running jobs without a heartbeat for this long are assumed to have lost their worker
+STALE_AFTER = timedelta(minutes=10)
+
+
+def job_handler(kind):
+    """Register ``func(job)`` as the handler for jobs of ``kind``"""
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, options=None, input_file=None, user=None):
+    """Queue a job of ``kind``; ``input_file`` is an uploaded file to store with it"""
+    job = Job(kind=kind, options=options or {}, created_by=user)
+    if input_file is not None:
+        job.input_file.save(os.path.basename(input_file.name), input_file, save=False)
+    job.save()
+    return job
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_next(worker):
+    """Mark the oldest queued job as running for ``worker`` and return it, or None"""
+    while True:
+        job_id = (
+            Job.objects.filter(status='queued')
+            .order_by('created_at', 'pk')
+            .values_list('pk', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job_id, status='queued').update(
+            status='running', worker=worker, started_at=now, heartbeat_at=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+        # Another worker won the race for this job; try the next one
+
+
+def report_progress(job, rows_done=None, rows_total=None, message=None):
+    """Record progress for the job status page; also serves as the worker heartbeat"""
+    fields = {'heartbeat_at': timezone.now()}
+    if rows_done is not None:
+        fields['rows_done'] = job.rows_done = rows_done
+    if rows_total is not None:
+        fields['rows_total'] = job.rows_total = rows_total
+    if message is not None:
+        fields['message'] = job.message = message
+    Job.objects.filter(pk=job.pk).update(**fields)
+
+
+def run_job(job):
+    """Run a claimed job with its registered handler, recording the outcome"""
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job kind {job.kind!r}')
+        # Like a request: replica reads until the job writes catalogue data
+        with routing_scope(), profile_block(f'job:{job.kind}'):
+            handler(job)
+    except Exception:
+        job.status = 'failed'
+        job.error = traceback.format_exc()
+    else:
+        job.status = 'done'
+    job.finished_at = timezone.now()
+    Job.objects.filter(pk=job.pk).update(status=job.status, error=job.error, finished_at=job.finished_at)
+    return job
+
+
+def requeue_stale(older_than):
+    """Put running jobs whose worker stopped sending heartbeats back in the queue"""
+    return Job.objects.filter(
+        status='running', heartbeat_at__lt=timezone.now() - older_than,
+    ).update(status='queued', worker='')
+
+
+@job_handler('import_products')
+def import_products_job(job):
+    from .importing import ProductImporter
+
+    def progress(checkpoint):
+        report_progress(
+            job,
+            rows_done=checkpoint.rows_done,
+            message=f'{checkpoint.created_count} created, {checkpoint.skipped_count} already existed, '
+                    f'{checkpoint.error_count} errors',
+        )
+
+    importer = ProductImporter(
+        chunk_size=job.options.get('chunk_size', 1000),
+        workers=job.options.get('workers', 1),
+        resume=job.options.get('resume', True),
+        progress=progress,
+    )
+    with job.input_file.open('rb') as file:
+        checkpoint = importer.run(
+            file, job.options.get('format', 'csv'), source_name=job.options.get('source_name', file.name),
+        )
+    if importer.already_imported:
+        report_progress(
+            job, rows_done=checkpoint.rows_done,
+            message=f'Already imported ({checkpoint.created_count} products created then); nothing was done. '
+                    f'Import it again with "Import from the first row" ticked to re-run it.',
+        )
+    else:
+        progress(checkpoint)
+
+
+@job_handler('export_products')
+def export_products_job(job):
+    from .exporting import write_products_csv
+
+    report_progress(job, rows_total=Product.objects.count())
+    with tempfile.TemporaryFile() as output:
+        text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+        count = write_products_csv(text, progress=lambda rows: report_progress(job, rows_done=rows))
+        text.flush()
+        text.detach()
+        output.seek(0)
+        filename = f'products_export_{timezone.now():%Y%m%d_%H%M%S}.csv'
+        job.result_file.save(filename, File(output), save=False)
+    Job.objects.filter(pk=job.pk).update(result_file=job.result_file.name)
+    report_progress(job, rows_done=count, message=f'Exported {count} products')
+
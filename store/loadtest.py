@@ -0,0 +1,309 @@
+"""
+Scripted shopper traffic for load testing a running instance.
+
+``manage.py loadtest`` starts a number of virtual shoppers, ramped up over a
+few seconds, against a server started separately (runserver, gunicorn,
+uvicorn...). Each shopper follows a persona: browsers walk the category tree,
+searchers type into the suggestion box and search, cart users keep a session
+and revisit products. The mix of personas is configurable.
+
+Every shopper draws its choices from its own ``random.Random(seed, user)``,
+so the same seed, mix, user count and iteration count send the same requests
+on every run and two deployments can be compared like for like. Results are
+kept per URL pattern: throughput, error rate, latency percentiles and a
+latency histogram.
+
+All shoppers come from one address, so searches and deep pages soon hit the
+listing throttle (store/throttling.py) and show up as 429s. To measure the
+server rather than the limits, add the load generator's address to
+LISTING_THROTTLE_EXEMPT_IPS on the instance under test.
+"""
+import http.client
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.db.models import F
+from django.urls import reverse
+
+from .models import Category, Product
+
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+PERSONAS = ('browser', 'searcher', 'cart')
+
+MIXES = {
+    'browse': {'browser': 70, 'searcher': 20, 'cart': 10},
+    'search': {'browser': 20, 'searcher': 70, 'cart': 10},
+    'peak': {'browser': 50, 'searcher': 30, 'cart': 20},
+}
+
+SORT_OPTIONS = ['name', 'price_low', 'price_high', 'newest']
+
+
+def parse_mix(value):
+    """'peak' or 'browser=60,searcher=30,cart=10' -> {persona: weight}"""
+    if value in MIXES:
+        return dict(MIXES[value])
+    mix = {}
+    for part in value.split(','):
+        persona, _, weight = part.partition('=')
+        persona = persona.strip()
+        if persona not in PERSONAS:
+            raise ValueError(f'Unknown persona {persona!r}, expected one of {", ".join(PERSONAS)}')
+        try:
+            mix[persona] = float(weight)
+        except ValueError:
+            raise ValueError(f'Weight for {persona} must be a number')
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError('A mix needs at least one persona with a positive weight')
+    return mix
+
+
+class Catalogue:
+    """The slugs and search terms shoppers pick from, loaded once before the run"""
+
+    def __init__(self):
+        categories = Category.objects.filter(is_active=True).order_by('tree_id', 'lft')
+        self.top_categories = list(categories.filter(level=0).values_list('slug', flat=True))
+        # Shoppers mostly land on the leaves of the populate_categories tree
+        self.categories = list(
+            categories.filter(rght=F('lft') + 1).values_list('slug', flat=True)
+        ) or list(categories.values_list('slug', flat=True))
+        self.products = list(
+            Product.objects.filter(is_available=True).order_by('id').values_list('slug', flat=True)
+        )
+        terms = set()
+        for name, brand in Product.objects.filter(is_available=True).values_list('name', 'brand'):
+            terms.update(word.lower() for word in name.split() if len(word) > 3 and word.isalpha())
+            if brand:
+                terms.add(brand.lower())
+        self.search_terms = sorted(terms)
+
+        if not self.products or not self.categories:
+            raise ValueError('The catalogue has no available products or active categories to request')
+
+        self.urls = {
+            'home': reverse('store:home'),
+            'product_list': reverse('store:product_list'),
+            'search_suggest': reverse('store:search_suggest'),
+        }
+        self.category_url = reverse('store:category_products', args=['__slug__'])
+        self.product_url = reverse('store:product_detail', args=['__slug__'])
+
+
+class Stats:
+    """Thread-safe latency and error counts per URL pattern"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, pattern, elapsed_ms, status):
+        with self.lock:
+            self.latencies[pattern].append(elapsed_ms)
+            self.statuses[pattern][status] += 1
+            if status == 'error' or status >= 400:
+                self.errors[pattern] += 1
+
+    def summary(self, elapsed_s):
+        rows = {}
+        everything = []
+        for pattern in sorted(self.latencies):
+            latencies = self.latencies[pattern]
+            everything.extend(latencies)
+            rows[pattern] = self._summarise(latencies, self.errors[pattern], elapsed_s)
+            rows[pattern]['statuses'] = {str(status): count for status, count in self.statuses[pattern].items()}
+        rows['TOTAL'] = self._summarise(everything, sum(self.errors.values()), elapsed_s)
+        return rows
+
+    @staticmethod
+    def _summarise(latencies, errors, elapsed_s):
+        latencies = sorted(latencies)
+        count = len(latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(count - 1, int(p / 100 * count))]
+
+        histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        for latency in latencies:
+            histogram[bisect_left(HISTOGRAM_BUCKETS, latency)] += 1
+        return {
+            'requests': count,
+            'errors': errors,
+            'error_rate': errors / count if count else 0.0,
+            'throughput': count / elapsed_s if elapsed_s else 0.0,
+            'mean_ms': sum(latencies) / count if count else 0.0,
+            'p50_ms': percentile(50),
+            'p90_ms': percentile(90),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'max_ms': latencies[-1] if latencies else 0.0,
+            'histogram': histogram,
+        }
+
+
+class Shopper:
+    """One virtual user with its own connection, cookie jar and random stream"""
+
+    def __init__(self, number, persona, catalogue, base_url, stats, seed, think_time, timeout):
+        self.number = number
+        self.persona = persona
+        self.catalogue = catalogue
+        self.stats = stats
+        self.think_time = think_time
+        self.random = random.Random(f'{seed}:{number}')
+        self.cookies = SimpleCookie()
+
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=timeout)
+        self.prefix = parts.path.rstrip('/')
+
+    def get(self, pattern, path, params=None):
+        if params:
+            path = f'{path}?{urlencode(params)}'
+        headers = {'User-Agent': 'sr-supermarkt-loadtest', 'Accept-Encoding': 'gzip'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{key}={morsel.value}' for key, morsel in self.cookies.items())
+
+        started = time.perf_counter()
+        try:
+            self.connection.request('GET', self.prefix + path, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+            status = response.status
+            for header in response.headers.get_all('Set-Cookie') or []:
+                self.cookies.load(header)
+        except (OSError, http.client.HTTPException):
+            # The server dropped the connection; reconnect on the next request
+            self.connection.close()
+            status = 'error'
+        self.stats.record(pattern, (time.perf_counter() - started) * 1000, status)
+
+        if self.think_time:
+            time.sleep(self.random.uniform(0, 2 * self.think_time))
+
+    def category_path(self, slug):
+        return self.catalogue.category_url.replace('__slug__', slug)
+
+    def product_path(self, slug):
+        return self.catalogue.product_url.replace('__slug__', slug)
+
+    def browse(self):
+        catalogue, rng = self.catalogue, self.random
+        self.get('home', catalogue.urls['home'])
+        category = rng.choice(catalogue.categories)
+        self.get('category_products', self.category_path(category))
+        if rng.random() < 0.3:
+            self.get('category_products', self.category_path(category), {'page': 2})
+        params = {'sort_by': rng.choice(SORT_OPTIONS)}
+        if catalogue.top_categories and rng.random() < 0.5:
+            params['category'] = rng.choice(catalogue.top_categories)
+        self.get('product_list', catalogue.urls['product_list'], params)
+        for _ in range(rng.randint(1, 3)):
+            self.get('product_detail', self.product_path(rng.choice(catalogue.products)))
+
+    def search(self):
+        catalogue, rng = self.catalogue, self.random
+        if not catalogue.search_terms:
+            return self.browse()
+        term = rng.choice(catalogue.search_terms)
+        # Typing: one suggestion request per keystroke after the second
+        for length in range(2, min(len(term), 6) + 1):
+            self.get('search_suggest', catalogue.urls['search_suggest'], {'q': term[:length]})
+        self.get('product_list?q', catalogue.urls['product_list'], {'q': term})
+        self.get('product_detail', self.product_path(rng.choice(catalogue.products)))
+
+    def shop(self):
+        catalogue, rng = self.catalogue, self.random
+        # A small basket revisited several times, all on one session
+        basket = rng.sample(catalogue.products, min(len(catalogue.products), rng.randint(2, 5)))
+        for slug in basket + rng.sample(basket, len(basket) // 2):
+            self.get('product_detail', self.product_path(slug))
+        self.get('home', catalogue.urls['home'])
+
+    def run(self, iterations=None, deadline=None):
+        flow = {'browser': self.browse, 'searcher': self.search, 'cart': self.shop}[self.persona]
+        done = 0
+        try:
+            while (iterations is None or done < iterations) and (deadline is None or time.monotonic() < deadline):
+                flow()
+                done += 1
+        finally:
+            self.connection.close()
+
+
+class LoadTest:
+    def __init__(self, base_url, users=10, mix='peak', ramp_up=0.0, iterations=None,
+                 duration=None, seed=0, think_time=0.0, timeout=30.0):
+        if iterations is None and duration is None:
+            raise ValueError('Give a number of iterations per user, a duration, or both')
+        self.base_url = base_url
+        self.users = users
+        self.mix = parse_mix(mix) if isinstance(mix, str) else mix
+        self.ramp_up = ramp_up
+        self.iterations = iterations
+        self.duration = duration
+        self.seed = seed
+        self.think_time = think_time
+        self.timeout = timeout
+        self.stats = Stats()
+        self.elapsed = 0.0
+
+    def personas(self):
+        """Persona per user, drawn from the mix with the run's seed"""
+        rng = random.Random(f'{self.seed}:personas')
+        names = sorted(self.mix)
+        return rng.choices(names, weights=[self.mix[name] for name in names], k=self.users)
+
+    def run(self):
+        catalogue = Catalogue()
+        started = time.monotonic()
+        deadline = started + self.ramp_up + self.duration if self.duration else None
+
+        threads = []
+        for number, persona in enumerate(self.personas()):
+            shopper = Shopper(number, persona, catalogue, self.base_url, self.stats,
+                              self.seed, self.think_time, self.timeout)
+            thread = threading.Thread(target=shopper.run, args=(self.iterations, deadline), daemon=True)
+            threads.append(thread)
+
+        for number, thread in enumerate(threads):
+            # Start users evenly over the ramp-up period
+            delay = started + self.ramp_up * number / len(threads) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.elapsed = time.monotonic() - started
+        return self.stats.summary(self.elapsed)
+
+    def report(self, summary):
+        return {
+            'config': {
+                'base_url': self.base_url,
+                'users': self.users,
+                'mix': self.mix,
+                'ramp_up': self.ramp_up,
+                'iterations': self.iterations,
+                'duration': self.duration,
+                'seed': self.seed,
+                'think_time': self.think_time,
+            },
+            'elapsed_s': self.elapsed,
+            'histogram_buckets_ms': HISTOGRAM_BUCKETS,
+            'results': summary,
+        }
@@ -0,0 +1,86 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.catalogue_engine import SORT_KEYS, CatalogueSnapshot, ProductPage
+from store.models import Category, Product
+
+
+def listing_filters():
+    """(label, engine kwargs, queryset lookups) for the filters product_list offers"""
+    filters = [
+        ('all', {}, {}),
+        ('price 2-10', {'min_price': 2, 'max_price': 10}, {'price__gte': 2, 'price__lte': 10}),
+        ('unit price 1-5', {'min_unit_price': 1, 'max_unit_price': 5},
+         {'unit_price__gte': 1, 'unit_price__lte': 5}),
+        ('halal + vegetarian', {'halal': True, 'vegetarian': True}, {'is_halal': True, 'is_vegetarian': True}),
+    ]
+    root = Category.objects.filter(parent=None).order_by('tree_id').first()
+    if root is not None:
+        filters.append((f'category {root.slug}', {'category': root}, {'category': root}))
+    return filters
+
+
+class Command(BaseCommand):
+    help = 'Time product listing pages answered by SQL against the catalogue engine, per sort order and filter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query; the median is reported')
+        parser.add_argument('--page-size', type=int, default=12)
+        parser.add_argument('--page', type=int, default=1, help='Page to fetch, to compare deep pages')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            raise CommandError('The catalogue engine needs NumPy')
+        if not Product.objects.exists():
+            raise CommandError('No products to benchmark')
+
+        started = time.perf_counter()
+        snapshot = CatalogueSnapshot.load()
+        self.stdout.write(f'Snapshot of {len(snapshot)} products loaded in {self.elapsed_ms(started):.1f} ms')
+
+        offset = (options['page'] - 1) * options['page_size']
+        page = slice(offset, offset + options['page_size'])
+
+        def sql(lookups, sort_by):
+            products = Product.objects.filter(is_available=True)
+            category = lookups.get('category')
+            if category is not None:
+                products = products.in_category(category)
+            products = products.filter(**{k: v for k, v in lookups.items() if k != 'category'})
+            products = products.sorted_by(sort_by)
+            # What Paginator does: count, then the page's rows
+            return products.count(), list(products[page])
+
+        def engine(kwargs, sort_by):
+            ids = ProductPage(snapshot.product_ids(sort_by=sort_by, **kwargs))
+            return ids.count(), ids[page]
+
+        self.stdout.write(f'  {"filter":<24} {"sort":<12} {"rows":>6} {"SQL ms":>8} {"engine ms":>10} {"speed-up":>9}')
+        speedups = []
+        for label, kwargs, lookups in listing_filters():
+            for sort_by in SORT_KEYS:
+                sql_ms, (count, sql_page) = self.median_ms(sql, options['repeat'], lookups, sort_by)
+                engine_ms, (_, engine_page) = self.median_ms(engine, options['repeat'], kwargs, sort_by)
+                if [product.pk for product in sql_page] != [product.pk for product in engine_page]:
+                    self.stderr.write(f'  {label} / {sort_by}: SQL and engine pages differ')
+                speedups.append(sql_ms / engine_ms)
+                self.stdout.write(
+                    f'  {label:<24} {sort_by:<12} {count:>6} {sql_ms:>8.2f} {engine_ms:>10.2f} {speedups[-1]:>8.1f}x'
+                )
+        self.stdout.write(self.style.SUCCESS(f'Median speed-up {statistics.median(speedups):.1f}x'))
+
+    @staticmethod
+    def elapsed_ms(started):
+        return (time.perf_counter() - started) * 1000
+
+    def median_ms(self, query, repeat, *args):
+        timings = []
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            result = query(*args)
+            timings.append(self.elapsed_ms(started))
+        return statistics.median(timings), result
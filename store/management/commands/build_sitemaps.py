@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from store.sitemaps import SitemapWriter
+
+
+class Command(BaseCommand):
+    help = 'Write sharded, gzipped XML sitemaps for the catalogue to SITEMAP_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', type=str, default=settings.SITEMAP_BASE_URL,
+                            help='Scheme and host prepended to every URL, e.g. https://www.example.com')
+        parser.add_argument('--shard-size', type=int, default=settings.SITEMAP_SHARD_SIZE,
+                            help='Maximum URLs per shard (the protocol limit is 50000)')
+
+    def handle(self, *args, **options):
+        writer = SitemapWriter(options['base_url'], shard_size=options['shard_size'])
+        shards = writer.build()
+
+        for name in writer.written:
+            self.stdout.write(f'Wrote {name}')
+        for name in writer.removed:
+            self.stdout.write(f'Removed {name}')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Index and {len(shards)} shards: {len(writer.written)} files written, '
+                f'{len(writer.unchanged)} unchanged'
+            )
+        )
@@ -0,0 +1,41 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from store.changefeed import compact, iter_changes, latest_cursor
+
+
+class Command(BaseCommand):
+    help = 'Stream catalogue changes after a cursor as JSON lines, or compact the change log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, default=0, help='Cursor (seq) to stream changes after')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows fetched per query')
+        parser.add_argument('--model', action='append', choices=['product', 'category', 'productimage'],
+                            help='Only stream changes for this model (repeatable)')
+        parser.add_argument('--latest', action='store_true', help='Print the newest cursor and exit')
+        parser.add_argument('--compact', action='store_true',
+                            help='Delete superseded entries instead of streaming')
+        parser.add_argument('--older-than-days', type=int, default=30,
+                            help='Only compact entries older than this many days')
+
+    def handle(self, *args, **options):
+        if options['latest']:
+            self.stdout.write(str(latest_cursor()))
+            return
+
+        if options['compact']:
+            before = timezone.now() - timedelta(days=options['older_than_days'])
+            deleted = compact(before)
+            self.stdout.write(self.style.SUCCESS(f'Compacted {deleted} superseded changes'))
+            return
+
+        count = 0
+        cursor = options['since']
+        for change in iter_changes(cursor, batch_size=options['batch_size'], models=options['model']):
+            self.stdout.write(json.dumps(change, cls=DjangoJSONEncoder))
+            cursor = change['seq']
+            count += 1
+        self.stderr.write(f'{count} changes, next cursor {cursor}')
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from store.media import MediaDeduplicator
+
+
+class Command(BaseCommand):
+    help = 'Move catalogue images to content-addressed names, merging duplicates and removing unused files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report duplicates, pending renames and orphans')
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help='Also delete files no row has ever referenced')
+        parser.add_argument('--orphan-grace-hours', type=float, default=24,
+                            help='Never delete orphans modified more recently than this')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Names rewritten per UPDATE statement')
+
+    def handle(self, *args, **options):
+        deduplicator = MediaDeduplicator(batch_size=options['batch_size'], log=self.stdout.write)
+        deduplicator.run(
+            dry_run=options['dry_run'],
+            delete_orphans=options['delete_orphans'],
+            orphan_grace=options['orphan_grace_hours'] * 60 * 60,
+        )
+
+        groups = deduplicator.groups
+        for names in groups:
+            self.stdout.write(f'Duplicates: {", ".join(names)}')
+        for name in deduplicator.missing:
+            self.stdout.write(self.style.WARNING(f'Referenced but missing: {name}'))
+        for name in deduplicator.orphans:
+            self.stdout.write(f'Orphan: {name}')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'{len(groups)} duplicate groups ({deduplicator.reclaimable_bytes() / 1024:.0f} KiB reclaimable), '
+                f'{len(deduplicator.renames)} names to rewrite, {len(deduplicator.orphans)} orphans'
+            ))
+            return
+
+        for name in deduplicator.removed:
+            self.stdout.write(f'Removed {name}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Rewrote {deduplicator.rewritten} references to {len(set(deduplicator.renames.values()))} files, '
+            f'removed {len(deduplicator.removed)} files, {len(deduplicator.orphans)} orphans kept'
+        ))
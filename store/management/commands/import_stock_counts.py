@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from store.stock import read_stock_counts, set_stock_counts
+
+
+class Command(BaseCommand):
+    help = 'Set stock levels from a stock count CSV (sku, location, quantity)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_path', type=str, help='Path to the CSV file')
+        parser.add_argument('--location', type=str,
+                            help='Location code for rows without a location column or value')
+        parser.add_argument('--batch-size', type=int, default=500, help='Levels written per statement')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change, then roll back')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['file_path'], 'rb') as file:
+                counts, errors = read_stock_counts(file, options['location'])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for row_number, message in errors:
+            self.stdout.write(self.style.WARNING(f'Row {row_number}: {message}'))
+
+        with transaction.atomic():
+            changed = set_stock_counts(counts, options['batch_size'])
+            if options['dry_run']:
+                transaction.set_rollback(True)
+
+        verb = 'Would change' if options['dry_run'] else 'Changed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {changed} of {len(counts)} counted stock levels ({len(errors)} errors)'
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from store.inventory import run_report, stream_csv
+
+
+class Command(BaseCommand):
+    help = 'Report low stock and soon-to-expire products as CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--report', type=str, default='all', choices=['low_stock', 'expiring', 'all'],
+                            help='Which products to report on')
+        parser.add_argument('--days', type=int, default=30, help='Expiry window in days')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only include low stock products changed since the last completed run')
+        parser.add_argument('--output', type=str, help='Write the CSV to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        run, rows = run_report(
+            report=options['report'],
+            days=options['days'],
+            incremental=options['incremental'],
+        )
+
+        output_path = options.get('output')
+        if output_path:
+            with open(output_path, 'w', encoding='utf-8', newline='') as output:
+                output.writelines(stream_csv(rows))
+            self.stdout.write(
+                self.style.SUCCESS(f'Wrote {run.row_count} rows to {output_path}')
+            )
+        else:
+            for line in stream_csv(rows):
+                self.stdout.write(line, ending='')
+            self.stderr.write(f'{run.row_count} rows reported')
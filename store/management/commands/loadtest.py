@@ -0,0 +1,82 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from store.loadtest import HISTOGRAM_BUCKETS, MIXES, LoadTest
+
+
+class Command(BaseCommand):
+    help = 'Replay a reproducible mix of shopper traffic against a running server and report latencies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', nargs='?', default='http://127.0.0.1:8000',
+                            help='Server to load, started separately (runserver, gunicorn, uvicorn...)')
+        parser.add_argument('--users', type=int, default=10, help='Concurrent virtual shoppers')
+        parser.add_argument('--mix', type=str, default='peak',
+                            help=f'Persona mix: one of {", ".join(MIXES)} or e.g. browser=60,searcher=30,cart=10')
+        parser.add_argument('--ramp-up', type=float, default=0.0,
+                            help='Seconds over which the shoppers are started')
+        parser.add_argument('--iterations', type=int,
+                            help='Flows per shopper; fixes the exact set of requests sent')
+        parser.add_argument('--duration', type=float, help='Stop after this many seconds (after ramp-up)')
+        parser.add_argument('--seed', type=int, default=0, help='Same seed, same requests')
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Mean pause between a shopper\'s requests, in seconds')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Per request timeout in seconds')
+        parser.add_argument('--json', type=str, help='Also write the full report to this file')
+
+    def handle(self, *args, **options):
+        if options['iterations'] is None and options['duration'] is None:
+            options['iterations'] = 5
+        try:
+            loadtest = LoadTest(
+                options['base_url'],
+                users=options['users'],
+                mix=options['mix'],
+                ramp_up=options['ramp_up'],
+                iterations=options['iterations'],
+                duration=options['duration'],
+                seed=options['seed'],
+                think_time=options['think_time'],
+                timeout=options['timeout'],
+            )
+            self.stdout.write(
+                f'{loadtest.users} shoppers ({", ".join(f"{k}={v:g}" for k, v in sorted(loadtest.mix.items()))}) '
+                f'against {loadtest.base_url}, seed {loadtest.seed}'
+            )
+            summary = loadtest.run()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.print_summary(summary, loadtest.elapsed)
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as output:
+                json.dump(loadtest.report(summary), output, indent=2)
+            self.stdout.write(f'Report written to {options["json"]}')
+
+        total = summary['TOTAL']
+        style = self.style.SUCCESS if not total['errors'] else self.style.WARNING
+        self.stdout.write(style(
+            f'{total["requests"]} requests in {loadtest.elapsed:.1f}s, '
+            f'{total["throughput"]:.1f} req/s, {total["error_rate"]:.1%} errors'
+        ))
+
+    def print_summary(self, summary, elapsed):
+        self.stdout.write(self.style.MIGRATE_HEADING('\nPer URL pattern'))
+        self.stdout.write(
+            f'  {"pattern":<20} {"reqs":>6} {"req/s":>7} {"err%":>6} '
+            f'{"p50":>8} {"p90":>8} {"p95":>8} {"p99":>8} {"max":>8}'
+        )
+        for pattern, row in summary.items():
+            line = (
+                f'  {pattern:<20} {row["requests"]:>6} {row["throughput"]:>7.1f} {row["error_rate"] * 100:>6.1f} '
+                f'{row["p50_ms"]:>8.1f} {row["p90_ms"]:>8.1f} {row["p95_ms"]:>8.1f} '
+                f'{row["p99_ms"]:>8.1f} {row["max_ms"]:>8.1f}'
+            )
+            self.stdout.write(self.style.MIGRATE_LABEL(line) if pattern == 'TOTAL' else line)
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nLatency histogram (ms, all requests)'))
+        histogram = summary['TOTAL']['histogram']
+        largest = max(histogram) or 1
+        labels = [f'<= {bound}' for bound in HISTOGRAM_BUCKETS] + [f'> {HISTOGRAM_BUCKETS[-1]}']
+        for label, count in zip(labels, histogram):
+            self.stdout.write(f'  {label:>8} {count:>7} {"#" * round(40 * count / largest)}')
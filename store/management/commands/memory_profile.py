@@ -0,0 +1,89 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from sr_supermarkt.memory import MemoryProfiler
+from store.models import Category, Product
+from store.warming import local_client
+
+
+USER_AGENT = 'sr-supermarkt-memory-profile'
+
+
+class Command(BaseCommand):
+    help = 'Replay requests in process under tracemalloc and report memory retained per view and the top growth sites'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help='Paths to cycle through; default home, listings, categories and products')
+        parser.add_argument('--requests', type=int, default=500, help='Requests to send in total')
+        parser.add_argument('--warmup', type=int, default=50,
+                            help='Requests before the baseline snapshot (caches filling up are not leaks)')
+        parser.add_argument('--frames', type=int, default=10, help='Stack frames kept per allocation')
+        parser.add_argument('--top', type=int, default=15, help='Growth sites to show')
+        parser.add_argument('--json', type=str, help='Also write the full report to this file')
+
+    def default_paths(self):
+        paths = [reverse('store:home'), reverse('store:product_list'),
+                 reverse('store:product_list') + '?sort_by=price_low&page=2',
+                 reverse('store:api_product_list')]
+        paths += [reverse('store:category_products', args=[slug]) for slug in
+                  Category.objects.filter(level=0, is_active=True).values_list('slug', flat=True)[:5]]
+        paths += [reverse('store:product_detail', args=[slug]) for slug in
+                  Product.objects.filter(is_available=True).values_list('slug', flat=True)[:20]]
+        return paths
+
+    def handle(self, *args, **options):
+        if options['requests'] <= options['warmup']:
+            raise CommandError('--requests must be larger than --warmup')
+        paths = options['paths'] or self.default_paths()
+        profiler = MemoryProfiler(
+            frames=options['frames'],
+            warmup=options['warmup'],
+            # One comparison, after the last request
+            snapshot_every=options['requests'] - options['warmup'],
+            top=options['top'],
+        )
+        profiler.start()
+        client = local_client(USER_AGENT)
+
+        statuses = {}
+        for number in range(options['requests']):
+            path = paths[number % len(paths)]
+            with profiler.measure() as sample:
+                response = client.get(path)
+                match = response.resolver_match
+                sample['type'] = f'GET {match.view_name if match else "unresolved"}'
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        report = profiler.report()
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Retained per request type (KiB)'))
+        self.stdout.write(f'  {"type":<40} {"reqs":>6} {"mean":>9} {"max":>9} {"peak":>9}')
+        for name, stats in report['types'].items():
+            self.stdout.write(
+                f'  {name:<40} {stats["requests"]:>6} {stats["mean_retained"] / 1024:>9.1f} '
+                f'{stats["max_retained"] / 1024:>9.1f} {stats["max_peak"] / 1024:>9.1f}'
+            )
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'\nGrowth between request {report["baseline_at"]} and {report["compared_at"]}'
+        ))
+        for growth in report['growth']:
+            self.stdout.write(
+                f'  {growth["size_diff"] / 1024:>+9.1f} KiB {growth["count_diff"]:>+7} blocks  {growth["site"]}'
+            )
+            for line in growth['traceback'][2:6]:
+                self.stdout.write(f'      {line.strip()}')
+        if not report['growth']:
+            self.stdout.write('  Nothing grew')
+
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f'Report written to {options["json"]}')
+
+        style = self.style.SUCCESS if set(statuses) <= {200, 301, 302, 304} else self.style.WARNING
+        self.stdout.write(style(
+            f'{report["requests"]} requests ({", ".join(f"{code}: {count}" for code, count in sorted(statuses.items()))}), '
+            f'traced {report["traced"] / 1024 / 1024:.1f} MiB, RSS {report["rss"] / 1024 / 1024:.1f} MiB'
+        ))
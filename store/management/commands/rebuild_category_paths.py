@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from store.category_paths import rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialised category paths on categories and products'
+
+    def handle(self, *args, **options):
+        changed = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f'Updated the paths of {changed} categories'))
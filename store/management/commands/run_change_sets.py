@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from store.change_sets import DEFAULT_BATCH_SIZE, run_due_change_sets
+
+
+class Command(BaseCommand):
+    help = 'Apply and revert scheduled product change sets that are due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Products written per UPDATE and per catalogue invalidation')
+        parser.add_argument('--watch', type=float, metavar='SECONDS',
+                            help='Keep running, checking for due change sets this often')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                handled = run_due_change_sets(batch_size=options['batch_size'], log=self.stdout.write)
+                if not options['watch']:
+                    break
+                time.sleep(options['watch'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped')
+            return
+        self.stdout.write(self.style.SUCCESS(f'{handled} change sets applied or reverted'))
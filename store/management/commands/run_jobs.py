@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from store.jobs import STALE_AFTER, claim_next, requeue_stale, run_job, worker_name
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (admin imports and exports)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait between polls when the queue is empty')
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        requeued = requeue_stale(STALE_AFTER)
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale jobs'))
+        self.stdout.write(f'Worker {worker} waiting for jobs')
+
+        try:
+            while True:
+                job = claim_next(worker)
+                if job is None:
+                    if options['burst']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                self.stdout.write(f'Running {job}')
+                started = time.monotonic()
+                run_job(job)
+                elapsed = time.monotonic() - started
+                if job.status == 'done':
+                    self.stdout.write(self.style.SUCCESS(f'Finished {job} in {elapsed:.1f}s'))
+                else:
+                    self.stdout.write(self.style.ERROR(f'{job} failed:\n{job.error}'))
+        except KeyboardInterrupt:
+            self.stdout.write('Worker stopped')
@@ -0,0 +1,153 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter so nothing is already imported. Does what a web
+# worker does before serving its first request and prints one JSON document.
+PROBE = r'''
+import json, os, time, tracemalloc
+
+def rss_kib():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+phases = [('interpreter', 0.0, rss_kib())]
+if {trace}:
+    tracemalloc.start()
+started = time.perf_counter()
+
+def phase(name):
+    phases.append((name, (time.perf_counter() - started) * 1000, rss_kib()))
+
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+phase('settings')
+django.setup()
+phase('django.setup()')
+if {urls}:
+    from django.urls import get_resolver
+    get_resolver().url_patterns  # imports every URLconf, views and admin
+    phase('URLconf')
+
+allocations = {{}}
+if {trace}:
+    for stat in tracemalloc.take_snapshot().statistics('filename'):
+        allocations[stat.traceback[0].filename] = stat.size // 1024
+print(json.dumps({{'phases': phases, 'allocations': allocations}}))
+'''
+
+STDLIB_NAMES = sys.stdlib_module_names | {'_frozen_importlib', '_frozen_importlib_external'}
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def module_group(module):
+    """Group a module by installed app / top-level package, e.g. django.contrib.admin.sites -> django.contrib.admin"""
+    parts = module.split('.')
+    if parts[0] in STDLIB_NAMES or parts[0].startswith('_sysconfigdata'):
+        return '<stdlib>'
+    if parts[:2] == ['django', 'contrib'] and len(parts) > 2:
+        return '.'.join(parts[:3])
+    return parts[0]
+
+
+def file_group(filename, sys_paths):
+    """Map a source file from tracemalloc back to a module group"""
+    for path in sys_paths:
+        if path and filename.startswith(path + os.sep):
+            relative = filename[len(path) + 1:]
+            module = relative.rsplit('.', 1)[0].replace(os.sep, '.').removesuffix('.__init__')
+            return module_group(module)
+    return '<other>'
+
+
+class Command(BaseCommand):
+    help = 'Profile cold start: import time and memory per app and module while Django sets up'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help='Number of slowest modules to list')
+        parser.add_argument('--no-urls', action='store_true',
+                            help='Stop after django.setup() instead of also loading the URLconf')
+        parser.add_argument('--no-tracemalloc', action='store_true',
+                            help='Skip per-app allocation tracking; tracemalloc inflates the timings')
+        parser.add_argument('--fail-over-ms', type=float,
+                            help='Exit with an error if total startup time exceeds this budget')
+        parser.add_argument('--json', action='store_true', help='Print the raw report as JSON')
+
+    def run_probe(self, options):
+        probe = PROBE.format(trace=not options['no_tracemalloc'], urls=not options['no_urls'])
+        # DJANGO_SETTINGS_MODULE is inherited from manage.py's environment
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', probe],
+            capture_output=True, text=True, cwd=os.getcwd(),
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Startup probe failed:\n{result.stderr[-2000:]}')
+        return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+    def handle(self, *args, **options):
+        report, importtime = self.run_probe(options)
+
+        modules = []
+        for line in importtime.splitlines():
+            match = IMPORTTIME_RE.match(line)
+            if match:
+                self_us, cumulative_us, _, name = match.groups()
+                modules.append((name, int(self_us), int(cumulative_us)))
+
+        groups = defaultdict(lambda: {'import_ms': 0.0, 'modules': 0, 'alloc_kib': 0})
+        for name, self_us, _ in modules:
+            group = groups[module_group(name)]
+            group['import_ms'] += self_us / 1000
+            group['modules'] += 1
+
+        sys_paths = sorted((os.path.abspath(path) for path in sys.path if path), key=len, reverse=True)
+        for filename, kib in report['allocations'].items():
+            groups[file_group(filename, sys_paths)]['alloc_kib'] += kib
+
+        phases = report['phases']
+        total_ms = phases[-1][1]
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'phases': phases,
+                'groups': groups,
+                'slowest_modules': sorted(modules, key=lambda m: m[1], reverse=True)[:options['top']],
+            }, indent=2))
+        else:
+            self.print_report(phases, groups, modules, options['top'])
+
+        budget = options.get('fail_over_ms')
+        if budget is not None and total_ms > budget:
+            raise CommandError(f'Startup took {total_ms:.0f} ms, over the {budget:.0f} ms budget')
+
+    def print_report(self, phases, groups, modules, top):
+        self.stdout.write(self.style.MIGRATE_HEADING('Phases'))
+        previous_rss = phases[0][2]
+        for name, elapsed_ms, rss_kib in phases:
+            self.stdout.write(
+                f'  {name:<20} {elapsed_ms:8.1f} ms  RSS {rss_kib / 1024:7.1f} MiB '
+                f'(+{(rss_kib - previous_rss) / 1024:.1f})'
+            )
+            previous_rss = rss_kib
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nPer app / package'))
+        self.stdout.write(f'  {"group":<32} {"modules":>7} {"import ms":>10} {"alloc KiB":>10}')
+        for name, group in sorted(groups.items(), key=lambda item: item[1]['import_ms'], reverse=True):
+            self.stdout.write(
+                f'  {name:<32} {group["modules"]:>7} {group["import_ms"]:>10.1f} {group["alloc_kib"]:>10}'
+            )
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\nSlowest {top} modules (self time)'))
+        for name, self_us, cumulative_us in sorted(modules, key=lambda m: m[1], reverse=True)[:top]:
+            self.stdout.write(f'  {name:<50} {self_us / 1000:8.1f} ms  (cumulative {cumulative_us / 1000:.1f} ms)')
@@ -0,0 +1,51 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from store.catalogue import bump_catalogue_version
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary database onto the DATABASE_REPLICAS (local stand-in for replication)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep syncing every INTERVAL seconds, simulating replica lag')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        targets = [settings.DATABASES[alias] for alias in settings.DATABASE_REPLICAS]
+        if not targets:
+            raise CommandError('DATABASE_REPLICAS is empty')
+        for database in [primary, *targets]:
+            if database['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError('sync_replicas only copies SQLite databases')
+
+        try:
+            while True:
+                started = time.monotonic()
+                self.sync(primary, targets)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Synced {len(targets)} replicas in {(time.monotonic() - started) * 1000:.0f} ms'
+                ))
+                if options['interval'] is None:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Sync stopped')
+
+    def sync(self, primary, targets):
+        # The backup API copies a consistent snapshot even while the primary takes writes
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for database in targets:
+                target = sqlite3.connect(database['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+        finally:
+            source.close()
+        # Replicas now hold newer rows than responses cached under the current version
+        bump_catalogue_version()
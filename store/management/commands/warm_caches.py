@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.warming import CacheWarmer
+
+
+class Command(BaseCommand):
+    help = 'Request home, category and popular product pages so the first visitors after a deploy hit warm caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', nargs='?',
+                            help='Running server to warm; without it pages are rendered in this process, '
+                                 'which only fills the default cache (it must be shared) and the database')
+        parser.add_argument('--concurrency', type=int, default=4, help='Requests in flight at once')
+        parser.add_argument('--products', type=int, default=200, help='Most viewed product pages to request')
+        parser.add_argument('--depth', type=int, default=2, help='Category tree levels to request')
+        parser.add_argument('--days', type=int, default=7, help='Rank products by views over this many days')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Per request timeout in seconds')
+
+    def handle(self, *args, **options):
+        warmer = CacheWarmer(
+            base_url=options['base_url'],
+            concurrency=options['concurrency'],
+            products=options['products'],
+            depth=options['depth'],
+            days=options['days'],
+            timeout=options['timeout'],
+        )
+        try:
+            warmer.run()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for kind, row in sorted(warmer.summary().items()):
+            self.stdout.write(
+                f'  {kind:<16} {row["requests"]:>6} requests {row["failed"]:>4} failed '
+                f'{row["total_ms"] / row["requests"]:>8.1f} ms avg {row["max_ms"]:>8.1f} ms max'
+            )
+        for kind, (warmed, total) in sorted(warmer.coverage().items()):
+            self.stdout.write(f'  {kind:<16} {warmed} of {total} warmed ({warmed / total if total else 0:.0%})')
+        for path, status in warmer.failures():
+            self.stdout.write(self.style.WARNING(f'{status} {path}'))
+
+        style = self.style.SUCCESS if not warmer.failures() else self.style.WARNING
+        self.stdout.write(style(
+            f'Warmed {len(warmer.results)} pages in {warmer.elapsed:.1f}s '
+            f'with {warmer.concurrency} concurrent requests'
+        ))
@@ -0,0 +1,162 @@
+"""
+Deduplicate catalogue images onto content-addressed names.
+
+``manage.py dedupe_media`` hashes every file under the image upload
+directories, copies each referenced file to its content-addressed name (so
+identical images collapse onto one file), rewrites the image columns in bulk
+with one CASE UPDATE per batch, and removes files nothing refers to any more.
+Files that were never referenced (orphans) are only deleted on request, and
+only once they are older than a grace period, so an upload whose row has not
+been committed yet is never swept.
+"""
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files import File
+from django.db import models, transaction
+from django.db.models import Case, Value, When
+
+from sr_supermarkt.db_router import use_primary
+from sr_supermarkt.storage import content_addressed_name, file_digest
+
+from .changefeed import record_changes
+from .models import Category, Product, ProductImage, image_storage
+
+
+# (model, image field, change feed model, id column of the changed object)
+IMAGE_FIELDS = [
+    (Product, 'main_image', 'product', 'id'),
+    (ProductImage, 'image', 'product', 'product_id'),
+    (Category, 'image', 'category', 'id'),
+]
+
+
+class MediaDeduplicator:
+    def __init__(self, storage=None, batch_size=500, workers=None, log=None):
+        self.storage = storage or image_storage()
+        self.batch_size = batch_size
+        self.workers = workers
+        self.log = log or (lambda message: None)
+
+        self.digests = {}
+        self.sizes = {}
+        self.groups = []
+        self.renames = {}
+        self.missing = []
+        self.removed = []
+        self.orphans = []
+        self.rewritten = 0
+
+    def upload_dirs(self):
+        return sorted({model._meta.get_field(field).upload_to.rstrip('/') for model, field, _, _ in IMAGE_FIELDS})
+
+    def scan(self):
+        """Hash every file below the upload directories"""
+        names = []
+        for directory in self.upload_dirs():
+            root = self.storage.path(directory)
+            for dirpath, _, filenames in os.walk(root):
+                relative = os.path.relpath(dirpath, self.storage.location)
+                names.extend(os.path.join(relative, filename) for filename in filenames)
+
+        def digest(name):
+            with self.storage.open(name, 'rb') as fileobj:
+                return name, file_digest(fileobj), self.storage.size(name)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for name, file_hash, size in executor.map(digest, names):
+                self.digests[name] = file_hash
+                self.sizes[name] = size
+        return self.digests
+
+    def references(self):
+        """Every image name stored in the database"""
+        names = set()
+        for model, field, _, _ in IMAGE_FIELDS:
+            names.update(
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .order_by().values_list(field, flat=True).distinct()
+            )
+        return names
+
+    def duplicate_groups(self):
+        """Names sharing the same content, as found by the scan"""
+        groups = defaultdict(list)
+        for name, file_hash in self.digests.items():
+            groups[file_hash].append(name)
+        return [sorted(names) for names in groups.values() if len(names) > 1]
+
+    def plan(self):
+        """Map each referenced name to its content-addressed name"""
+        for name in sorted(self.references()):
+            if name not in self.digests:
+                self.missing.append(name)
+                continue
+            target = content_addressed_name(name, self.digests[name])
+            if target != name:
+                self.renames[name] = target
+        return self.renames
+
+    def copy_to_targets(self):
+        for name, target in self.renames.items():
+            if target in self.digests:
+                continue
+            with self.storage.open(name, 'rb') as fileobj:
+                saved = self.storage.save(name, File(fileobj, name))
+            self.digests[saved] = self.digests[name]
+            self.sizes[saved] = self.sizes[name]
+
+    def rewrite_references(self):
+        """Point every image column at the content-addressed names, one UPDATE per batch"""
+        old_names = list(self.renames)
+        changed = defaultdict(set)
+        with transaction.atomic():
+            for model, field, feed_model, id_column in IMAGE_FIELDS:
+                for start in range(0, len(old_names), self.batch_size):
+                    batch = old_names[start:start + self.batch_size]
+                    rows = model.objects.filter(**{f'{field}__in': batch})
+                    changed[feed_model].update(rows.values_list(id_column, flat=True))
+                    self.rewritten += rows.update(**{field: Case(
+                        *[When(**{field: name}, then=Value(self.renames[name])) for name in batch],
+                        output_field=models.CharField(),
+                    )})
+            for feed_model, object_ids in changed.items():
+                record_changes(feed_model, sorted(object_ids))
+
+    def sweep(self, delete_orphans=False, orphan_grace=24 * 60 * 60):
+        """Delete files that were rewritten away; orphans only when asked and old enough"""
+        referenced = self.references()
+        replaced = set(self.renames)
+        cutoff = time.time() - orphan_grace
+        for name in sorted(self.digests):
+            if name in referenced:
+                continue
+            if name in replaced:
+                self.storage.delete(name)
+                self.removed.append(name)
+            elif delete_orphans and os.path.getmtime(self.storage.path(name)) < cutoff:
+                self.storage.delete(name)
+                self.removed.append(name)
+            else:
+                self.orphans.append(name)
+
+    def run(self, dry_run=False, delete_orphans=False, orphan_grace=24 * 60 * 60):
+        # A stale replica would make freshly referenced files look orphaned
+        with use_primary():
+            self.scan()
+            self.groups = self.duplicate_groups()
+            self.log(f'Hashed {len(self.digests)} files, {len(self.groups)} duplicate groups')
+            self.plan()
+            if dry_run:
+                referenced = self.references()
+                self.orphans = sorted(name for name in self.digests if name not in referenced)
+                return
+            self.copy_to_targets()
+            self.rewrite_references()
+            self.sweep(delete_orphans, orphan_grace)
+
+    def reclaimable_bytes(self):
+        """Bytes taken by every copy beyond the first in each duplicate group"""
+        return sum(self.sizes[name] for names in self.groups for name in names[1:])
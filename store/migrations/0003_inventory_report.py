@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_alter_category_name_alter_category_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryReportRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report', models.CharField(choices=[('low_stock', 'Low stock'), ('expiring', 'Expiring soon'), ('all', 'Low stock and expiring')], max_length=20)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('row_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at'], name='store_produ_updated_8f8f51_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock_quantity__lte', models.F('low_stock_threshold'))), fields=['stock_quantity'], name='product_low_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('expiry_date__isnull', False)), fields=['expiry_date'], name='product_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryreportrun',
+            index=models.Index(fields=['report', '-started_at'], name='store_inven_report_2655b8_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:39
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_inventory_report'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(choices=[('product', 'Product'), ('category', 'Category'), ('productimage', 'Product image')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('save', 'Saved'), ('delete', 'Deleted')], max_length=10)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['seq'],
+                'indexes': [models.Index(fields=['model', 'object_id', 'seq'], name='store_catal_model_06db32_idx'), models.Index(fields=['changed_at'], name='store_catal_changed_8306d8_idx')],
+            },
+        ),
+    ]
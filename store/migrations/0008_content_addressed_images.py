@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:52
+
+import store.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_category_subtree_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=store.models.image_storage, upload_to='categories/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='main_image',
+            field=models.ImageField(storage=store.models.image_storage, upload_to='products/main/'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=store.models.image_storage, upload_to='products/gallery/'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:56
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    Category = apps.get_model('store', 'Category')
+    Product = apps.get_model('store', 'Product')
+
+    paths = {None: []}
+    categories = []
+    for category in Category.objects.order_by('tree_id', 'lft'):
+        category.path = paths[category.parent_id] + [
+            {'id': category.pk, 'slug': category.slug, 'name': category.name}
+        ]
+        category.path_names = ' > '.join(entry['name'] for entry in category.path)
+        paths[category.pk] = category.path
+        categories.append(category)
+
+    Category.objects.bulk_update(categories, ['path', 'path_names'], batch_size=500)
+    for category in categories:
+        Product.objects.filter(category_id=category.pk).update(category_path=category.path)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path_names',
+            field=models.CharField(blank=True, editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='category_path',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:57
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+UNIT_PRICE_BASES = {
+    'g': ('kg', Decimal('1000')),
+    'kg': ('kg', Decimal('1')),
+    'ml': ('l', Decimal('1000')),
+    'l': ('l', Decimal('1')),
+    'pcs': ('pcs', Decimal('1')),
+}
+
+
+def populate_unit_prices(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    products = []
+    for product in Product.objects.exclude(weight__isnull=True).only('price', 'weight', 'weight_unit'):
+        base = UNIT_PRICE_BASES.get(product.weight_unit)
+        if base is None or product.weight <= 0:
+            continue
+        unit, per = base
+        product.unit_price = (product.price * per / product.weight).quantize(Decimal('0.0001'))
+        product.unit_price_unit = unit
+        products.append(product)
+    Product.objects.bulk_update(products, ['unit_price', 'unit_price_unit'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_category_paths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='unit_price_unit',
+            field=models.CharField(blank=True, choices=[('kg', 'per kg'), ('l', 'per litre'), ('pcs', 'per piece')], editable=False, max_length=3),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['unit_price'], name='product_unit_price_idx'),
+        ),
+        migrations.RunPython(populate_unit_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_default_levels(apps, schema_editor):
+    # Existing stock becomes the stock of the default location, so the
+    # totals already on Product stay correct
+    Product = apps.get_model('store', 'Product')
+    StockLevel = apps.get_model('store', 'StockLevel')
+    StockLocation = apps.get_model('store', 'StockLocation')
+    code = getattr(settings, 'DEFAULT_STOCK_LOCATION', 'main')
+    location, _ = StockLocation.objects.get_or_create(code=code, defaults={'name': code.replace('-', ' ').title()})
+    stocked = Product.objects.exclude(stock_quantity=0).order_by().values_list('id', 'stock_quantity')
+    StockLevel.objects.bulk_create(
+        (StockLevel(product_id=product_id, location=location, quantity=quantity) for product_id, quantity in stocked.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_query_plan_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('code', models.SlugField(unique=True)),
+                ('priority', models.IntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['priority', 'code'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='stock_quantity',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='StockLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_levels', to='store.product')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_levels', to='store.stocklocation')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'location'), name='store_stocklevel_unique_location')],
+            },
+        ),
+        migrations.RunPython(create_default_levels, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_stock_locations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductChangeSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('brand', models.CharField(blank=True, max_length=100)),
+                ('skus', models.TextField(blank=True, help_text='SKUs separated by commas or new lines, or a CSV with a sku column')),
+                ('price_mode', models.CharField(blank=True, choices=[('', 'Unchanged'), ('percent', 'Change by percentage'), ('amount', 'Change by amount'), ('fixed', 'Set to price')], max_length=10)),
+                ('price_value', models.DecimalField(blank=True, decimal_places=2, help_text='Percentage (-10 is 10% off), amount or price, per the price mode', max_digits=10, null=True)),
+                ('is_available', models.BooleanField(blank=True, null=True)),
+                ('is_featured', models.BooleanField(blank=True, null=True)),
+                ('is_bestseller', models.BooleanField(blank=True, null=True)),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField(blank=True, help_text='Leave empty to keep the change', null=True)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('applying', 'Applying'), ('active', 'Active'), ('reverting', 'Reverting'), ('reverted', 'Reverted'), ('failed', 'Failed')], default='scheduled', editable=False, max_length=10)),
+                ('product_count', models.IntegerField(default=0, editable=False)),
+                ('applied_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('reverted_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('error', models.TextField(blank=True, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(blank=True, help_text='Every product in this category and its subcategories', null=True, on_delete=django.db.models.deletion.PROTECT, to='store.category')),
+                ('created_by', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-starts_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductChangeSetItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('new_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('old_is_available', models.BooleanField()),
+                ('old_is_featured', models.BooleanField()),
+                ('old_is_bestseller', models.BooleanField()),
+                ('change_set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='store.productchangeset')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productchangeset',
+            index=models.Index(fields=['status', 'starts_at'], name='store_produ_status_774add_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productchangeset',
+            index=models.Index(fields=['status', 'ends_at'], name='store_produ_status_ad4e52_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productchangesetitem',
+            constraint=models.UniqueConstraint(fields=('change_set', 'product'), name='store_changesetitem_unique_product'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:30
+
+import os
+import shutil
+
+import store.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_job_files(apps, schema_editor):
+    # Same names, new root: files already written under MEDIA_ROOT/jobs move
+    # to PRIVATE_ROOT/jobs so the existing rows keep pointing at them
+    source = os.path.join(settings.MEDIA_ROOT, 'jobs')
+    if not os.path.isdir(source):
+        return
+    for directory, _, filenames in os.walk(source):
+        target_directory = os.path.join(settings.PRIVATE_ROOT, os.path.relpath(directory, settings.MEDIA_ROOT))
+        os.makedirs(target_directory, exist_ok=True)
+        for filename in filenames:
+            shutil.move(os.path.join(directory, filename), os.path.join(target_directory, filename))
+    shutil.rmtree(source)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_cache_table'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='input_file',
+            field=models.FileField(blank=True, storage=store.models.private_storage, upload_to='jobs/input/'),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='result_file',
+            field=models.FileField(blank=True, storage=store.models.private_storage, upload_to='jobs/results/'),
+        ),
+        migrations.RunPython(move_job_files, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,65 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import storages
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.contrib.auth.models import User
 from mptt.models import MPTTModel, TreeForeignKey
 from django.urls import reverse
 
 
+def image_storage():
+    """Catalogue images go through the 'images' backend (content addressed by default)"""
+    return storages['images']
+
+
+def private_storage():
+    """Files only staff may download, outside MEDIA_ROOT (the 'private' backend)"""
+    return storages['private']
+
+
+# weight_unit -> (unit a unit price is quoted per, weight units in that unit)
+UNIT_PRICE_BASES = {
+    'g': ('kg', Decimal('1000')),
+    'kg': ('kg', Decimal('1')),
+    'ml': ('l', Decimal('1000')),
+    'l': ('l', Decimal('1')),
+    'pcs': ('pcs', Decimal('1')),
+}
+
+
+def compute_unit_price(price, weight, weight_unit):
+    """
+    Price per kg, litre or piece as ``(unit_price, unit)``; ``(None, '')`` without a usable weight.
+
+    ``price`` and ``weight`` may be the strings the importer builds products from.
+    """
+    base = UNIT_PRICE_BASES.get(weight_unit)
+    if base is None or price in (None, '') or weight in (None, ''):
+        return None, ''
+    price, weight = Decimal(str(price)), Decimal(str(weight))
+    if weight <= 0:
+        return None, ''
+    unit, per = base
+    return (price * per / weight).quantize(Decimal('0.0001')), unit
+
+
 class Category(MPTTModel):
     name = models.CharField(max_length=100)  # Remove unique=True
     slug = models.SlugField(max_length=100, unique=True)  # Keep slug unique
     parent = TreeForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
     description = models.TextField(blank=True)
-    image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    image = models.ImageField(upload_to='categories/', storage=image_storage, blank=True, null=True)
     is_active = models.BooleanField(default=True)
 
+    # Materialised root-to-self path, kept current by store.category_paths:
+    # [{'id': ..., 'slug': ..., 'name': ...}, ...] and 'Indian > Rice & Flour > Basmati Rice'
+    path = models.JSONField(default=list, blank=True, editable=False)
+    path_names = models.CharField(max_length=500, blank=True, editable=False)
+
     class MPTTMeta:
         order_insertion_by = ['name']
 
@@ -19,11 +67,65 @@ class Category(MPTTModel):
         verbose_name_plural = "Categories"
         # Add unique together constraint for name and parent
         unique_together = ['name', 'parent']
+        indexes = [
+            # Subtree lookups are a range scan on (tree_id, lft), see ProductQuerySet.in_category
+            models.Index(fields=['tree_id', 'lft'], name='store_category_tree_id_lft_idx'),
+            # Case-insensitive name and path lookups of the importer, see resolve_categories()
+            models.Index(Lower('name'), name='category_lower_name_idx'),
+            models.Index(Lower('path_names'), name='category_lower_path_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def in_category(self, category):
+        """
+        Products in ``category`` or any of its descendants.
+
+        Filters on the MPTT range of the product's category (same tree_id,
+        lft between the category's lft and rght) instead of an IN list of
+        descendant ids, so it is one index range scan on Category joined to
+        the (category, is_available) index on Product.
+        """
+        return self.filter(
+            category__tree_id=category.tree_id,
+            category__lft__gte=category.lft,
+            category__lft__lte=category.rght,
+        )
+
+    def search(self, query):
+        """Free text match on name, description, brand and category name"""
+        return self.filter(
+            Q(name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(brand__icontains=query) |
+            Q(category__name__icontains=query)
+        )
+
+    def sorted_by(self, sort_by):
+        """
+        product_list's ``sort_by`` orders; anything else keeps the default ordering.
+
+        Ties are broken by id, in the direction of the sort so the indexes
+        still deliver the rows in order: offset pages are deterministic and
+        match the catalogue engine's (store/catalogue_engine.py).
+        """
+        if sort_by == 'price_low':
+            return self.order_by('price', 'pk')
+        if sort_by == 'price_high':
+            return self.order_by('-price', '-pk')
+        if sort_by == 'name':
+            return self.order_by('name', 'pk')
+        if sort_by == 'newest':
+            return self.order_by('-created_at', '-pk')
+        if sort_by == 'unit_price':
+            # Products without a weight have no unit price and go last
+            return self.order_by(F('unit_price').asc(nulls_last=True), 'pk')
+        return self
+
+
 class Product(models.Model):
     PRODUCT_TYPE_CHOICES = [
         ('grocery', 'Grocery'),
@@ -46,11 +148,19 @@ class Product(models.Model):
         ('pcs', 'Pieces'),
     ]
 
+    UNIT_PRICE_UNIT_CHOICES = [
+        ('kg', 'per kg'),
+        ('l', 'per litre'),
+        ('pcs', 'per piece'),
+    ]
+
     # Basic Information
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     description = models.TextField()
     category = TreeForeignKey(Category, on_delete=models.CASCADE, related_name='products')
+    # Copy of category.path for breadcrumbs and exports without tree queries
+    category_path = models.JSONField(default=list, blank=True, editable=False)
     product_type = models.CharField(max_length=20, choices=PRODUCT_TYPE_CHOICES)
 
     # Pricing
@@ -62,10 +172,14 @@ class Product(models.Model):
 
     # Inventory
     sku = models.CharField(max_length=50, unique=True, blank=True)
-    stock_quantity = models.IntegerField(default=0)
+    # Total over all StockLevels, kept in step by store.stock; never SUMmed on read
+    stock_quantity = models.IntegerField(default=0, editable=False)
     low_stock_threshold = models.IntegerField(default=5)
     weight = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True)
     weight_unit = models.CharField(max_length=5, choices=WEIGHT_UNIT_CHOICES, blank=True)
+    # Derived from price and weight by set_unit_price(), for comparing pack sizes
+    unit_price = models.DecimalField(max_digits=12, decimal_places=4, blank=True, null=True, editable=False)
+    unit_price_unit = models.CharField(max_length=3, choices=UNIT_PRICE_UNIT_CHOICES, blank=True, editable=False)
 
     # Product Details
     brand = models.CharField(max_length=100, blank=True)
@@ -81,12 +195,14 @@ class Product(models.Model):
     is_bestseller = models.BooleanField(default=False)
 
     # Images
-    main_image = models.ImageField(upload_to='products/main/')
+    main_image = models.ImageField(upload_to='products/main/', storage=image_storage)
 
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
@@ -94,6 +210,31 @@ class Product(models.Model):
             models.Index(fields=['name']),
             models.Index(fields=['category']),
             models.Index(fields=['is_available']),
+            models.Index(fields=['category', 'is_available']),
+            models.Index(fields=['updated_at']),
+            # sort_by=unit_price and the unit price range filter on product_list. Partial,
+            # because is_available=True is compiled to a bare boolean column that a
+            # composite (is_available, unit_price) index cannot be searched with
+            models.Index(
+                fields=['unit_price'],
+                condition=Q(is_available=True),
+                name='product_unit_price_idx',
+            ),
+            # sort_by=price_low/price_high and newest (also the default ordering) on
+            # product_list, partial for the same reason; see the plan tests in store/tests.py
+            models.Index(fields=['price'], condition=Q(is_available=True), name='product_price_idx'),
+            models.Index(fields=['created_at'], condition=Q(is_available=True), name='product_created_idx'),
+            # Partial indexes backing the inventory report (see store/inventory.py)
+            models.Index(
+                fields=['stock_quantity'],
+                condition=Q(stock_quantity__lte=F('low_stock_threshold')),
+                name='product_low_stock_idx',
+            ),
+            models.Index(
+                fields=['expiry_date'],
+                condition=Q(expiry_date__isnull=False),
+                name='product_expiry_idx',
+            ),
         ]
 
     def __str__(self):
@@ -108,11 +249,17 @@ class Product(models.Model):
             while Product.objects.filter(sku=self.sku).exists():
                 counter += 1
                 self.sku = f"{base_sku}{counter:03d}"
+        self.set_unit_price()
+        if self.category_id and (not self.category_path or self.category_path[-1]['id'] != self.category_id):
+            self.category_path = self.category.path
         super().save(*args, **kwargs)
 
     def get_absolute_url(self):
         return reverse('product_detail', args=[self.slug])
 
+    def set_unit_price(self):
+        self.unit_price, self.unit_price_unit = compute_unit_price(self.price, self.weight, self.weight_unit)
+
     @property
     def in_stock(self):
         return self.stock_quantity > 0
@@ -122,9 +269,214 @@ class Product(models.Model):
         return 0 < self.stock_quantity <= self.low_stock_threshold
 
 
+class StockLocation(models.Model):
+    """A place stock is held: the shop floor, a warehouse, another store"""
+    name = models.CharField(max_length=100)
+    code = models.SlugField(max_length=50, unique=True)
+    # Checkout takes stock from locations in ascending priority
+    priority = models.IntegerField(default=0)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['priority', 'code']
+
+    def __str__(self):
+        return self.name
+
+
+class StockLevel(models.Model):
+    """Units of a product at a location; changed only through store.stock"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_levels')
+    location = models.ForeignKey(StockLocation, on_delete=models.PROTECT, related_name='stock_levels')
+    quantity = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # Conflict target of the stock count upserts
+            models.UniqueConstraint(fields=['product', 'location'], name='store_stocklevel_unique_location'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} at {self.location_id}"
+
+
+class ProductChangeSet(models.Model):
+    """
+    A price and/or flag change over a category subtree, a brand or a list of
+    SKUs, applied at ``starts_at`` and reverted at ``ends_at`` by
+    ``manage.py run_change_sets`` (see store/change_sets.py)
+    """
+    PRICE_MODE_CHOICES = [
+        ('', 'Unchanged'),
+        ('percent', 'Change by percentage'),
+        ('amount', 'Change by amount'),
+        ('fixed', 'Set to price'),
+    ]
+    STATUS_CHOICES = [
+        ('scheduled', 'Scheduled'),
+        ('applying', 'Applying'),
+        ('active', 'Active'),
+        ('reverting', 'Reverting'),
+        ('reverted', 'Reverted'),
+        ('failed', 'Failed'),
+    ]
+    FLAG_FIELDS = ['is_available', 'is_featured', 'is_bestseller']
+
+    name = models.CharField(max_length=200)
+
+    # Scope: exactly one of these
+    category = models.ForeignKey(Category, on_delete=models.PROTECT, blank=True, null=True,
+                                 help_text='Every product in this category and its subcategories')
+    brand = models.CharField(max_length=100, blank=True)
+    skus = models.TextField(blank=True, help_text='SKUs separated by commas or new lines, or a CSV with a sku column')
+
+    price_mode = models.CharField(max_length=10, choices=PRICE_MODE_CHOICES, blank=True)
+    price_value = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True,
+                                      help_text='Percentage (-10 is 10% off), amount or price, per the price mode')
+    # None leaves the flag alone
+    is_available = models.BooleanField(blank=True, null=True)
+    is_featured = models.BooleanField(blank=True, null=True)
+    is_bestseller = models.BooleanField(blank=True, null=True)
+
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField(blank=True, null=True, help_text='Leave empty to keep the change')
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='scheduled', editable=False)
+    product_count = models.IntegerField(default=0, editable=False)
+    applied_at = models.DateTimeField(blank=True, null=True, editable=False)
+    reverted_at = models.DateTimeField(blank=True, null=True, editable=False)
+    heartbeat_at = models.DateTimeField(blank=True, null=True, editable=False)
+    error = models.TextField(blank=True, editable=False)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-starts_at']
+        indexes = [
+            # The runner's due lookups
+            models.Index(fields=['status', 'starts_at']),
+            models.Index(fields=['status', 'ends_at']),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def flag_changes(self):
+        return {name: getattr(self, name) for name in self.FLAG_FIELDS if getattr(self, name) is not None}
+
+    def clean(self):
+        scopes = [bool(self.category_id), bool(self.brand.strip()), bool(self.skus.strip())]
+        if sum(scopes) != 1:
+            raise ValidationError('Choose exactly one of a category, a brand or a list of SKUs.')
+        if self.price_mode and self.price_value is None:
+            raise ValidationError({'price_value': 'Required with a price mode.'})
+        if self.price_mode == 'fixed' and self.price_value is not None and self.price_value <= 0:
+            raise ValidationError({'price_value': 'A price must be positive.'})
+        if not self.price_mode and not self.flag_changes():
+            raise ValidationError('The change set does not change anything.')
+        if self.ends_at and self.ends_at <= self.starts_at:
+            raise ValidationError({'ends_at': 'Must be after the start.'})
+
+
+class ProductChangeSetItem(models.Model):
+    """What a change set did to one product, so it can be reverted"""
+    change_set = models.ForeignKey(ProductChangeSet, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    old_price = models.DecimalField(max_digits=10, decimal_places=2)
+    new_price = models.DecimalField(max_digits=10, decimal_places=2)
+    old_is_available = models.BooleanField()
+    old_is_featured = models.BooleanField()
+    old_is_bestseller = models.BooleanField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['change_set', 'product'], name='store_changesetitem_unique_product'),
+        ]
+
+
+class InventoryReportRun(models.Model):
+    """Bookkeeping for incremental inventory report runs"""
+    REPORT_CHOICES = [
+        ('low_stock', 'Low stock'),
+        ('expiring', 'Expiring soon'),
+        ('all', 'Low stock and expiring'),
+    ]
+
+    report = models.CharField(max_length=20, choices=REPORT_CHOICES)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(blank=True, null=True)
+    row_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['report', '-started_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_report_display()} report at {self.started_at:%Y-%m-%d %H:%M}"
+
+
+class ImportCheckpoint(models.Model):
+    """Progress of a chunked product import, so a failed import can resume"""
+    source_key = models.CharField(max_length=64, unique=True)  # sha256 of the file contents
+    source_name = models.CharField(max_length=255)
+    chunk_size = models.IntegerField()
+    chunks_done = models.IntegerField(default=0)
+    rows_done = models.IntegerField(default=0)
+    created_count = models.IntegerField(default=0)
+    skipped_count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source_name}: {self.rows_done} rows"
+
+
+class Job(models.Model):
+    """A unit of background work, run by the run_jobs worker (see store/jobs.py)"""
+    KIND_CHOICES = [
+        ('import_products', 'Import products'),
+        ('export_products', 'Export products'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    options = models.JSONField(default=dict, blank=True)
+    input_file = models.FileField(upload_to='jobs/input/', storage=private_storage, blank=True)
+    result_file = models.FileField(upload_to='jobs/results/', storage=private_storage, blank=True)
+    rows_done = models.IntegerField(default=0)
+    rows_total = models.IntegerField(blank=True, null=True)
+    message = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
+
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='products/gallery/')
+    image = models.ImageField(upload_to='products/gallery/', storage=image_storage)
     alt_text = models.CharField(max_length=200, blank=True)
     is_featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -153,6 +505,64 @@ class ProductReview(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ['product', 'user']  # One review per user per product
+        indexes = [
+            # Keyset pages of approved reviews, see store/reviews.py. Partial for the
+            # same reason as product_unit_price_idx: is_approved=True is a bare column
+            models.Index(
+                fields=['product', 'created_at', 'id'],
+                condition=Q(is_approved=True),
+                name='review_approved_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Review for {self.product.name} by {self.user.username}"
+
+
+
+class CatalogueChange(models.Model):
+    """
+    Append-only change log for catalogue models.
+
+    ``seq`` is the cursor: downstream consumers remember the last seq they
+    processed and ask for everything after it (see store/changefeed.py).
+    Seqs are assigned at insert, not commit, so the feed only hands out rows
+    older than CHANGE_FEED_LAG.
+    """
+    MODEL_CHOICES = [
+        ('product', 'Product'),
+        ('category', 'Category'),
+        ('productimage', 'Product image'),
+    ]
+    ACTION_CHOICES = [
+        ('save', 'Saved'),
+        ('delete', 'Deleted'),
+    ]
+
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['seq']
+        indexes = [
+            models.Index(fields=['model', 'object_id', 'seq']),
+            models.Index(fields=['changed_at']),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} {self.action} {self.model} {self.object_id}"
+
+
+class CatalogueVersion(models.Model):
+    """
+    The catalogue version as a single row (see store/catalogue.py): bumped
+    with one ``UPDATE ... SET version = version + 1``, so concurrent bumps
+    never land on the same value, and never evicted like a cache entry.
+    """
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"Catalogue version {self.version}"
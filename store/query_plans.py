@@ -0,0 +1,62 @@
+"""
+Query plan inspection for the catalogue's hot queries.
+
+explain() runs ``EXPLAIN QUERY PLAN`` (SQLite) or ``EXPLAIN`` (PostgreSQL)
+for a queryset or raw SQL and returns the plan as lines of text;
+plan_problems() picks out the lines that mean the query will not scale with
+the catalogue: a full table scan, or a sort the planner has to do in a
+temporary B-tree (SQLite) / Sort node (PostgreSQL) because no index delivers
+the rows in order. store/tests.py runs these against a synthetic catalogue
+for every query product_list, category_products, the carts and the importer
+issue, so a new filter or sort without an index fails there first.
+"""
+import re
+
+from django.db import connections
+
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(?P<table>\w+)\b(?P<using> USING (?:COVERING )?INDEX)?')
+SQLITE_TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (?:ORDER BY|RIGHT PART OF ORDER BY)')
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (?P<table>\w+)(?P<using>)')
+POSTGRES_SORT = re.compile(r'(?:^|-> +)Sort\b')
+
+
+def explain(query, params=(), using='default'):
+    """Plan lines for a queryset, or for raw ``query`` with ``params``"""
+    if hasattr(query, 'query'):
+        using = query.db
+        query, params = query.query.sql_with_params()
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {query}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {query}', params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def plan_problems(lines, vendor='sqlite', allow_scans=(), allow_index_scans=False, allow_sort=False):
+    """
+    Lines of a plan showing a full scan of a table not in ``allow_scans`` or
+    a sort without an index.
+
+    A walk over a whole index (SQLite's ``SCAN t USING INDEX``) counts as a
+    full scan unless ``allow_index_scans``: it is how a sorted, LIMITed
+    listing or a COUNT should read, and nothing else. ``allow_sort`` is for
+    queries that narrow the rows with one index and sort them on another
+    column (a price range sorted by name, a category subtree), where sorting
+    the selected rows is the plan to expect.
+    """
+    full_scan, sort = (
+        (SQLITE_FULL_SCAN, SQLITE_TEMP_SORT) if vendor == 'sqlite' else (POSTGRES_FULL_SCAN, POSTGRES_SORT)
+    )
+    problems = []
+    for line in lines:
+        text = line.strip()
+        scan = full_scan.search(text)
+        if scan and scan.group('table') not in allow_scans:
+            if not (allow_index_scans and scan.group('using')):
+                problems.append(text)
+        elif sort.search(text) and not allow_sort:
+            problems.append(text)
+    return problems
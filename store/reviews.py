@@ -0,0 +1,96 @@
+"""
+Approved reviews for product_detail.
+
+Reviews are keyset-paginated on (created_at, id), newest first, so every
+page is an index range read on the partial (product, created_at, id) WHERE
+is_approved index, however deep the reader goes. The first page, together
+with the review count and average rating, is cached per product as plain
+dicts. Anything that changes which reviews are approved (review saves and
+deletes, the admin bulk actions) invalidates that cache entry.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, Q
+
+from .models import ProductReview
+
+
+REVIEWS_PER_PAGE = 10
+FIRST_PAGE_TIMEOUT = 60 * 60
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _cache_key(product_id):
+    return f'store:reviews:{product_id}'
+
+
+def encode_cursor(review):
+    """'<created_at in microseconds>.<id>' of the last review on a page"""
+    microseconds = (review.created_at - _EPOCH) // timedelta(microseconds=1)
+    return f'{microseconds}.{review.pk}'
+
+
+def decode_cursor(cursor):
+    """``(created_at, id)`` from encode_cursor(), or None when malformed"""
+    try:
+        microseconds, review_id = (int(part) for part in cursor.split('.'))
+    except (AttributeError, ValueError):
+        return None
+    return _EPOCH + timedelta(microseconds=microseconds), review_id
+
+
+def _as_dict(review):
+    return {
+        'id': review.pk,
+        'rating': review.rating,
+        'title': review.title,
+        'comment': review.comment,
+        'created_at': review.created_at,
+        'username': review.user.username,
+    }
+
+
+def approved_reviews(product_id, after=None, limit=REVIEWS_PER_PAGE):
+    """One page of approved reviews after the ``(created_at, id)`` keyset ``after``"""
+    reviews = (
+        ProductReview.objects.filter(product_id=product_id, is_approved=True)
+        .select_related('user')
+        .only('rating', 'title', 'comment', 'created_at', 'user__username')
+        .order_by('-created_at', '-id')
+    )
+    if after is not None:
+        created_at, review_id = after
+        reviews = reviews.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=review_id))
+    reviews = list(reviews[:limit + 1])
+    next_cursor = encode_cursor(reviews[limit - 1]) if len(reviews) > limit else None
+    return [_as_dict(review) for review in reviews[:limit]], next_cursor
+
+
+def review_page(product_id, cursor=None):
+    """
+    ``{'reviews', 'next', 'count', 'average'}`` for product_detail.
+
+    The first page comes from the cache. ``count`` and ``average`` are only
+    filled in on the first page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    if after is not None:
+        reviews, next_cursor = approved_reviews(product_id, after)
+        return {'reviews': reviews, 'next': next_cursor, 'count': None, 'average': None}
+
+    key = _cache_key(product_id)
+    page = cache.get(key)
+    if page is None:
+        reviews, next_cursor = approved_reviews(product_id)
+        summary = ProductReview.objects.filter(product_id=product_id, is_approved=True).aggregate(
+            count=Count('id'), average=Avg('rating'),
+        )
+        page = {'reviews': reviews, 'next': next_cursor, **summary}
+        cache.set(key, page, FIRST_PAGE_TIMEOUT)
+    return page
+
+
+def invalidate_reviews(product_ids):
+    cache.delete_many([_cache_key(product_id) for product_id in set(product_ids)])
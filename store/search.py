@@ -0,0 +1,109 @@
+"""
+Search-as-you-type suggestions served from a per-process prefix index.
+
+The index is a sorted list of lower-cased keys (every word suffix of product
+names, brands and category names) searched with bisect, built lazily from a
+values_list() snapshot. It is rebuilt when the catalogue version changes;
+the version is checked at most once per SUGGEST_VERSION_CHECK_INTERVAL, so
+answering a suggestion normally touches neither the database nor the cache.
+"""
+import threading
+import time
+from bisect import bisect_left
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.urls import reverse
+
+from sr_supermarkt.db_router import use_primary
+
+from .catalogue import get_catalogue_version
+from .models import Category, Product
+
+
+def _word_suffixes(text):
+    """'Daal Makhani 280G' -> ['daal makhani 280g', 'makhani 280g', '280g']"""
+    words = text.lower().split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class SuggestionIndex:
+    KIND_ORDER = {'category': 0, 'brand': 1, 'product': 2}
+
+    def __init__(self, entries):
+        """``entries`` are ``(label, kind, url)`` tuples"""
+        keyed = sorted(
+            (key, self.KIND_ORDER[kind], label, kind, url)
+            for label, kind, url in entries
+            for key in _word_suffixes(label)
+        )
+        self.keys = [item[0] for item in keyed]
+        self.items = [item[2:] for item in keyed]
+
+    @classmethod
+    def from_database(cls):
+        product_url = reverse('store:product_detail', args=['__slug__'])
+        category_url = reverse('store:category_products', args=['__slug__'])
+        search_url = reverse('store:product_list')
+
+        entries = [
+            (name, 'product', product_url.replace('__slug__', slug))
+            for name, slug in Product.objects.filter(is_available=True).values_list('name', 'slug')
+        ]
+        entries += [
+            (name, 'category', category_url.replace('__slug__', slug))
+            for name, slug in Category.objects.filter(is_active=True).values_list('name', 'slug')
+        ]
+        brands = (
+            Product.objects.filter(is_available=True).exclude(brand='')
+            .order_by().values_list('brand', flat=True).distinct()
+        )
+        entries += [
+            (brand, 'brand', f'{search_url}?{urlencode({"q": brand})}') for brand in brands
+        ]
+        return cls(entries)
+
+    def suggest(self, query, limit=8):
+        prefix = ' '.join(query.lower().split())
+        if not prefix:
+            return []
+        suggestions, seen = [], set()
+        for position in range(bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[position].startswith(prefix):
+                break
+            label, kind, url = self.items[position]
+            if url in seen:
+                continue
+            seen.add(url)
+            suggestions.append({'label': label, 'type': kind, 'url': url})
+            if len(suggestions) >= limit:
+                break
+        return suggestions
+
+
+_index = None
+_index_version = None
+_version_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_suggestion_index():
+    """The process-wide SuggestionIndex, rebuilt when the catalogue version moves"""
+    global _index, _index_version, _version_checked_at
+
+    now = time.monotonic()
+    interval = getattr(settings, 'SUGGEST_VERSION_CHECK_INTERVAL', 1.0)
+    if _index is not None and now - _version_checked_at < interval:
+        return _index
+
+    version = get_catalogue_version()
+    _version_checked_at = now
+    if _index is not None and version == _index_version:
+        return _index
+
+    # Read from the primary: a lagging replica would pin stale rows to this version
+    with _lock, use_primary():
+        if _index is None or _index_version != version:
+            _index = SuggestionIndex.from_database()
+            _index_version = version
+    return _index
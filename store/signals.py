@@ -0,0 +1,53 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from .category_paths import path_is_stale, refresh_subtree
+from .changefeed import record_change
+from .models import Category, Product, ProductImage, ProductReview
+from .reviews import invalidate_reviews
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def catalogue_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    record_change(sender._meta.model_name, instance.pk, 'save')
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def catalogue_deleted(sender, instance, **kwargs):
+    record_change(sender._meta.model_name, instance.pk, 'delete')
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance, raw=False, **kwargs):
+    """Gallery changes are logged for the image and as a save of its product"""
+    if raw:
+        return
+    action = 'save' if 'created' in kwargs else 'delete'
+    record_change('productimage', instance.pk, action)
+    record_change('product', instance.product_id, 'save')
+
+
+@receiver(post_save, sender=Category)
+def category_path_saved(sender, instance, raw=False, **kwargs):
+    """Renames, new slugs and parent changes rewrite the paths of the whole subtree"""
+    if raw:
+        return
+    if path_is_stale(instance):
+        refresh_subtree(instance)
+
+
+@receiver(node_moved, sender=Category)
+def category_path_moved(sender, instance, **kwargs):
+    refresh_subtree(instance)
+
+
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def review_changed(sender, instance, raw=False, **kwargs):
+    invalidate_reviews([instance.product_id])
@@ -0,0 +1,164 @@
+"""
+Sharded XML sitemaps written to disk by ``manage.py build_sitemaps``.
+
+URLs are streamed from values_list() iterators straight into gzip files of
+at most SITEMAP_SHARD_SIZE entries, plus a sitemap.xml index listing the
+shards. Output is deterministic (gzip mtime 0), and a shard or the index is
+only replaced when its bytes changed, so unchanged files keep their mtime
+and Last-Modified. The sitemap views serve these files without running any
+catalogue queries.
+"""
+import filecmp
+import gzip
+import os
+import tempfile
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.urls import reverse
+
+from .models import Category, Product
+
+
+SHARD_PREFIX = 'sitemap-'
+INDEX_NAME = 'sitemap.xml'
+
+URLSET_OPEN = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+URLSET_CLOSE = '</urlset>\n'
+INDEX_OPEN = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+INDEX_CLOSE = '</sitemapindex>\n'
+
+
+def sitemap_root():
+    return str(settings.SITEMAP_ROOT)
+
+
+def _url_template(viewname):
+    return reverse(viewname, args=['__slug__'])
+
+
+def static_urls():
+    for viewname in ('store:home', 'store:product_list'):
+        yield reverse(viewname), None
+
+
+def category_urls():
+    template = _url_template('store:category_products')
+    slugs = (
+        Category.objects.filter(is_active=True)
+        .order_by('tree_id', 'lft')
+        .values_list('slug', flat=True)
+        .iterator(chunk_size=5000)
+    )
+    for slug in slugs:
+        yield template.replace('__slug__', slug), None
+
+
+def product_urls():
+    template = _url_template('store:product_detail')
+    rows = (
+        Product.objects.filter(is_available=True)
+        .order_by('pk')
+        .values_list('slug', 'updated_at')
+        .iterator(chunk_size=5000)
+    )
+    for slug, updated_at in rows:
+        yield template.replace('__slug__', slug), updated_at.date()
+
+
+SECTIONS = [
+    ('static', static_urls),
+    ('categories', category_urls),
+    ('products', product_urls),
+]
+
+
+class SitemapWriter:
+    def __init__(self, base_url, root=None, shard_size=None):
+        self.base_url = base_url.rstrip('/')
+        self.root = root or sitemap_root()
+        self.shard_size = shard_size or settings.SITEMAP_SHARD_SIZE
+        self.written = []
+        self.unchanged = []
+        self.removed = []
+
+    def _replace_if_changed(self, tmp_path, name):
+        """Move ``tmp_path`` over ``name`` unless the file already has the same bytes"""
+        target = os.path.join(self.root, name)
+        if os.path.exists(target) and filecmp.cmp(tmp_path, target, shallow=False):
+            os.remove(tmp_path)
+            self.unchanged.append(name)
+        else:
+            os.replace(tmp_path, target)
+            self.written.append(name)
+
+    def _write_shard(self, name, entries):
+        """Write a gzipped urlset; returns the newest lastmod in it"""
+        newest = None
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as output:
+            output.write(URLSET_OPEN.encode())
+            for location, lastmod in entries:
+                entry = f'<url><loc>{escape(self.base_url + location)}</loc>'
+                if lastmod is not None:
+                    entry += f'<lastmod>{lastmod.isoformat()}</lastmod>'
+                    newest = lastmod if newest is None else max(newest, lastmod)
+                output.write((entry + '</url>\n').encode())
+            output.write(URLSET_CLOSE.encode())
+        self._replace_if_changed(tmp_path, name)
+        return newest
+
+    def _write_index(self, shards):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as output:
+            output.write(INDEX_OPEN)
+            for name, lastmod in shards:
+                location = self.base_url + reverse('store:sitemap_shard', args=[name])
+                output.write(f'<sitemap><loc>{escape(location)}</loc>')
+                if lastmod is not None:
+                    output.write(f'<lastmod>{lastmod.isoformat()}</lastmod>')
+                output.write('</sitemap>\n')
+            output.write(INDEX_CLOSE)
+        self._replace_if_changed(tmp_path, INDEX_NAME)
+
+    def _shards(self, section, urls):
+        """Split a section's url iterator into consecutive shards without materialising it"""
+        urls = iter(urls)
+        number = 1
+        while True:
+            try:
+                first = next(urls)
+            except StopIteration:
+                return
+
+            def entries(first=first):
+                yield first
+                for _ in range(self.shard_size - 1):
+                    try:
+                        yield next(urls)
+                    except StopIteration:
+                        return
+
+            yield f'{SHARD_PREFIX}{section}-{number}.xml.gz', entries()
+            number += 1
+
+    def build(self):
+        os.makedirs(self.root, exist_ok=True)
+        shards = []
+        for section, urls in SECTIONS:
+            for name, entries in self._shards(section, urls()):
+                shards.append((name, self._write_shard(name, entries)))
+        self._write_index(shards)
+
+        current = {name for name, _ in shards}
+        for name in os.listdir(self.root):
+            if name.startswith(SHARD_PREFIX) and name.endswith('.xml.gz') and name not in current:
+                os.remove(os.path.join(self.root, name))
+                self.removed.append(name)
+        return shards
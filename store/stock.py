@@ -0,0 +1,200 @@
+"""
+Stock held per location.
+
+Product.stock_quantity is the total of the product's StockLevels, but it is
+never computed with SUM: every function here changes the levels and applies
+the same delta to the product column in the same transaction, so listings,
+``in_stock``/``low_stock`` and the inventory report keep reading a single
+column. Product deltas are applied with one ``stock_quantity +
+CASE id WHEN ... END`` UPDATE per batch, which also moves ``updated_at`` so
+incremental inventory reports see the change.
+
+Checkout takes stock with allocate(): all or nothing, from the active
+locations in priority order, each decrement guarded by ``quantity >= n`` in
+its own UPDATE so two checkouts racing for the last units cannot both win.
+"""
+import codecs
+import csv
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Now
+
+from .changefeed import record_changes
+from .models import Product, StockLevel, StockLocation
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        self.shortages = shortages  # {product_id: units missing}
+        super().__init__(f'Not enough stock for products {", ".join(map(str, sorted(shortages)))}')
+
+
+def default_location():
+    """The location stock goes to when none is given (DEFAULT_STOCK_LOCATION)"""
+    code = getattr(settings, 'DEFAULT_STOCK_LOCATION', 'main')
+    location, _ = StockLocation.objects.get_or_create(code=code, defaults={'name': code.replace('-', ' ').title()})
+    return location
+
+
+def apply_product_deltas(deltas, batch_size=500):
+    """Add ``{product_id: delta}`` to Product.stock_quantity, one UPDATE per batch"""
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    product_ids = sorted(deltas)
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        Product.objects.filter(pk__in=batch).update(stock_quantity=F('stock_quantity') + Case(
+            *[When(pk=product_id, then=Value(deltas[product_id])) for product_id in batch],
+            output_field=models.IntegerField(),
+        ), updated_at=Now())
+    record_changes('product', product_ids)
+
+
+def adjust_stock(product_id, location, delta):
+    """Add ``delta`` units (remove, when negative) at one location"""
+    with transaction.atomic():
+        updated = StockLevel.objects.filter(product_id=product_id, location=location).update(
+            quantity=F('quantity') + delta, updated_at=Now(),
+        )
+        if not updated:
+            StockLevel.objects.create(product_id=product_id, location=location, quantity=delta)
+        apply_product_deltas({product_id: delta})
+
+
+def create_initial_levels(products, location=None):
+    """StockLevels for newly created products whose stock_quantity was set directly"""
+    location = location or default_location()
+    StockLevel.objects.bulk_create([
+        StockLevel(product_id=product.pk, location=location, quantity=product.stock_quantity)
+        for product in products if product.stock_quantity
+    ])
+
+
+def set_stock_counts(counts, batch_size=500):
+    """
+    Replace levels with counted quantities, ``{(product_id, location_id): quantity}``.
+
+    Only levels whose count differs are written; each product's total moves
+    by the sum of its differences. Returns the number of levels changed.
+    """
+    with transaction.atomic():
+        current = {}
+        product_ids = sorted({product_id for product_id, _ in counts})
+        for start in range(0, len(product_ids), batch_size):
+            levels = StockLevel.objects.select_for_update().filter(
+                product_id__in=product_ids[start:start + batch_size],
+            ).values_list('product_id', 'location_id', 'quantity')
+            current.update({(product_id, location_id): quantity for product_id, location_id, quantity in levels})
+
+        changed = {key: quantity for key, quantity in counts.items() if current.get(key, 0) != quantity}
+        deltas = defaultdict(int)
+        for (product_id, location_id), quantity in changed.items():
+            deltas[product_id] += quantity - current.get((product_id, location_id), 0)
+
+        StockLevel.objects.bulk_create(
+            [
+                StockLevel(product_id=product_id, location_id=location_id, quantity=quantity)
+                for (product_id, location_id), quantity in changed.items()
+            ],
+            batch_size=batch_size, update_conflicts=True,
+            unique_fields=['product', 'location'], update_fields=['quantity', 'updated_at'],
+        )
+        apply_product_deltas(deltas, batch_size)
+    return len(changed)
+
+
+def allocate(quantities):
+    """
+    Take ``{product_id: quantity}`` from stock, all or nothing.
+
+    Returns the allocations as ``[(product_id, location_id, quantity)]``,
+    to hand back to release() if the order is cancelled. Raises
+    InsufficientStock, with nothing taken, when any product is short.
+    """
+    with transaction.atomic():
+        levels = defaultdict(list)
+        for level_id, product_id, location_id, quantity in (
+            StockLevel.objects.select_for_update(of=('self',))
+            .filter(product_id__in=quantities, quantity__gt=0, location__is_active=True)
+            .order_by('location__priority', 'location_id')
+            .values_list('id', 'product_id', 'location_id', 'quantity')
+        ):
+            levels[product_id].append((level_id, location_id, quantity))
+
+        plan, shortages = [], {}
+        for product_id, wanted in quantities.items():
+            for level_id, location_id, available in levels[product_id]:
+                if wanted <= 0:
+                    break
+                take = min(wanted, available)
+                plan.append((level_id, product_id, location_id, take))
+                wanted -= take
+            if wanted > 0:
+                shortages[product_id] = wanted
+        if shortages:
+            raise InsufficientStock(shortages)
+
+        for level_id, product_id, location_id, take in plan:
+            # Guarded: a concurrent checkout may have taken the units since they were read
+            if not StockLevel.objects.filter(pk=level_id, quantity__gte=take).update(
+                    quantity=F('quantity') - take, updated_at=Now()):
+                raise InsufficientStock({product_id: take})
+        apply_product_deltas({product_id: -quantity for product_id, quantity in quantities.items()})
+    return [(product_id, location_id, take) for _, product_id, location_id, take in plan]
+
+
+def release(allocations):
+    """Put allocated stock back where it was taken from"""
+    with transaction.atomic():
+        deltas = defaultdict(int)
+        for product_id, location_id, quantity in allocations:
+            StockLevel.objects.filter(product_id=product_id, location_id=location_id).update(
+                quantity=F('quantity') + quantity, updated_at=Now(),
+            )
+            deltas[product_id] += quantity
+        apply_product_deltas(deltas)
+
+
+def read_stock_counts(fileobj, location_code=None):
+    """
+    Parse a stock count CSV (sku, location, quantity) into set_stock_counts() input.
+
+    ``location_code`` is used for rows without a location column or value.
+    Returns ``(counts, errors)`` with errors as ``(row_number, message)``.
+    """
+    reader = csv.DictReader(codecs.getreader('utf-8-sig')(fileobj))
+    rows = list(reader)
+    if not reader.fieldnames or 'sku' not in reader.fieldnames or 'quantity' not in reader.fieldnames:
+        return {}, [(1, 'the header needs sku and quantity columns')]
+
+    skus = {row['sku'].strip() for row in rows if row.get('sku')}
+    products = {}
+    sku_list = sorted(skus)
+    for start in range(0, len(sku_list), 500):
+        products.update(
+            Product.objects.filter(sku__in=sku_list[start:start + 500]).order_by().values_list('sku', 'id')
+        )
+    locations = dict(StockLocation.objects.values_list('code', 'id'))
+
+    counts, errors = {}, []
+    for row_number, row in enumerate(rows, start=2):
+        sku = (row.get('sku') or '').strip()
+        code = (row.get('location') or '').strip() or location_code
+        if sku not in products:
+            errors.append((row_number, f'unknown sku {sku!r}'))
+            continue
+        if code not in locations:
+            errors.append((row_number, f'unknown location {code!r}' if code else 'no location given'))
+            continue
+        try:
+            quantity = int((row.get('quantity') or '').strip())
+        except ValueError:
+            errors.append((row_number, f'invalid quantity {row.get("quantity")!r}'))
+            continue
+        if quantity < 0:
+            errors.append((row_number, 'quantity cannot be negative'))
+            continue
+        counts[(products[sku], locations[code])] = quantity
+    return counts, errors
@@ -0,0 +1,166 @@
+"""
+Parameter normalisation and throttling for product_list.
+
+Listing parameters are parsed once, up front: prices become two-decimal
+Decimals (unparseable or negative values are dropped, swapped bounds are
+put back in order), the search text is whitespace-collapsed and cut to
+MAX_QUERY_LENGTH, and unknown sorts and pages fall back to the defaults.
+Equivalent URLs therefore share one canonical form, which keys a cache of
+the matched product ids per catalogue version: every page of a search,
+and anyone repeating it, reads the ids from the cache instead of running
+the search and its COUNT again.
+
+Requests that miss that cache and search, filter on price or go past
+LISTING_DEEP_PAGE take a token from a per-client bucket ('search' or
+'deep_page' in LISTING_THROTTLE_RATES), refilled continuously and kept in
+the 'throttle' cache. Buckets and result ids have cache aliases of their
+own ('throttle' and 'listing'): a burst of distinct searches culls old
+results, never buckets, which would come back full. Clients are the logged-in user, else the IP (the /64 network
+for IPv6; behind TRUSTED_PROXY_COUNT proxies, taken from X-Forwarded-For).
+Crawler User-Agents get LISTING_THROTTLE_BOT_FACTOR of the rate and burst,
+and addresses in LISTING_THROTTLE_EXEMPT_IPS are never limited (none by
+default; local load tests opt in). An empty bucket means a degraded page
+with a 429 and Retry-After, not a query. Bucket updates are a get and a
+set on a shared cache, so concurrent requests may occasionally both take
+the last token.
+"""
+import hashlib
+import ipaddress
+import math
+import time
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .catalogue import get_catalogue_version
+
+
+MAX_QUERY_LENGTH = 100
+MAX_PRICE = Decimal('100000')
+PRICE_PARAMS = ['min_price', 'max_price', 'min_unit_price', 'max_unit_price']
+FLAG_PARAMS = ['halal', 'vegetarian']
+SORT_OPTIONS = ['name', 'price_low', 'price_high', 'newest', 'unit_price']
+DEFAULT_SORT = 'name'
+RESULTS_TIMEOUT = 10 * 60
+THROTTLE_CACHE = 'throttle'
+RESULTS_CACHE = 'listing'
+
+
+def _price(value):
+    try:
+        price = Decimal(value.strip())
+    except (AttributeError, InvalidOperation):
+        return None
+    if not price.is_finite() or price < 0:
+        return None
+    return min(price, MAX_PRICE).quantize(Decimal('0.01'))
+
+
+def normalise_listing_params(query_dict):
+    """Clean product_list parameters; anything unusable is dropped"""
+    params = {
+        'q': ' '.join(query_dict.get('q', '').split())[:MAX_QUERY_LENGTH],
+        'category': query_dict.get('category', '').strip(),
+        'sort_by': query_dict.get('sort_by', DEFAULT_SORT),
+    }
+    if params['sort_by'] not in SORT_OPTIONS:
+        params['sort_by'] = DEFAULT_SORT
+    for name in PRICE_PARAMS:
+        params[name] = _price(query_dict.get(name))
+    for low, high in (('min_price', 'max_price'), ('min_unit_price', 'max_unit_price')):
+        if params[low] is not None and params[high] is not None and params[low] > params[high]:
+            params[low], params[high] = params[high], params[low]
+    for name in FLAG_PARAMS:
+        params[name] = query_dict.get(name) == '1'
+    try:
+        params['page'] = max(int(query_dict.get('page', 1)), 1)
+    except (TypeError, ValueError):
+        params['page'] = 1
+    return params
+
+
+def canonical_query(params, page=False):
+    """Sorted query string of the non-default parameters, without the page unless asked"""
+    items = []
+    for name, value in sorted(params.items()):
+        if name == 'page' and not page:
+            continue
+        if value in (None, '', False) or (name == 'sort_by' and value == DEFAULT_SORT):
+            continue
+        items.append((name, '1' if value is True else str(value)))
+    return urlencode(items)
+
+
+def throttle_bucket(params):
+    """The bucket a listing request draws from, or None when it is cheap"""
+    if params['page'] > settings.LISTING_DEEP_PAGE:
+        return 'deep_page'
+    if params['q'] or any(params[name] is not None for name in PRICE_PARAMS):
+        return 'search'
+    return None
+
+
+def is_bot(request):
+    user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
+    return not user_agent or any(marker in user_agent for marker in settings.BOT_USER_AGENT_MARKERS)
+
+
+def client_address(request):
+    proxies = getattr(settings, 'TRUSTED_PROXY_COUNT', 0)
+    forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+    if proxies and len(forwarded) >= proxies:
+        # Each trusted proxy appended the address it received the request from
+        return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    address = client_address(request)
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return f'ip:{address}'
+    if ip.version == 6:
+        # One client usually holds a whole /64
+        return f'ip:{ipaddress.ip_network(f"{ip}/64", strict=False)}'
+    return f'ip:{ip}'
+
+
+def take_token(request, bucket):
+    """``(allowed, retry_after_seconds)`` after taking a token from the client's ``bucket``"""
+    if client_address(request) in settings.LISTING_THROTTLE_EXEMPT_IPS:
+        return True, 0
+    rate, burst = settings.LISTING_THROTTLE_RATES[bucket]
+    if is_bot(request):
+        factor = settings.LISTING_THROTTLE_BOT_FACTOR
+        rate, burst = rate * factor, max(burst * factor, 1)
+    key = 'store:throttle:' + hashlib.md5(f'{bucket}:{client_key(request)}'.encode()).hexdigest()
+    now = time.time()
+    cache = caches[THROTTLE_CACHE]
+    tokens, updated_at = cache.get(key, (burst, now))
+    tokens = min(burst, tokens + (now - updated_at) * rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    # Expire once the bucket would have refilled anyway
+    cache.set(key, (tokens, now), math.ceil(burst / rate) + 1)
+    return allowed, 0 if allowed else math.ceil((1 - tokens) / rate)
+
+
+def _results_key(params):
+    query = canonical_query(params)
+    return f'store:listing:{get_catalogue_version()}:{hashlib.md5(query.encode()).hexdigest()}'
+
+
+def cached_results(params):
+    """Product ids of an earlier identical listing, or None"""
+    return caches[RESULTS_CACHE].get(_results_key(params))
+
+
+def cache_results(params, ids):
+    caches[RESULTS_CACHE].set(_results_key(params), [int(product_id) for product_id in ids], RESULTS_TIMEOUT)
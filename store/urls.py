@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'store'
 
@@ -8,4 +8,11 @@ urlpatterns = [
     path('products/', views.product_list, name='product_list'),
     path('category/<slug:slug>/', views.category_products, name='category_products'),
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
+    path('changes/', views.catalogue_changes, name='catalogue_changes'),
+    path('sitemap.xml', views.sitemap_index, name='sitemap_index'),
+    path('sitemaps/<str:name>', views.sitemap_shard, name='sitemap_shard'),
+    path('api/products/', api.product_list, name='api_product_list'),
+    path('api/categories/', api.category_list, name='api_category_list'),
+    path('api/categories/tree/', api.category_tree, name='api_category_tree'),
 ]
\ No newline at end of file
@@ -1,6 +1,16 @@
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Q
+import os
+from django.conf import settings
+from django.http import FileResponse, Http404, JsonResponse
+from django.views.decorators.http import require_GET
+from analytics.tracking import record_product_view
 from .models import Category, Product, ProductImage
+from .catalogue_engine import ProductPage, get_catalogue_engine
+from .changefeed import changes_since
+from .reviews import review_page
+from .search import get_suggestion_index
+from .sitemaps import INDEX_NAME, SHARD_PREFIX
+from .throttling import cache_results, cached_results, normalise_listing_params, take_token, throttle_bucket
 from django.core.paginator import Paginator
 
 
@@ -20,63 +30,95 @@ def home(request):
 
 def product_list(request):
     """All products listing with filtering and pagination"""
-    products = Product.objects.filter(is_available=True)
-
-    # Search functionality
-    query = request.GET.get('q')
-    if query:
-        products = products.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(brand__icontains=query) |
-            Q(category__name__icontains=query)
+    params = normalise_listing_params(request.GET)
+    query = params['q']
+    category = None
+    if params['category']:
+        category = get_object_or_404(Category, slug=params['category'])
+
+    # Searches, price filters and deep pages reuse earlier identical results,
+    # or are throttled per client when they would run the queries again
+    bucket = throttle_bucket(params)
+    ids = cached_results(params) if bucket else None
+    if bucket and ids is None:
+        allowed, retry_after = take_token(request, bucket)
+        if not allowed:
+            return _throttled_listing(request, retry_after)
+
+    # Without a text search the in-process catalogue engine can answer the
+    # whole filter + sort, leaving only the page's rows for the database
+    engine = get_catalogue_engine()
+    if ids is None and engine is not None and not query:
+        ids = engine.current().product_ids(
+            category=category,
+            min_price=params['min_price'], max_price=params['max_price'],
+            min_unit_price=params['min_unit_price'], max_unit_price=params['max_unit_price'],
+            halal=params['halal'], vegetarian=params['vegetarian'], sort_by=params['sort_by'],
         )
-
-    # Category filter
-    category_slug = request.GET.get('category')
-    if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category__in=category.get_descendants(include_self=True))
-
-    # Price filter
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price:
-        products = products.filter(price__gte=min_price)
-    if max_price:
-        products = products.filter(price__lte=max_price)
-
-    # Sort by
-    sort_by = request.GET.get('sort_by', 'name')
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    elif sort_by == 'name':
-        products = products.order_by('name')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
+        if bucket:
+            cache_results(params, ids)
+    elif ids is None:
+        products = Product.objects.filter(is_available=True)
+        if query:
+            products = products.search(query)
+        if category is not None:
+            products = products.in_category(category)
+        for name, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte'),
+                             ('min_unit_price', 'unit_price__gte'), ('max_unit_price', 'unit_price__lte')):
+            if params[name] is not None:
+                products = products.filter(**{lookup: params[name]})
+        if params['halal']:
+            products = products.filter(is_halal=True)
+        if params['vegetarian']:
+            products = products.filter(is_vegetarian=True)
+        products = products.sorted_by(params['sort_by'])
+
+        if bucket:
+            # One id query instead of a page query and a COUNT, shared by
+            # every page of these results
+            ids = list(products.values_list('id', flat=True))
+            cache_results(params, ids)
+        else:
+            paginator = Paginator(products, 12)  # 12 products per page
+            total_products = products.count()
+
+    if ids is not None:
+        paginator = Paginator(ProductPage(ids), 12)
+        total_products = len(ids)
 
     # Pagination
-    paginator = Paginator(products, 12)  # 12 products per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginator.get_page(params['page'])
 
     context = {
         'page_obj': page_obj,
         'categories': Category.objects.filter(level=0, is_active=True),
-        'total_products': products.count(),
+        'total_products': total_products,
     }
     return render(request, 'store/product_list.html', context)
 
 
+def _throttled_listing(request, retry_after):
+    """product_list without results, for clients over their search or paging limit"""
+    context = {
+        'page_obj': Paginator([], 12).get_page(1),
+        'categories': Category.objects.filter(level=0, is_active=True),
+        'total_products': 0,
+        'retry_after': retry_after,
+    }
+    response = render(request, 'store/product_list.html', context, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
 def category_products(request, slug):
     """Products by category"""
     category = get_object_or_404(Category, slug=slug)
-    products = Product.objects.filter(
-        category__in=category.get_descendants(include_self=True),
-        is_available=True
-    )
+
+    engine = get_catalogue_engine()
+    if engine is not None:
+        products = ProductPage(engine.current().product_ids(category=category, sort_by='newest'))
+    else:
+        products = Product.objects.filter(is_available=True).in_category(category).sorted_by('newest')
 
     # Pagination
     paginator = Paginator(products, 12)
@@ -95,6 +137,7 @@ def category_products(request, slug):
 def product_detail(request, slug):
     """Product detail page"""
     product = get_object_or_404(Product, slug=slug, is_available=True)
+    record_product_view(request, product.id)
     related_products = Product.objects.filter(
         category=product.category,
         is_available=True
@@ -107,5 +150,59 @@ def product_detail(request, slug):
         'product': product,
         'product_images': product_images,
         'related_products': related_products,
+        'review_page': review_page(product.id, request.GET.get('reviews_after')),
     }
-    return render(request, 'store/product_detail.html', context)
\ No newline at end of file
+    return render(request, 'store/product_detail.html', context)
+
+
+@require_GET
+def catalogue_changes(request):
+    """Catalogue change feed: changes after ?since=<cursor>, in batches of ?limit="""
+    try:
+        cursor = max(int(request.GET.get('since', 0)), 0)
+        limit = min(max(int(request.GET.get('limit', 500)), 1), 1000)
+    except ValueError:
+        return JsonResponse({'error': 'since and limit must be integers'}, status=400)
+
+    models = request.GET.getlist('model') or None
+    changes, next_cursor = changes_since(cursor, limit=limit, models=models)
+    return JsonResponse({
+        'changes': changes,
+        'next_cursor': next_cursor,
+        'has_more': len(changes) == limit,
+    })
+
+
+@require_GET
+def search_suggest(request):
+    """Search-as-you-type suggestions for the navbar search box"""
+    query = request.GET.get('q', '').strip()
+    suggestions = []
+    if len(query) >= 2:
+        suggestions = get_suggestion_index().suggest(query[:100])
+    response = JsonResponse({'query': query, 'suggestions': suggestions})
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+def _sitemap_file(name, content_type):
+    path = os.path.join(str(settings.SITEMAP_ROOT), name)
+    if not os.path.isfile(path):
+        raise Http404('Sitemap has not been built')
+    response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+
+@require_GET
+def sitemap_index(request):
+    """Sitemap index written by the build_sitemaps command"""
+    return _sitemap_file(INDEX_NAME, 'application/xml')
+
+
+@require_GET
+def sitemap_shard(request, name):
+    """A gzipped sitemap shard written by the build_sitemaps command"""
+    if not name.startswith(SHARD_PREFIX) or not name.endswith('.xml.gz') or os.sep in name:
+        raise Http404
+    return _sitemap_file(name, 'application/gzip')
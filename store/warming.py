@@ -0,0 +1,186 @@
+"""
+Warm the caches after a deploy or a large import.
+
+``manage.py warm_caches`` requests the pages the first visitors are going to
+hit: home, the product listing, the category tree (API and category pages
+down to a depth) and the most-viewed product pages according to the
+analytics rollups, topped up with bestsellers and featured products. The
+requests run concurrently on a fixed number of worker threads.
+
+Against a running server (``base_url``) this fills the per-process caches
+(suggestion index, catalogue engine snapshot, compiled templates) of the
+workers that answer, as well as the default cache and the database's page
+cache. Without ``base_url`` pages are rendered in this process, through the
+test client: the per-process caches it fills go away with the command, so
+this only helps when the cache backends are shared between processes
+(review first pages, listing results), and the warmer refuses to run
+otherwise.
+"""
+import queue
+import threading
+import time
+from datetime import timedelta
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Sum
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from analytics.models import ProductDailyStats
+
+from .checks import process_local_caches
+from .models import Category, Product
+
+
+USER_AGENT = 'sr-supermarkt-warm-caches'
+
+
+def local_client(user_agent):
+    """A test Client for in-process requests, addressed to a host ALLOWED_HOSTS accepts"""
+    host = next((host for host in settings.ALLOWED_HOSTS if '*' not in host), 'localhost').lstrip('.')
+    # Errors come back as 500 responses to report, not as exceptions
+    return Client(raise_request_exception=False, HTTP_USER_AGENT=user_agent, SERVER_NAME=host)
+
+
+def popular_products(limit, days=7):
+    """Slugs of the most-viewed available products, topped up with bestsellers and featured ones"""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    viewed = list(
+        ProductDailyStats.objects.filter(day__gte=since, product__is_available=True)
+        .values('product__slug').annotate(views=Sum('views')).filter(views__gt=0)
+        .order_by('-views', 'product__slug').values_list('product__slug', flat=True)[:limit]
+    )
+    if len(viewed) < limit:
+        seen = set(viewed)
+        for slug in (
+            Product.objects.filter(is_available=True)
+            .order_by('-is_bestseller', '-is_featured', '-created_at')
+            .values_list('slug', flat=True)[:limit]
+        ):
+            if len(viewed) == limit:
+                break
+            if slug not in seen:
+                viewed.append(slug)
+    return viewed
+
+
+class CacheWarmer:
+    def __init__(self, base_url=None, concurrency=4, products=200, depth=2, days=7, timeout=30.0):
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.concurrency = concurrency
+        self.products = products
+        self.depth = depth
+        self.days = days
+        self.timeout = timeout
+        self.local = threading.local()
+        self.results = []
+        self.totals = {}
+        self.elapsed = 0.0
+
+    def targets(self):
+        """``(kind, path)`` for every page to request"""
+        pages = [
+            ('home', reverse('store:home')),
+            ('product_list', reverse('store:product_list')),
+            ('api', reverse('store:api_category_tree')),
+            ('api', reverse('store:api_category_list')),
+            ('api', reverse('store:api_product_list')),
+        ]
+        categories = list(
+            Category.objects.filter(is_active=True, level__lt=self.depth)
+            .order_by('tree_id', 'lft').values_list('slug', flat=True)
+        )
+        pages += [('category', reverse('store:category_products', args=[slug])) for slug in categories]
+        products = popular_products(self.products, self.days)
+        pages += [('product_detail', reverse('store:product_detail', args=[slug])) for slug in products]
+
+        self.totals = {
+            'category': Category.objects.filter(is_active=True).count(),
+            'product_detail': Product.objects.filter(is_available=True).count(),
+        }
+        return pages
+
+    def fetch(self, kind, path):
+        started = time.perf_counter()
+        if self.base_url:
+            request = Request(self.base_url + path, headers={'User-Agent': USER_AGENT})
+            try:
+                with urlopen(request, timeout=self.timeout) as response:
+                    response.read()
+                    status = response.status
+            except HTTPError as e:
+                status = e.code
+            except (URLError, OSError):
+                status = 'error'
+        else:
+            client = getattr(self.local, 'client', None)
+            if client is None:
+                client = self.local.client = local_client(USER_AGENT)
+            status = client.get(path).status_code
+        return kind, path, status, (time.perf_counter() - started) * 1000
+
+    def worker(self, pages, results):
+        try:
+            while True:
+                try:
+                    kind, path = pages.get_nowait()
+                except queue.Empty:
+                    return
+                results.append(self.fetch(kind, path))
+        finally:
+            # In process, each worker thread opened its own database connection
+            connections.close_all()
+
+    def run(self):
+        if self.base_url and urlsplit(self.base_url).scheme not in ('http', 'https'):
+            raise ValueError(f'{self.base_url} is not an http(s) URL')
+        local = process_local_caches()
+        if not self.base_url and local:
+            raise ValueError(
+                f'The {", ".join(map(repr, local))} cache is private to this process, '
+                f'so warming in process would warm nothing; pass the URL of a running server'
+            )
+        pages = queue.Queue()
+        for page in self.targets():
+            pages.put(page)
+
+        results = []
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=self.worker, args=(pages, results), daemon=True)
+            for _ in range(max(1, self.concurrency))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - started
+        self.results = results
+        return results
+
+    def summary(self):
+        """Per kind: requests, failures, total and slowest milliseconds"""
+        rows = {}
+        for kind, path, status, elapsed_ms in self.results:
+            row = rows.setdefault(kind, {'requests': 0, 'failed': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            row['requests'] += 1
+            row['failed'] += status == 'error' or status >= 400
+            row['total_ms'] += elapsed_ms
+            row['max_ms'] = max(row['max_ms'], elapsed_ms)
+        return rows
+
+    def coverage(self):
+        """``{kind: (pages served without error, all such pages)}`` for categories and products"""
+        failed = {path for path, _ in self.failures()}
+        return {
+            kind: (sum(1 for result in self.results if result[0] == kind and result[1] not in failed), total)
+            for kind, total in self.totals.items()
+        }
+
+    def failures(self):
+        return [(path, status) for _, path, status, _ in self.results if status == 'error' or status >= 400]